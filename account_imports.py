@@ -0,0 +1,180 @@
+import csv
+import io
+import os
+import threading
+
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+
+from .db_connection import copy_available, get_connection
+from .pagination import QueryError
+from .passwords import hash_passwords, is_hashed, is_well_formed_hash
+
+# ------------------------------ #
+# Bulk Account Import            #
+# ------------------------------ #
+# /import-teachers and /import-admins take a CSV or XLSX sheet with `name`
+# and `password` columns. Passwords are hashed in parallel before a
+# connection is taken, then all rows are COPY'd into a temporary staging
+# table and merged with one INSERT ... ON CONFLICT. Under gevent
+# (SERVE_MODE=async) COPY is unavailable and the staging rows go in with
+# multi-row INSERTs instead. Names that already have a login are left alone
+# (and reported as rejected) unless the caller asks to reset their
+# passwords; their passwords are not hashed at all.
+# Password-less teachers (known only from reports, or deleted) get a login.
+
+# scrypt at the default cost is ~30ms per password per core, so keep an
+# import well inside GUNICORN_TIMEOUT on a small instance
+ACCOUNT_IMPORT_MAX_ROWS = int(os.getenv("ACCOUNT_IMPORT_MAX_ROWS", 2000))
+NAME_MAX = 255
+
+IMPORT_FORMATS = ("csv", "xlsx")
+
+CREATED, UPDATED, REJECTED = "created", "updated", "rejected"
+
+# One import at a time per worker process; hashing already uses every core
+_import_lock = threading.Lock()
+
+
+class ImportBusy(Exception):
+    """ Another import is running in this process """
+
+
+def _sheet_rows(file, fmt):
+    if fmt == "csv":
+        yield from csv.reader(io.TextIOWrapper(file, encoding="utf-8-sig", newline=""))
+        return
+    # Imported here so workers only load openpyxl when a sheet is uploaded
+    from openpyxl import load_workbook
+    try:
+        workbook = load_workbook(file, read_only=True, data_only=True)
+    except Exception:
+        raise QueryError("Not a valid XLSX file")
+    try:
+        for row in workbook.worksheets[0].iter_rows(values_only=True):
+            yield ["" if value is None else str(value) for value in row]
+    finally:
+        workbook.close()
+
+
+def read_account_rows(file, filename):
+    """
+    Parse an uploaded sheet into (rows, rejected). Each row is a dict with
+    the sheet `line`, `name` and `password`; rejected entries carry a
+    `message` instead of the password. Raises QueryError for an unusable file.
+    """
+    fmt = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+    if fmt not in IMPORT_FORMATS:
+        raise QueryError("File must be .csv or .xlsx")
+
+    lines = _sheet_rows(file, fmt)
+    try:
+        header = [cell.strip().lower() for cell in next(lines, [])]
+    except UnicodeDecodeError:
+        raise QueryError("CSV must be UTF-8")
+    if "name" not in header or "password" not in header:
+        raise QueryError("First row must name the columns 'name' and 'password'")
+    name_at, password_at = header.index("name"), header.index("password")
+
+    rows, rejected, seen = [], [], set()
+    try:
+        for line, cells in enumerate(lines, start=2):
+            name = cells[name_at].strip() if name_at < len(cells) else ""
+            password = cells[password_at] if password_at < len(cells) else ""
+            if not name and not password.strip():
+                continue   # blank line
+            message = None
+            if not name or not password:
+                message = "Missing name or password"
+            elif len(name) > NAME_MAX:
+                message = f"Name longer than {NAME_MAX} characters"
+            elif is_hashed(password) and not is_well_formed_hash(password):
+                message = "Malformed password hash"
+            elif name in seen:
+                message = "Duplicate name in file"
+            if message:
+                rejected.append({"line": line, "name": name, "status": REJECTED, "message": message})
+                continue
+            seen.add(name)
+            rows.append({"line": line, "name": name, "password": password})
+            if len(rows) > ACCOUNT_IMPORT_MAX_ROWS:
+                raise QueryError(f"At most {ACCOUNT_IMPORT_MAX_ROWS} accounts per import")
+    except UnicodeDecodeError:
+        raise QueryError("CSV must be UTF-8")
+    return rows, rejected
+
+
+def _existing_logins(table, names):
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute(sql.SQL("SELECT name FROM {} WHERE name = ANY(%s) AND password IS NOT NULL").format(
+            sql.Identifier(table)), (names,))
+        return {row[0] for row in cur.fetchall()}
+
+
+def _copy_staging(cur, rows):
+    cur.execute("""
+        CREATE TEMP TABLE account_import (
+            line INTEGER NOT NULL,
+            name VARCHAR(255) NOT NULL,
+            password VARCHAR(255) NOT NULL
+        ) ON COMMIT DROP
+    """)
+    if not copy_available():
+        execute_values(cur, "INSERT INTO account_import (line, name, password) VALUES %s",
+                       [(row["line"], row["name"], row["password"]) for row in rows], page_size=1000)
+        return
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow((row["line"], row["name"], row["password"]))
+    buffer.seek(0)
+    cur.copy_expert("COPY account_import (line, name, password) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+def import_accounts(table, rows, update_existing=False):
+    """
+    Create or update accounts in `table` from read_account_rows rows.
+    Returns one {line, name, status[, message]} per row in sheet order.
+    Raises ImportBusy when another import runs in this process.
+    """
+    if not _import_lock.acquire(blocking=False):
+        raise ImportBusy()
+    try:
+        results = {}
+        if not update_existing and rows:
+            existing = _existing_logins(table, [row["name"] for row in rows])
+            for row in rows:
+                if row["name"] in existing:
+                    results[row["line"]] = {"line": row["line"], "name": row["name"], "status": REJECTED,
+                                            "message": "Account already exists"}
+            rows = [row for row in rows if row["name"] not in existing]
+
+        # No connection is held while the KDF runs
+        for row, password_hash in zip(rows, hash_passwords([row["password"] for row in rows])):
+            row["password"] = password_hash
+
+        if rows:
+            # Only accounts without a login are taken over, unless resetting
+            condition = sql.SQL("") if update_existing else sql.SQL(" WHERE {}.password IS NULL").format(
+                sql.Identifier(table))
+            with get_connection() as conn, conn.cursor() as cur:
+                _copy_staging(cur, rows)
+                cur.execute(sql.SQL("""
+                    INSERT INTO {table} (name, password)
+                    SELECT name, password FROM account_import ORDER BY line
+                    ON CONFLICT (name) DO UPDATE SET password = EXCLUDED.password{condition}
+                    RETURNING name, xmax = 0  -- true for inserted rows, false for updated ones
+                """).format(table=sql.Identifier(table), condition=condition))
+                merged = dict(cur.fetchall())
+                conn.commit()
+            for row in rows:
+                created = merged.get(row["name"])
+                if created is None:
+                    # Got a login between the pre-check and the merge
+                    result = {"status": REJECTED, "message": "Account already exists"}
+                else:
+                    result = {"status": CREATED if created else UPDATED}
+                results[row["line"]] = {"line": row["line"], "name": row["name"], **result}
+        return [results[line] for line in sorted(results)]
+    finally:
+        _import_lock.release()
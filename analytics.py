@@ -0,0 +1,404 @@
+import datetime
+import io
+import os
+import threading
+import time
+import uuid
+
+from .cache import get_cache
+from .changes import CHANGES_MAX_PAGE_SIZE, cursor_expired, decode_change_cursor, fetch_changes, head_cursor
+from .conditional import table_version
+from .db_connection import copy_available, get_connection
+from .pagination import QueryError, parse_date_bound, parse_limit
+from .summary import SUMMARY_PERIODS
+
+# ------------------------------ #
+# Report Analytics               #
+# ------------------------------ #
+# /analytics/<view> is computed with pandas over an in-memory columnar
+# snapshot of `reports` (one row per report: id, created_at, hostel_name,
+# teacher_name and whether it lists maintenance or complaints), not by
+# querying Postgres per request. The snapshot is built once from a single
+# COPY (under gevent, where psycopg2 cannot COPY, from a server-side cursor
+# read in batches) and then brought up to date from the change feed
+# (changes.py): the feed cursor is its high-water mark, so inserts, edits,
+# deletions and archived partitions all reach it, and a refresh only reads
+# what changed.
+#
+# Each worker keeps its own copy and refreshes it when `reports` gets a new
+# version or ANALYTICS_REFRESH_SECONDS have passed. It is also written to
+# ANALYTICS_SNAPSHOT_PATH as Parquet (cursor in the file metadata), so a
+# restarted worker catches up from there instead of re-reading every
+# report. Results are memoized per view and parameters against the
+# snapshot version. pandas and pyarrow are only imported on first use.
+
+ANALYTICS_SNAPSHOT_PATH = os.getenv("ANALYTICS_SNAPSHOT_PATH", "analytics_cache/reports.parquet")
+ANALYTICS_REFRESH_SECONDS = float(os.getenv("ANALYTICS_REFRESH_SECONDS", 30))
+ANALYTICS_PERSIST_SECONDS = float(os.getenv("ANALYTICS_PERSIST_SECONDS", 300))
+ANALYTICS_COVERAGE_DAYS = 30
+ANALYTICS_HOTSPOTS = 10
+ANALYTICS_MAX_HOTSPOTS = 100
+
+CURSOR_METADATA_KEY = b"report_changes_cursor"
+
+SNAPSHOT_SELECT = """
+    SELECT id, created_at AT TIME ZONE 'UTC', hostel_name, teacher_name,
+        NULLIF(btrim(maintenance_required), '') IS NOT NULL,
+        NULLIF(btrim(complaints), '') IS NOT NULL
+    FROM report_rows
+"""
+SNAPSHOT_QUERY = f"COPY ({SNAPSHOT_SELECT}) TO STDOUT WITH (FORMAT csv)"
+# Rows per fetch when COPY is unavailable (SERVE_MODE=async)
+SNAPSHOT_BATCH_SIZE = int(os.getenv("ANALYTICS_SNAPSHOT_BATCH_SIZE", 20000))
+SNAPSHOT_COLUMNS = ("id", "created_at", "hostel_name", "teacher_name", "maintenance", "complaint")
+NAME_COLUMNS = ("hostel_name", "teacher_name")
+
+# pandas period aliases for the /reports/summary periods; weeks start on Monday
+PERIOD_FREQUENCIES = {"day": "D", "week": "W-SUN", "month": "M", "year": "Y"}
+
+analytics_cache = get_cache("analytics", maxsize=256, ttl=300)
+
+
+# ------------------------------ #
+# Snapshot                       #
+# ------------------------------ #
+def _typed(frame):
+    """ Snapshot dtypes: names as categoricals, created_at as naive UTC """
+    import pandas as pd
+
+    frame = frame.astype({"id": "int64", "maintenance": "bool", "complaint": "bool"})
+    frame["created_at"] = pd.to_datetime(frame["created_at"], utc=True).dt.tz_convert(None)
+    for column in NAME_COLUMNS:
+        frame[column] = frame[column].astype("category")
+    return frame
+
+
+def _fetch_snapshot_rows(conn):
+    """ SNAPSHOT_SELECT through a server-side cursor, SNAPSHOT_BATCH_SIZE rows at a time into Arrow """
+    import pyarrow as pa
+
+    schema = pa.schema([("id", pa.int64()), ("created_at", pa.timestamp("us")), ("hostel_name", pa.string()),
+                        ("teacher_name", pa.string()), ("maintenance", pa.bool_()), ("complaint", pa.bool_())])
+    batches = []
+    with conn.cursor(name=f"analytics_{uuid.uuid4().hex}") as cur:
+        cur.itersize = SNAPSHOT_BATCH_SIZE
+        cur.execute(SNAPSHOT_SELECT)
+        while True:
+            rows = cur.fetchmany(SNAPSHOT_BATCH_SIZE)
+            if not rows:
+                break
+            batches.append(pa.record_batch([list(column) for column in zip(*rows)], schema=schema))
+    return pa.Table.from_batches(batches, schema=schema).to_pandas()
+
+
+def _has_text(value):
+    return bool(value and value.strip())
+
+
+def _changed_rows(reports):
+    """ Snapshot rows for the reports carried by change feed entries """
+    import pandas as pd
+
+    return _typed(pd.DataFrame({
+        "id": [r["id"] for r in reports],
+        "created_at": [r["created_at"] for r in reports],
+        "hostel_name": [r["hostel_name"] for r in reports],
+        "teacher_name": [r["teacher_name"] for r in reports],
+        "maintenance": [_has_text(r["maintenance_required"]) for r in reports],
+        "complaint": [_has_text(r["complaints"]) for r in reports],
+    }, columns=SNAPSHOT_COLUMNS))
+
+
+class ReportSnapshot:
+    """
+    The snapshot of one worker process. `current()` returns (version, frame),
+    refreshing first when it may be out of date; one thread refreshes while
+    the others keep answering from the previous frame.
+    """
+
+    def __init__(self, path=ANALYTICS_SNAPSHOT_PATH):
+        self.path = path
+        self.frame = None
+        self.cursor = None
+        self.version = 0
+        self._table_version = None
+        self._checked_at = 0.0
+        self._persisted_at = 0.0
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _stale(self):
+        return (self.frame is None or self._table_version != table_version("reports")
+                or time.monotonic() - self._checked_at > ANALYTICS_REFRESH_SECONDS)
+
+    def current(self):
+        if self._pid != os.getpid():
+            # A lock held by another thread at fork time would never be released here
+            self._lock = threading.Lock()
+            self._pid = os.getpid()
+        if self._stale():
+            # Nobody waits for a refresh unless there is nothing to answer from
+            if self._lock.acquire(blocking=self.frame is None):
+                try:
+                    if self._stale():
+                        self.refresh()
+                finally:
+                    self._lock.release()
+        return self.version, self.frame
+
+    def refresh(self):
+        # Read before refreshing, so a write that lands meanwhile triggers another
+        seen_version = table_version("reports")
+        if self.frame is None:
+            self._load()
+        with get_connection() as conn, conn.cursor() as cur:
+            if self.frame is None or cursor_expired(cur, decode_change_cursor(self.cursor)):
+                conn.rollback()
+                self._build(conn)
+            else:
+                self._catch_up(conn)
+            conn.commit()
+        self._table_version = seen_version
+        self._checked_at = time.monotonic()
+        if time.monotonic() - self._persisted_at > ANALYTICS_PERSIST_SECONDS:
+            self._persist()
+
+    def _build(self, conn):
+        """ Every report, read in one snapshot together with the feed position it is current to """
+        import pandas as pd
+
+        started = time.perf_counter()
+        with conn.cursor() as cur:
+            cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+            # Changes committed before this snapshot are in the COPY; any
+            # after the cursor are replayed later, which is harmless
+            cursor = head_cursor(cur)
+            if not copy_available():
+                frame = _fetch_snapshot_rows(conn)
+            else:
+                buffer = io.BytesIO()
+                cur.copy_expert(SNAPSHOT_QUERY, buffer)
+                buffer.seek(0)
+                if not buffer.getbuffer().nbytes:
+                    frame = pd.DataFrame(columns=SNAPSHOT_COLUMNS)
+                else:
+                    frame = pd.read_csv(buffer, names=list(SNAPSHOT_COLUMNS), true_values=["t"], false_values=["f"],
+                                        dtype={"hostel_name": "str", "teacher_name": "str"}, keep_default_na=False)
+        self._advance(_typed(frame), cursor)
+        self._persisted_at = 0.0   # write the new base out straight away
+        print(f"Analytics snapshot built from {len(frame)} reports in {time.perf_counter() - started:.1f}s")
+
+    def _catch_up(self, conn):
+        import pandas as pd
+
+        changes, cursor, has_more = [], self.cursor, True
+        while has_more:
+            page, cursor, has_more = fetch_changes(conn, cursor, CHANGES_MAX_PAGE_SIZE)
+            changes.extend(page)
+        if not changes:
+            return
+        # Later entries for a report supersede earlier ones
+        latest = {change["id"]: change for change in changes}
+        frame = self.frame[~self.frame["id"].isin(list(latest))]
+        reports = [change["report"] for change in latest.values() if change["report"] is not None]
+        if reports:
+            frame = pd.concat([frame, _changed_rows(reports)], ignore_index=True)
+            for column in NAME_COLUMNS:
+                # concat leaves object columns when the categories differ
+                if frame[column].dtype != "category":
+                    frame[column] = frame[column].astype("category")
+        self._advance(frame, cursor)
+
+    def _advance(self, frame, cursor):
+        self.frame, self.cursor = frame, cursor
+        self.version += 1
+
+    def _load(self):
+        """ Pick up the snapshot another worker (or an earlier run) wrote """
+        import pyarrow.parquet as pq
+
+        try:
+            table = pq.read_table(self.path)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print(f"WARNING: Ignoring unreadable analytics snapshot {self.path}: {e}")
+            return
+        cursor = (table.schema.metadata or {}).get(CURSOR_METADATA_KEY)
+        if cursor is None:
+            return
+        self._advance(table.to_pandas(), cursor.decode())
+        self._persisted_at = time.monotonic()
+
+    def _persist(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.Table.from_pandas(self.frame, preserve_index=False)
+        table = table.replace_schema_metadata({**table.schema.metadata, CURSOR_METADATA_KEY: self.cursor.encode()})
+        directory = os.path.dirname(self.path) or "."
+        tmp = os.path.join(directory, f".{uuid.uuid4().hex}.tmp")
+        try:
+            os.makedirs(directory, exist_ok=True)
+            pq.write_table(table, tmp)
+            # Workers replace the file whole; a reader sees one or the other
+            os.replace(tmp, self.path)
+            self._persisted_at = time.monotonic()
+        except OSError as e:
+            print(f"WARNING: Could not write analytics snapshot {self.path}: {e}")
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+
+snapshot = ReportSnapshot()
+
+
+# ------------------------------ #
+# Views                          #
+# ------------------------------ #
+def _utc_naive(value):
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _parse_period(args):
+    period = args.get("period", "week")
+    if period not in SUMMARY_PERIODS:
+        raise QueryError("period must be one of: " + ", ".join(SUMMARY_PERIODS))
+    return period
+
+
+def _parse_days(value, default):
+    if value in (None, ""):
+        return default
+    try:
+        days = int(value)
+    except ValueError:
+        raise QueryError("days must be an integer")
+    if days < 0:
+        raise QueryError("days must not be negative")
+    return days
+
+
+def _select(frame, params):
+    """ Rows in the params' date range and for the requested hostel/teacher """
+    mask = None
+    for column in NAME_COLUMNS:
+        if params.get(column):
+            mask = _and(mask, frame[column] == params[column])
+    if params.get("from"):
+        mask = _and(mask, frame["created_at"] >= params["from"])
+    if params.get("to"):
+        mask = _and(mask, frame["created_at"] < params["to"])
+    return frame if mask is None else frame[mask]
+
+
+def _and(mask, condition):
+    return condition if mask is None else mask & condition
+
+
+def _period_start(created_at, period):
+    return created_at.dt.to_period(PERIOD_FREQUENCIES[period]).dt.start_time
+
+
+def _records(frame):
+    """ JSON-ready rows; timestamps become ISO dates """
+    frame = frame.copy()
+    for column in frame.columns:
+        if str(frame[column].dtype).startswith("datetime64"):
+            frame[column] = frame[column].dt.strftime("%Y-%m-%d")
+    return frame.to_dict("records")
+
+
+def visit_frequency(frame, params):
+    """ Visits per hostel and period """
+    rows = _select(frame, params)
+    counts = (rows.groupby([rows["hostel_name"], _period_start(rows["created_at"], params["period"]).rename("period_start")],
+                           observed=True).size().rename("visits").reset_index())
+    counts = counts.sort_values(["period_start", "hostel_name"], ascending=[False, True])
+    return _records(counts)
+
+
+def coverage_gaps(frame, params):
+    """ Hostels whose last visit is at least `days` days old """
+    rows = _select(frame, {**params, "from": None, "to": None})
+    last = rows.groupby("hostel_name", observed=True)["created_at"].max().rename("last_visit").reset_index()
+    last["days_since_visit"] = (params["now"] - last["last_visit"]).dt.days
+    gaps = last[last["days_since_visit"] >= params["days"]].sort_values(
+        ["days_since_visit", "hostel_name"], ascending=[False, True])
+    return _records(gaps)
+
+
+def teacher_activity(frame, params):
+    """ Visits, distinct hostels and active days per teacher """
+    rows = _select(frame, params)
+    activity = rows.assign(day=rows["created_at"].dt.normalize()).groupby("teacher_name", observed=True).agg(
+        visits=("id", "size"),
+        hostels=("hostel_name", "nunique"),
+        active_days=("day", "nunique"),
+        last_visit=("created_at", "max"),
+    ).reset_index()
+    activity = activity.sort_values(["visits", "teacher_name"], ascending=[False, True])
+    return _records(activity)
+
+
+def hotspots(frame, params):
+    """ The hostels with the most maintenance requests and complaints, with their trend per period """
+    rows = _select(frame, params)
+    issues = rows["maintenance"].astype("int64") + rows["complaint"].astype("int64")
+    top = issues.groupby(rows["hostel_name"], observed=True).sum()
+    top = top[top > 0].sort_values(ascending=False, kind="stable").head(params["limit"])
+    rows = rows[rows["hostel_name"].isin(top.index)]
+    trend = rows.groupby([rows["hostel_name"], _period_start(rows["created_at"], params["period"]).rename("period_start")],
+                         observed=True).agg(
+        reports=("id", "size"),
+        with_maintenance=("maintenance", "sum"),
+        with_complaints=("complaint", "sum"),
+    ).reset_index().sort_values("period_start")
+    series = {name: [] for name in top.index}
+    for row in _records(trend):
+        series[row.pop("hostel_name")].append(row)
+    return [{
+        "hostel_name": name,
+        "reports": sum(p["reports"] for p in points),
+        "with_maintenance": sum(p["with_maintenance"] for p in points),
+        "with_complaints": sum(p["with_complaints"] for p in points),
+        "trend": points,
+    } for name, points in series.items()]
+
+
+VIEWS = {
+    "visits": visit_frequency,
+    "coverage": coverage_gaps,
+    "teachers": teacher_activity,
+    "hotspots": hotspots,
+}
+
+
+def parse_analytics_params(view, args):
+    """ Normalised parameters for `view`; also the memoization key. Raises QueryError. """
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    params = {
+        "hostel_name": args.get("hostel_name") or None,
+        "teacher_name": args.get("teacher_name") or None,
+        "from": _utc_naive(parse_date_bound(args.get("from"), "from")),
+        "to": _utc_naive(parse_date_bound(args.get("to"), "to", end=True)),
+    }
+    if view in ("visits", "hotspots"):
+        params["period"] = _parse_period(args)
+    if view == "coverage":
+        params["days"] = _parse_days(args.get("days"), ANALYTICS_COVERAGE_DAYS)
+        # Day resolution is all the result has, so it stays memoizable for the day
+        params["now"] = now.replace(hour=0, minute=0, second=0, microsecond=0) + datetime.timedelta(days=1)
+    if view == "hotspots":
+        params["limit"] = parse_limit(args.get("limit"), ANALYTICS_HOTSPOTS, ANALYTICS_MAX_HOTSPOTS)
+    return params
+
+
+def run_analytics(view, args):
+    """ Result rows of `view` for the request `args` """
+    params = parse_analytics_params(view, args)
+    version, frame = snapshot.current()
+    key = (version, view, tuple(sorted(params.items())))
+    return analytics_cache.get_or_load(key, lambda: VIEWS[view](frame, params))
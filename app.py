@@ -1,70 +1,39 @@
 import os
-import datetime
-import os
-from io import BytesIO
+import json
+import math
+import time
 
-import jwt
-import pandas as pd
 import psycopg2
-from flask import Flask, Response, jsonify, request
-from urllib.parse import urlparse
+from flask import Flask, Response, g, jsonify, request, send_file
 from flask_cors import CORS
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseUpload
+from psycopg2 import sql
 from psycopg2.extras import RealDictCursor
-
-# ------------------------------ #
-# Google Drive API Configuration #
-# ------------------------------ #
-SCOPES = ['https://www.googleapis.com/auth/drive']
-SERVICE_ACCOUNT_FILE = os.getenv("GOOGLE_CREDENTIALS", "hostelmanagement-455018-5e40c6a6113c.json")
-UPLOAD_FOLDER_ID = os.getenv("UPLOAD_FOLDER_ID", "1-bPtMwp6rPE3D2yqmk5qnq8Ytvl_O07A")
-
-creds = None
-drive_service = None
-
-try:
-    # Support loading Google service account credentials from an environment variable
-    # (recommended for hosted environments like Render). If `GOOGLE_DRIVE_CREDENTIALS_JSON`
-    # is set, it should contain the full JSON contents of the service account file.
-    ga_json = os.getenv("GOOGLE_DRIVE_CREDENTIALS_JSON")
-    if ga_json:
-        import json
-        ga_json_str = ga_json.strip()
-        # If the env var contains JSON text, parse it. If it contains a filename
-        # (for example someone placed the filename, possibly wrapped in braces
-        # like "{hostelmanagement-...json}"), load from that file. Otherwise
-        # raise a helpful error.
-        if ga_json_str.startswith("{") and '"' in ga_json_str:
-            # Likely actual JSON (contains double quotes)
-            try:
-                info = json.loads(ga_json_str)
-                creds = service_account.Credentials.from_service_account_info(info, scopes=SCOPES)
-            except Exception as e:
-                raise RuntimeError("Failed to parse GOOGLE_DRIVE_CREDENTIALS_JSON: {}".format(e))
-        else:
-            # Treat value as a filename (strip surrounding braces or quotes if present)
-            candidate = ga_json_str.strip().strip('{}').strip('"').strip("'")
-            if os.path.isfile(candidate):
-                creds = service_account.Credentials.from_service_account_file(candidate, scopes=SCOPES)
-            else:
-                raise RuntimeError(
-                    "GOOGLE_DRIVE_CREDENTIALS_JSON is set but is not valid JSON nor a path to a file: '{}'".format(ga_json_str)
-                )
-    else:
-        # Fall back to loading from a file path (useful for local development only)
-        creds_path = SERVICE_ACCOUNT_FILE
-        creds = service_account.Credentials.from_service_account_file(creds_path, scopes=SCOPES)
-
-    if creds:
-        drive_service = build('drive', 'v3', credentials=creds)
-    else:
-        print("WARNING: Google Drive credentials could not be loaded.")
-
-except Exception as e:
-    print(f"WARNING: Failed to initialize Google Drive service due to credential error: {e}")
-    drive_service = None
+from werkzeug.middleware.proxy_fix import ProxyFix
+from werkzeug.wsgi import wrap_file
+
+from .account_imports import CREATED, REJECTED, UPDATED, ImportBusy, import_accounts, read_account_rows
+from .analytics import VIEWS as ANALYTICS_VIEWS, run_analytics
+from .auth_utils import generate_tokens, require_auth, revocations, revoke_token, verify_token
+from .cache import cache_stats, get_cache
+from .changes import (CHANGE_STREAM_ENABLED, CHANGES_MAX_PAGE_SIZE, CHANGES_PAGE_SIZE, cursor_expired,
+                      decode_change_cursor, fetch_changes, head_cursor, stream_changes)
+from .compression import init_compression
+from .conditional import changed_within, conditional, table_version, touch_tables
+from .db_connection import get_connection, get_read_connection, get_replicas, pool_stats, replica_stats
+from .dimensions import resolve_report_names
+from .export_jobs import (JOB_DONE, cached_file, check_download_token, download_token, enqueue_export,
+                          get_job, job_progress)
+from .exports import EXPORT_FORMATS, open_period_export, parse_export_params, stream_export
+from .image_jobs import IMAGE_STATUS_PENDING, enqueue_image_upload, save_pending_upload
+from .metrics import count_login, instrument_app, render_prometheus
+from .pagination import REPORT_COLUMNS, QueryError, build_reports_page_query, paginate, parse_limit
+from .partitions import ensure_partitions_cached
+from .passwords import PasswordPoolBusy, check_password, dummy_hash, hash_password_bounded
+from .ratelimit import login_throttle
+from .search import build_search_query, shape_search_results
+from .storage import IMAGE_KEY_RE, IMAGE_MIMETYPES, IMMUTABLE_MAX_AGE, get_blob_store, get_storage
+from .submissions import BATCH_SUBMIT_MAX, insert_reports, validate_report
+from .summary import build_summary_query, forget_reports, record_reports
 
 # ------------------------------ #
 # Flask Setup                    #
@@ -76,52 +45,181 @@ ALLOWED_ORIGINS = [
     "https://hostel-visit-report-frontend.vercel.app",
     "http://localhost:5173"
 ]
-CORS(app, supports_credentials=True, origins=ALLOWED_ORIGINS)
-SECRET_KEY = os.getenv('FLASK_SECRET_KEY')  # Use a strong key in production
+CORS(app, supports_credentials=True, origins=ALLOWED_ORIGINS, expose_headers=["X-Primary-Until"])
+instrument_app(app)
+init_compression(app)
+# Number of reverse proxies in front of the app (1 on Render). Their
+# X-Forwarded-For entries are trusted for request.remote_addr, which the
+# login throttle keys on; with 0 every client would share the proxy's address.
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", 0))
+if TRUSTED_PROXY_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS)
 
 # ------------------------------ #
 # Database Connection            #
 # ------------------------------ #
-def get_db_connection():
-    conn_str = os.getenv("DATABASE_URL")
-    if not conn_str:
-        # If DATABASE_URL is not set, we cannot connect to the remote database.
-        print("ERROR: DATABASE_URL environment variable is not set.")
-        raise RuntimeError("DATABASE_URL environment variable is not set.")
-    
-    # Fix for Render/psycopg2 compatibility: replace 'postgres://' with 'postgresql://'
-    if conn_str.startswith("postgres://"):
-        conn_str = conn_str.replace("postgres://", "postgresql://", 1)
-        
-    # Note: We avoid printing the full connection string for security, but confirm its presence.
-    parsed_url = urlparse(conn_str)
-    print(f"INFO: Attempting database connection to host: {parsed_url.hostname} on port: {parsed_url.port}")
-    return psycopg2.connect(conn_str)
-
-# ------------------------------ #
-# JWT Token                      #
-# ------------------------------ #
-def generate_token(user_type, username):
-    payload = {
-        "user_type": user_type,
-        "username": username,
-        "exp": datetime.datetime.utcnow() + datetime.timedelta(hours=3)
-    }
-    return jwt.encode(payload, SECRET_KEY, algorithm="HS256")
-
-def verify_token(token):
+# All routes borrow connections from the per-worker pool in db_connection.py
+# (`with get_connection() as conn:`), which hands them back on every path.
+# Read-only routes use read_connection() instead, which goes to a read
+# replica when DATABASE_REPLICA_URLS is set.
+#
+# A replica can be a few seconds behind, so reads stay on the primary for
+# REPLICA_READ_YOUR_WRITES_SECONDS after a write. Per client: every
+# successful write response carries an X-Primary-Until time (also set as
+# a cookie) that the client sends back. Per table: while a table's version
+# is that fresh, a replica that has not caught up would fill the caches
+# and ETags of the new version with old rows.
+REPLICA_READ_YOUR_WRITES_SECONDS = float(os.getenv("REPLICA_READ_YOUR_WRITES_SECONDS", 10))
+WRITE_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+
+
+def _client_wrote_recently():
+    value = request.headers.get("X-Primary-Until") or request.cookies.get("primary_until")
     try:
-        return jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-    except jwt.ExpiredSignatureError:
-        return None
-    except jwt.InvalidTokenError:
-        return None
+        return float(value) > time.time()
+    except (TypeError, ValueError):
+        return False
+
+
+def reads_from_primary(*tables):
+    """ Whether a read of `tables` in this request must see the latest writes """
+    return get_replicas() is None or _client_wrote_recently() or changed_within(tables, REPLICA_READ_YOUR_WRITES_SECONDS)
+
+
+def read_connection(*tables):
+    """ Connection for read-only queries of `tables`; the primary right after a write """
+    return get_read_connection(reads_from_primary(*tables))
+
+
+def pin_primary():
+    """ Make this client's reads use the primary for a while, as after a write """
+    g.pin_primary = True
+
 
+@app.after_request
+def mark_primary_reads(response):
+    if get_replicas() is None:
+        return response
+    if g.get("pin_primary") or (request.method in WRITE_METHODS and response.status_code < 400):
+        until = f"{time.time() + REPLICA_READ_YOUR_WRITES_SECONDS:.3f}"
+        response.headers["X-Primary-Until"] = until
+        response.set_cookie("primary_until", until, max_age=int(REPLICA_READ_YOUR_WRITES_SECONDS) + 1,
+                            httponly=True, secure=request.is_secure, samesite="None" if request.is_secure else "Lax")
+    return response
+
+# ------------------------------ #
+# Caches                         #
+# ------------------------------ #
+# Entries are keyed by the table's version in `table_versions`, which
+# @conditional has already read for the request, so a write from any
+# worker or process makes the next request reload the list instead of
+# serving the old one under the new ETag. invalidate() only frees memory.
+teachers_cache = get_cache("teachers", maxsize=1, ttl=300)
+admins_cache = get_cache("admins", maxsize=1, ttl=300)
+
+
+def versioned(cache, table, loader):
+    """ loader() cached for the current version of `table`; uncached when that cannot be read """
+    version = table_version(table)
+    if version is None:
+        return loader()
+    return cache.get_or_load(version, loader)
 
 # main route
 @app.route('/')
 def index():
     return "Hostel Management Backend is running."
+
+# ------------------------------ #
+# Health Check                   #
+# ------------------------------ #
+@app.route('/health', methods=['GET'])
+def health():
+    try:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        db_ok = True
+    except Exception as e:
+        print(f"Health check database error: {e}")
+        db_ok = False
+    status = 200 if db_ok else 503
+    return jsonify({
+        "status": "ok" if db_ok else "degraded",
+        "database": db_ok,
+        "pool": pool_stats(),
+        "replicas": replica_stats(),
+        "caches": cache_stats(),
+        "login_throttle": login_throttle.stats(),
+        "revoked_tokens": revocations.stats(),
+    }), status
+
+# ------------------------------ #
+# Metrics                        #
+# ------------------------------ #
+POOL_COUNTER_KEYS = ("checkouts", "checkout_wait_total_seconds", "timeouts", "recycled", "broken")
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # Live values of this worker; running totals are exported as counters
+    pid = (("pid", os.getpid()),)
+    gauges, counters = [], []
+    for key, value in (pool_stats() or {}).items():
+        if key in POOL_COUNTER_KEYS:
+            counters.append((f"db_pool_{key.replace('_total', '')}_total", pid, value))
+        else:
+            gauges.append((f"db_pool_{key}", pid, value))
+    for index, replica in enumerate((replica_stats() or {}).get("replicas", ())):
+        labels = (("replica", index),) + pid
+        gauges.append(("db_replica_healthy", labels, int(replica["healthy"])))
+        counters.append(("db_replica_reads_total", labels, replica["reads"]))
+        if replica["lag_seconds"] is not None:
+            gauges.append(("db_replica_lag_seconds", labels, replica["lag_seconds"]))
+    for name, stats in cache_stats().items():
+        labels = (("cache", name),) + pid
+        gauges.append(("cache_size", labels, stats["size"]))
+        counters.append(("cache_hits_total", labels, stats["hits"]))
+        counters.append(("cache_misses_total", labels, stats["misses"]))
+    return Response(render_prometheus(gauges, counters), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+# ------------------------------ #
+# Login Helpers                  #
+# ------------------------------ #
+# Both logins go through the throttle (ratelimit.py) before touching the
+# database, then verify the password in the bounded hashing pool
+# (passwords.py). No DB connection is held while the KDF runs.
+def _check_credentials(table, name, password):
+    """ True when `password` matches; upgrades plaintext or outdated hashes in place """
+    query = sql.SQL("SELECT id, password FROM {} WHERE name = %s AND password IS NOT NULL").format(sql.Identifier(table))
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute(query, (name,))
+        row = cur.fetchone()
+
+    # Unknown names are checked against a dummy hash so they take as long as known ones
+    ok, new_hash = check_password(password, row[1] if row else dummy_hash())
+    if not (ok and row):
+        return False
+    if new_hash:
+        update = sql.SQL("UPDATE {} SET password = %s WHERE id = %s AND password = %s").format(sql.Identifier(table))
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(update, (new_hash, row[0], row[1]))
+            conn.commit()
+    return True
+
+
+def _login_throttled(kind, wait):
+    count_login(kind, "throttled")
+    response = jsonify({"success": False, "message": "Too many login attempts, try again later"})
+    response.headers["Retry-After"] = str(math.ceil(wait))
+    return response, 429
+
+
+def _login_busy(kind):
+    count_login(kind, "busy")
+    response = jsonify({"success": False, "message": "Login is busy, try again shortly"})
+    response.headers["Retry-After"] = "1"
+    return response, 503
+
 # ------------------------------ #
 # Teacher Login                  #
 # ------------------------------ #
@@ -138,24 +236,28 @@ def teacher_login():
     if not teacher_id or not password:
         return jsonify({"success": False, "message": "Missing credentials"}), 400
 
+    wait = login_throttle.check("teacher", teacher_id, request.remote_addr)
+    if wait:
+        return _login_throttled("teacher", wait)
+
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT name FROM teachers WHERE name = %s AND password = %s", (teacher_id, password))
-        user = cur.fetchone()
-        cur.close()
-        conn.close()
-
-        if user:
-            token = generate_token("teacher", teacher_id)
-            return jsonify({"success": True, "message": "Login successful", "token": token})
-
-        return jsonify({"success": False, "message": "Invalid credentials"}), 401
+        user = _check_credentials("teachers", teacher_id, password)
+    except PasswordPoolBusy:
+        return _login_busy("teacher")
     except Exception as e:
         # Log the error for debugging on the server side
         print(f"Teacher login database error: {e}")
         return jsonify({"success": False, "message": "Internal server error"}), 500
 
+    if user:
+        login_throttle.succeeded("teacher", teacher_id)
+        count_login("teacher", "success")
+        return jsonify({"success": True, "message": "Login successful", **generate_tokens("teacher", teacher_id)})
+
+    login_throttle.failed("teacher", teacher_id)
+    count_login("teacher", "failure")
+    return jsonify({"success": False, "message": "Invalid credentials"}), 401
+
 # ------------------------------ #
 # Admin Login                    #
 # ------------------------------ #
@@ -172,66 +274,237 @@ def admin_login():
     if not admin_id or not password:
         return jsonify({"success": False, "message": "Missing credentials"}), 400
 
+    wait = login_throttle.check("admin", admin_id, request.remote_addr)
+    if wait:
+        return _login_throttled("admin", wait)
+
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT name FROM admins WHERE name = %s AND password = %s", (admin_id, password))
-        user = cur.fetchone()
-        cur.close()
-        conn.close()
-
-        # Special Admin
-        if user:
-            user_type = "Paul" if admin_id == "Paul" and password == "1234" else "admin" 
-            token = generate_token(user_type, admin_id)
-            return jsonify({"success": True, "message": "Login successful", "token": token})
-
-        return jsonify({"success": False, "message": "Invalid credentials"}), 401
+        user = _check_credentials("admins", admin_id, password)
+    except PasswordPoolBusy:
+        return _login_busy("admin")
     except Exception as e:
         # Log the error for debugging on the server side
         print(f"Admin login database error: {e}")
         return jsonify({"success": False, "message": "Internal server error"}), 500
 
+    # Special Admin
+    if user:
+        login_throttle.succeeded("admin", admin_id)
+        count_login("admin", "success")
+        user_type = "Paul" if admin_id == "Paul" and password == "1234" else "admin" 
+        return jsonify({"success": True, "message": "Login successful", **generate_tokens(user_type, admin_id)})
+
+    login_throttle.failed("admin", admin_id)
+    count_login("admin", "failure")
+    return jsonify({"success": False, "message": "Invalid credentials"}), 401
+
+# ------------------------------ #
+# Refresh / Logout               #
+# ------------------------------ #
+# Refresh tokens are single use: each refresh revokes the presented one and
+# returns a new pair. Accounts deleted (retired) since login can no longer refresh.
+REFRESH_ACCOUNT_TABLES = {"teacher": "teachers", "admin": "admins", "Paul": "admins"}
+
+
+@app.route('/refresh-token', methods=['POST'])
+def refresh_token():
+    token = (request.get_json(silent=True) or {}).get("refresh_token")
+    decoded = verify_token(token, "refresh") if isinstance(token, str) else None
+    table = REFRESH_ACCOUNT_TABLES.get(decoded.get("user_type")) if decoded else None
+    if not table:
+        return jsonify({"success": False, "message": "Invalid or expired refresh token"}), 401
+
+    try:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(sql.SQL("SELECT 1 FROM {} WHERE name = %s AND password IS NOT NULL").format(sql.Identifier(table)),
+                        (decoded["username"],))
+            exists = cur.fetchone() is not None
+        if not exists:
+            return jsonify({"success": False, "message": "Account no longer exists"}), 401
+        revoke_token(decoded)
+    except psycopg2.Error as e:
+        print(f"Token refresh database error: {e}")
+        return jsonify({"success": False, "message": "Internal server error"}), 500
+
+    return jsonify({"success": True, **generate_tokens(decoded["user_type"], decoded["username"])})
+
+
+@app.route('/logout', methods=['POST'])
+@require_auth()
+def logout():
+    # Revokes the access token used for this call and, when sent, its refresh token
+    revoke_token(g.user)
+    token = (request.get_json(silent=True) or {}).get("refresh_token")
+    decoded = verify_token(token, "refresh") if isinstance(token, str) else None
+    if decoded and decoded.get("username") == g.user.get("username"):
+        revoke_token(decoded)
+    return jsonify({"success": True, "message": "Logged out"})
+
 # ------------------------------ #
 # Get Teachers                   #
 # ------------------------------ #
 @app.route('/teachers', methods=['GET'])
+@conditional("teachers")
 def get_teachers():
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    cur.execute("SELECT id, name FROM teachers")
-    teachers = cur.fetchall()
-    cur.close()
-    conn.close()
-    return jsonify(teachers)
+    return jsonify(versioned(teachers_cache, "teachers", _load_teachers))
+
+
+def _load_teachers():
+    with read_connection("teachers") as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+        # Teachers without a password only appear in reports and cannot log in
+        cur.execute("SELECT id, name FROM teachers WHERE password IS NOT NULL")
+        return cur.fetchall()
 
 # ------------------------------ #
 # Get Reports                    #
 # ------------------------------ #
+# Unparameterized GET /forms keeps returning the whole table as a bare list
+# while FORMS_LEGACY_FULL_DUMP is on (the default) so existing frontends keep
+# working. Any paging/filter parameter, or ?legacy=0, switches to the keyset
+# paginated response.
+FORMS_LEGACY_FULL_DUMP = os.getenv("FORMS_LEGACY_FULL_DUMP", "1") == "1"
+FORMS_QUERY_PARAMS = ("limit", "cursor", "hostel_name", "teacher_name", "from", "to", "fields")
+# Explicit columns so internal ones (ids, search_vector) stay private
+LEGACY_FORMS_QUERY = "SELECT {} FROM report_rows".format(", ".join(REPORT_COLUMNS))
+
+
 @app.route('/forms', methods=['GET'])
+@conditional("reports")
 def get_forms():
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    cur.execute("SELECT * FROM reports")
-    forms = cur.fetchall()
-    cur.close()
-    conn.close()
-    return jsonify(forms)
+    legacy = request.args.get("legacy")
+    if legacy == "1" or (
+        legacy is None and FORMS_LEGACY_FULL_DUMP
+        and not any(p in request.args for p in FORMS_QUERY_PARAMS)
+    ):
+        with read_connection("reports") as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(LEGACY_FORMS_QUERY)
+            forms = cur.fetchall()
+        return jsonify(forms)
+
+    try:
+        query, params, limit = build_reports_page_query(request.args)
+    except QueryError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+
+    with read_connection("reports") as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(query, params)
+        rows = cur.fetchall()
+
+    items, next_cursor = paginate(rows, limit)
+    return jsonify({"items": items, "next_cursor": next_cursor, "limit": limit})
+
+# ------------------------------ #
+# Search Reports                 #
+# ------------------------------ #
+@app.route('/reports/search', methods=['GET'])
+@conditional("reports")
+def search_reports():
+    try:
+        query, params, limit = build_search_query(request.args)
+    except QueryError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+
+    with read_connection("reports") as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(query, params)
+        rows = cur.fetchall()
+
+    items, next_cursor = shape_search_results(rows, limit)
+    return jsonify({"items": items, "next_cursor": next_cursor, "limit": limit})
+
+# ------------------------------ #
+# Report Summary                 #
+# ------------------------------ #
+@app.route('/reports/summary', methods=['GET'])
+@conditional("reports")
+def get_reports_summary():
+    try:
+        query, params = build_summary_query(request.args)
+    except QueryError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+
+    with read_connection("reports") as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(query, params)
+        rows = cur.fetchall()
+
+    for row in rows:
+        row["period_start"] = row["period_start"].isoformat()
+    return jsonify({"period": request.args.get("period", "week"), "summary": rows})
+
+# ------------------------------ #
+# Report Analytics               #
+# ------------------------------ #
+@app.route('/analytics/<view>', methods=['GET'])
+def get_analytics(view):
+    # Not @conditional: coverage gaps move with the date as well as with writes
+    if view not in ANALYTICS_VIEWS:
+        return jsonify({"success": False, "message": "Unknown view; expected one of: " + ", ".join(ANALYTICS_VIEWS)}), 404
+    try:
+        items = run_analytics(view, request.args)
+    except QueryError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    return jsonify({"view": view, "items": items})
+
+# ------------------------------ #
+# Report Changes                 #
+# ------------------------------ #
+def _change_cursor_error(cur, since):
+    """ Error response for an unusable ?since= cursor, or None """
+    try:
+        position = decode_change_cursor(since)
+    except QueryError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    if cursor_expired(cur, position):
+        return jsonify({"success": False, "message": "Cursor has expired; reload /forms"}), 410
+    return None
+
+
+@app.route('/reports/changes', methods=['GET'])
+def get_report_changes():
+    # Without ?since= the client gets a starting cursor: load /forms after
+    # this call, then poll with the cursor. Changes that land in between are
+    # reported again, which is harmless as clients upsert by id.
+    since = request.args.get("since")
+    try:
+        limit = parse_limit(request.args.get("limit"), CHANGES_PAGE_SIZE, CHANGES_MAX_PAGE_SIZE)
+    except QueryError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+
+    with get_connection() as conn, conn.cursor() as cur:
+        if not since:
+            # The feed reads the primary; so must the /forms load that follows
+            pin_primary()
+            return jsonify({"changes": [], "cursor": head_cursor(cur), "has_more": False})
+        error = _change_cursor_error(cur, since)
+        if error:
+            return error
+        changes, cursor, has_more = fetch_changes(conn, since, limit)
+    return jsonify({"changes": changes, "cursor": cursor, "has_more": has_more})
+
+
+@app.route('/reports/changes/stream', methods=['GET'])
+def stream_report_changes():
+    # Each open stream holds a request thread, so this is meant for
+    # SERVE_MODE=async; EventSource reconnects when the stream ends
+    if not CHANGE_STREAM_ENABLED:
+        return jsonify({"success": False, "message": "Change stream is disabled"}), 404
+    since = request.headers.get("Last-Event-ID") or request.args.get("since")
+    with get_connection() as conn, conn.cursor() as cur:
+        since = since or head_cursor(cur)
+        error = _change_cursor_error(cur, since)
+    if error:
+        return error
+    return Response(
+        stream_changes(since, app.json.dumps),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 # ------------------------------ #
 # Submit Form                    #
 # ------------------------------ #
 @app.route('/submit-form', methods=['POST'])
+@require_auth("teacher")
 def submit_form():
-    token = request.headers.get("Authorization")
-    if not token or not token.startswith("Bearer "):
-        return jsonify({"success": False, "message": "Missing or invalid token"}), 403
-
-    token = token.split("Bearer ")[1]
-    decoded_token = verify_token(token)
-    if not decoded_token or decoded_token.get("user_type") != "teacher":
-        return jsonify({"success": False, "message": "Unauthorized"}), 403
-
     teacher_name = request.form.get("teacherName")
     subordinate_teacher_name = request.form.get("subordinateTeacherName")
     hostel_name = request.form.get("hostelName")
@@ -242,36 +515,163 @@ def submit_form():
     if not (teacher_name and subordinate_teacher_name and hostel_name):
         return jsonify({"success": False, "message": "Missing form fields"}), 400
 
-    image_url = None
+    # The image is only read here and saved with the report; the Drive upload
+    # happens in the background (image_jobs.py) once the row is committed.
+    image = None
     if 'image' in request.files:
         image_file = request.files['image']
         if image_file:
-            if not drive_service:
+            if not get_storage().available():
                 return jsonify({"success": False, "message": "Image upload failed: Google Drive service not initialized"}), 500
-            try:
-                file_metadata = {'name': image_file.filename, 'parents': [UPLOAD_FOLDER_ID]}
-                media = MediaIoBaseUpload(image_file, mimetype=image_file.mimetype, resumable=True)
-                uploaded_file = drive_service.files().create(body=file_metadata, media_body=media, fields='id').execute()
-                image_url = f"https://drive.google.com/uc?id={uploaded_file.get('id')}"
-            except Exception as e:
-                return jsonify({"success": False, "message": "Image upload failed", "error": str(e)}), 500
-
-    conn = get_db_connection()
+            image = (image_file.read(), image_file.filename, image_file.mimetype)
+    image_status = IMAGE_STATUS_PENDING if image else None
+
     try:
-        with conn.cursor() as cur:
+        ensure_partitions_cached()
+        names = resolve_report_names([{
+            "teacher_name": teacher_name,
+            "subordinate_teacher_name": subordinate_teacher_name,
+            "hostel_name": hostel_name,
+        }])[0]
+        with get_connection() as conn, conn.cursor() as cur:
             cur.execute("""
-                INSERT INTO reports (teacher_name, subordinate_teacher_name, hostel_name, 
-                    general_comments, maintenance_required, complaints, image_url, created_at)
+                INSERT INTO reports (teacher_id, subordinate_teacher_id, hostel_id,
+                    general_comments, maintenance_required, complaints, image_status, created_at)
                 VALUES (%s, %s, %s, %s, %s, %s, %s, NOW())
-            """, (teacher_name, subordinate_teacher_name, hostel_name,
-                  general_comments, maintenance_required, complaints, image_url))
+                RETURNING id, created_at, hostel_id, teacher_id, maintenance_required, complaints
+            """, (names["teacher_id"], names["subordinate_teacher_id"], names["hostel_id"],
+                  general_comments, maintenance_required, complaints, image_status))
+            row = cur.fetchone()
+            record_reports(cur, [row[1:]])
+            if image:
+                save_pending_upload(cur, row[0], *image)
+            conn.commit()
+        touch_tables("reports")
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    report_id = row[0]
+    if image:
+        enqueue_image_upload(report_id, *image)
+
+    return jsonify({
+        "success": True,
+        "message": "Form submitted successfully",
+        "id": report_id,
+        "image_status": image_status,
+    }), 200
+
+# ------------------------------ #
+# Batch Submit                   #
+# ------------------------------ #
+# For visits collected offline: a JSON array of reports (or, as multipart,
+# a `reports` field holding that array plus `image_<index>` files). Every
+# entry is validated on its own, the valid ones are inserted in a single
+# transaction, and each gets a result. Entries carrying an idempotencyKey
+# that was already stored come back as duplicates instead of new rows.
+@app.route('/submit-forms/batch', methods=['POST'])
+@require_auth("teacher")
+def submit_forms_batch():
+    if request.mimetype == "multipart/form-data":
+        try:
+            entries = json.loads(request.form.get("reports", ""))
+        except ValueError:
+            return jsonify({"success": False, "message": "reports must be a JSON array"}), 400
+    else:
+        entries = request.get_json(silent=True)
+    if not isinstance(entries, list) or not entries:
+        return jsonify({"success": False, "message": "Expected a non-empty JSON array of reports"}), 400
+    if len(entries) > BATCH_SUBMIT_MAX:
+        return jsonify({"success": False, "message": f"At most {BATCH_SUBMIT_MAX} reports per batch"}), 400
+
+    results = [None] * len(entries)
+    valid, images, seen_keys = [], {}, {}
+    for index, entry in enumerate(entries):
+        values, error = validate_report(entry)
+        if error:
+            results[index] = {"index": index, "status": "invalid", "message": error}
+            continue
+        key = values["idempotency_key"]
+        if key is not None and key in seen_keys:
+            results[index] = {"index": index, "status": "duplicate", "duplicate_of_index": seen_keys[key]}
+            continue
+        if key is not None:
+            seen_keys[key] = index
+
+        image_file = request.files.get(f"image_{index}")
+        if image_file:
+            if not get_storage().available():
+                results[index] = {"index": index, "status": "invalid",
+                                  "message": "Image upload failed: Google Drive service not initialized"}
+                continue
+            images[index] = (image_file.read(), image_file.filename, image_file.mimetype)
+        values["image_status"] = IMAGE_STATUS_PENDING if index in images else None
+        valid.append((index, values))
+
+    try:
+        ensure_partitions_cached()
+        resolve_report_names([values for _, values in valid])
+        with get_connection() as conn, conn.cursor() as cur:
+            outcomes = insert_reports(cur, [values for _, values in valid])
+            for (index, _), (report_id, created) in zip(valid, outcomes):
+                if created and index in images:
+                    save_pending_upload(cur, report_id, *images[index])
             conn.commit()
+        touch_tables("reports")
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    finally:
-        conn.close()
 
-    return jsonify({"success": True, "message": "Form submitted successfully"}), 200
+    for (index, values), (report_id, created) in zip(valid, outcomes):
+        results[index] = {"index": index, "status": "created" if created else "duplicate", "id": report_id}
+        if created and index in images:
+            enqueue_image_upload(report_id, *images[index])
+            results[index]["image_status"] = IMAGE_STATUS_PENDING
+
+    return jsonify({
+        "success": True,
+        "created": sum(1 for r in results if r["status"] == "created"),
+        "results": results,
+    }), 200
+
+# ------------------------------ #
+# Image Upload Status            #
+# ------------------------------ #
+@app.route('/forms/<int:form_id>/image-status', methods=['GET'])
+@conditional("reports")
+def get_image_status(form_id):
+    with get_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute("SELECT id, image_status, image_url, thumbnail_url FROM reports WHERE id = %s", (form_id,))
+        row = cur.fetchone()
+    if not row:
+        return jsonify({"success": False, "message": "Form not found"}), 404
+    return jsonify(row), 200
+
+# ------------------------------ #
+# Stored Images                  #
+# ------------------------------ #
+@app.route('/images/<digest>', methods=['GET', 'HEAD'])
+def get_image(digest):
+    # Named by the SHA-256 of its bytes: a URL never changes content, so it
+    # is cacheable forever and the digest itself is a strong ETag
+    if not IMAGE_KEY_RE.match(digest):
+        return jsonify({"error": "Image not found"}), 404
+    blobs = get_blob_store()
+    stat = blobs.stat(digest)
+    if stat is None:
+        return jsonify({"error": "Image not found"}), 404
+    size, mimetype = stat
+    if mimetype not in IMAGE_MIMETYPES:
+        mimetype = "application/octet-stream"
+    response = Response(wrap_file(request.environ, blobs.open(digest)), mimetype=mimetype, direct_passthrough=True)
+    response.content_length = size
+    response.set_etag(digest)
+    response.headers["Cache-Control"] = f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+    # Nothing stored here may be rendered as a page from the API's origin
+    response.headers["X-Content-Type-Options"] = "nosniff"
+    response.headers["Content-Security-Policy"] = "default-src 'none'; sandbox"
+    response.accept_ranges = "bytes"
+    # Answers If-None-Match with 304 and Range with 206, seeking into the file
+    return response.make_conditional(request, accept_ranges=True, complete_length=size)
 
 # ------------------------------ #
 # Add Teacher                    #
@@ -285,16 +685,27 @@ def add_teacher():
     if not teacher_name or not password:
         return jsonify({"error": "Missing fields"}), 400
 
-    conn = get_db_connection()
-    cur = conn.cursor()
     try:
-        cur.execute("INSERT INTO teachers (name, password) VALUES (%s, %s)", (teacher_name, password))
-        conn.commit()
+        password_hash = hash_password_bounded(password)
+    except PasswordPoolBusy:
+        return jsonify({"error": "Server busy, try again shortly"}), 503
+
+    try:
+        with get_connection() as conn, conn.cursor() as cur:
+            # A name only known from reports (no password yet) becomes a login
+            cur.execute("""
+                INSERT INTO teachers (name, password) VALUES (%s, %s)
+                ON CONFLICT (name) DO UPDATE SET password = EXCLUDED.password
+                WHERE teachers.password IS NULL
+            """, (teacher_name, password_hash))
+            added = cur.rowcount
+            conn.commit()
+        if not added:
+            return jsonify({"error": "Teacher already exists"}), 409
+        teachers_cache.invalidate()
+        touch_tables("teachers")
     except psycopg2.Error as e:
         return jsonify({"error": "Database error", "details": str(e)}), 500
-    finally:
-        cur.close()
-        conn.close()
 
     return jsonify({"message": "Teacher added successfully"}), 201
 
@@ -305,41 +716,75 @@ def add_teacher():
 def delete_teacher(teacher_id):
     if request.method == 'OPTIONS':
         return jsonify({'message': 'Preflight success'}), 200
-    conn = get_db_connection()
-    cur = conn.cursor()
     try:
-        cur.execute("DELETE FROM teachers WHERE id = %s", (teacher_id,))
-        conn.commit()
+        with get_connection() as conn, conn.cursor() as cur:
+            # Reports keep referencing the teacher, so the row stays without a login
+            cur.execute("UPDATE teachers SET password = NULL WHERE id = %s", (teacher_id,))
+            conn.commit()
+        teachers_cache.invalidate()
+        touch_tables("teachers")
         return jsonify({"message": "Teacher deleted successfully"}), 200
     except Exception as e:
         return jsonify({"error": "Failed to delete teacher"}), 500
-    finally:
-        cur.close()
-        conn.close()
+
+# ------------------------------ #
+# Bulk Import Teachers / Admins  #
+# ------------------------------ #
+# Multipart upload of a CSV or XLSX `file` with name and password columns.
+# `update_existing=1` resets the password of accounts that already exist.
+@app.route('/import-teachers', methods=['POST'])
+@require_auth("admin")
+def import_teachers():
+    return _import_accounts("teachers", teachers_cache)
+
+
+@app.route('/import-admins', methods=['POST'])
+@require_auth("admin")
+def import_admins():
+    return _import_accounts("admins", admins_cache)
+
+
+def _import_accounts(table, cache):
+    upload = request.files.get("file")
+    if upload is None or not upload.filename:
+        return jsonify({"error": "Missing file"}), 400
+    update_existing = request.values.get("update_existing", "0") in ("1", "true")
+
+    try:
+        rows, rejected = read_account_rows(upload.stream, upload.filename)
+        imported = import_accounts(table, rows, update_existing)
+    except QueryError as e:
+        return jsonify({"error": str(e)}), 400
+    except ImportBusy:
+        return jsonify({"error": "Another import is running, try again shortly"}), 503
+    except psycopg2.Error as e:
+        return jsonify({"error": "Database error", "details": str(e)}), 500
+
+    if any(r["status"] != REJECTED for r in imported):
+        cache.invalidate()
+        touch_tables(table)
+    results = sorted(rejected + imported, key=lambda r: r["line"])
+    counts = {status: sum(r["status"] == status for r in results) for status in (CREATED, UPDATED, REJECTED)}
+    return jsonify({"success": True, **counts, "results": results}), 200
 
 # ------------------------------ #
 # Delete Form (Only Paul)        #
 # ------------------------------ #
 @app.route('/delete-form/<int:form_id>', methods=['DELETE', 'OPTIONS'])
+@require_auth("Paul")
 def delete_form(form_id):
     if request.method == 'OPTIONS':
         return jsonify({'message': 'Preflight success'}), 200
-    token = request.headers.get("Authorization")
-    if not token:
-        return jsonify({"success": False, "message": "Unauthorized - No token provided"}), 401
 
-    decoded_token = verify_token(token.split("Bearer ")[1])
-    if not decoded_token or decoded_token.get("user_type") != "Paul":
-        return jsonify({"success": False, "message": "Unauthorized - Only Paul can delete forms"}), 403
-
-    conn = get_db_connection()
-    cur = conn.cursor()
-    try:
-        cur.execute("DELETE FROM reports WHERE id = %s", (form_id,))
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+            DELETE FROM reports WHERE id = %s
+            RETURNING created_at, hostel_id, teacher_id, maintenance_required, complaints
+        """, (form_id,))
+        forget_reports(cur, cur.fetchall())
+        cur.execute("DELETE FROM report_idempotency_keys WHERE report_id = %s", (form_id,))
         conn.commit()
-    finally:
-        cur.close()
-        conn.close()
+    touch_tables("reports")
 
     return jsonify({"success": True, "message": "Form deleted successfully"})
 
@@ -347,28 +792,22 @@ def delete_form(form_id):
 # Get Admins                     #
 # ------------------------------ #
 @app.route('/admins', methods=['GET'])
+@require_auth("admin")
+@conditional("admins")
 def get_admins():
-    token = request.headers.get("Authorization")
-    if not token or not token.startswith("Bearer "):
-        return jsonify({"success": False, "message": "Unauthorized"}), 403
+    return jsonify(versioned(admins_cache, "admins", _load_admins)), 200
 
-    decoded_token = verify_token(token.split("Bearer ")[1])
-    if not decoded_token:
-        return jsonify({"success": False, "message": "Unauthorized"}), 403
 
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    cur.execute("SELECT id, name FROM admins")
-    admins = cur.fetchall()
-    cur.close()
-    conn.close()
-
-    return jsonify(admins), 200
+def _load_admins():
+    with read_connection("admins") as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute("SELECT id, name FROM admins")
+        return cur.fetchall()
 
 # ------------------------------ #
 # Add Admin                       #
 # ------------------------------ #
 @app.route('/add-admin', methods=['POST'])
+@require_auth("admin")
 def add_admin():
     data = request.json
     name = data.get("name")
@@ -377,24 +816,19 @@ def add_admin():
     if not name or not password:
         return jsonify({"error": "Missing fields"}), 400
 
-    token = request.headers.get("Authorization")
-    if not token:
-        return jsonify({"error": "Unauthorized"}), 403
-
-    decoded_token = verify_token(token.split("Bearer ")[1])
-    if not decoded_token:
-        return jsonify({"error": "Unauthorized"}), 403
+    try:
+        password_hash = hash_password_bounded(password)
+    except PasswordPoolBusy:
+        return jsonify({"error": "Server busy, try again shortly"}), 503
 
-    conn = get_db_connection()
-    cur = conn.cursor()
     try:
-        cur.execute("INSERT INTO admins (name, password) VALUES (%s, %s)", (name, password))
-        conn.commit()
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute("INSERT INTO admins (name, password) VALUES (%s, %s)", (name, password_hash))
+            conn.commit()
+        admins_cache.invalidate()
+        touch_tables("admins")
     except psycopg2.Error as e:
         return jsonify({"error": "Database error", "details": str(e)}), 500
-    finally:
-        cur.close()
-        conn.close()
 
     return jsonify({"message": "Admin added successfully"}), 201
 
@@ -402,27 +836,19 @@ def add_admin():
 # Delete Admin                     #
 # ------------------------------ #
 @app.route('/delete-admin/<int:admin_id>', methods=['DELETE', 'OPTIONS'])
+@require_auth("admin")
 def delete_admin(admin_id):
     if request.method == 'OPTIONS':
         return jsonify({'message': 'Preflight success'}), 200
-    token = request.headers.get("Authorization")
-    if not token:
-        return jsonify({"success": False, "message": "Unauthorized"}), 401
-
-    decoded_token = verify_token(token.split("Bearer ")[1])
-    if not decoded_token:
-        return jsonify({"success": False, "message": "Unauthorized"}), 403
 
-    conn = get_db_connection()
-    cur = conn.cursor()
     try:
-        cur.execute("DELETE FROM admins WHERE id = %s", (admin_id,))
-        conn.commit()
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute("DELETE FROM admins WHERE id = %s", (admin_id,))
+            conn.commit()
+        admins_cache.invalidate()
+        touch_tables("admins")
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    finally:
-        cur.close()
-        conn.close()
 
     return jsonify({"success": True, "message": "Admin deleted successfully"})
 
@@ -435,44 +861,96 @@ def delete_admin(admin_id):
 # ------------------------------ #
 @app.route('/download/<string:period>', methods=['GET'])
 def download_report(period):
-    conn = get_db_connection()
-    cur = conn.cursor()
-
-    query = {
-        "weekly": "SELECT * FROM reports WHERE created_at >= NOW() - INTERVAL '7 days'",
-        "monthly": "SELECT * FROM reports WHERE created_at >= NOW() - INTERVAL '1 month'",
-        "yearly": "SELECT * FROM reports WHERE created_at >= NOW() - INTERVAL '1 year'"
-    }.get(period)
-
-    if not query:
-        return jsonify({"error": "Invalid period"}), 400
-
-    cur.execute(query)
-    rows = cur.fetchall()
-    column_names = [desc[0] for desc in cur.description]
-
-    cur.close()
-    conn.close()
-
-    if not rows:
+    fmt = request.args.get("format", "xlsx")
+    try:
+        year = parse_export_params(period, fmt, request.args.get("year"))
+    except QueryError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Rows are pulled from a server-side cursor in batches and written out as
+    # they arrive, so memory stays bounded however large the period is.
+    # Yearly exports also read months that retention has archived to disk.
+    # Large ones are better requested through POST /exports.
+    # Exports are neither cached nor ETagged, so only the client's own
+    # writes keep them off the replicas, not everyone's
+    export = open_period_export(period, year, primary=reads_from_primary())
+    if year:
+        period = year
+    if export is None:
         return jsonify({"error": "No data available"}), 404
-
-    df = pd.DataFrame(rows, columns=column_names)
-    
-    # Fix: Convert timezone-aware datetimes to timezone-unaware for Excel compatibility
-    if 'created_at' in df.columns:
-        # Convert to timezone unaware
-        df['created_at'] = df['created_at'].apply(lambda x: x.replace(tzinfo=None) if x is not None and pd.notna(x) and hasattr(x, 'tzinfo') else x)
-        
-    output = BytesIO()
-    df.to_excel(output, index=False, engine='openpyxl')
-    output.seek(0)
+    columns, batches = export
 
     return Response(
-        output.getvalue(),
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f"attachment; filename=report_{period}.xlsx"}
+        stream_export(fmt, columns, batches),
+        content_type=EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f"attachment; filename=report_{period}.{fmt}"}
+    )
+
+# ------------------------------ #
+# Export Jobs                    #
+# ------------------------------ #
+def _export_job_json(job):
+    body = {
+        "id": job["id"],
+        "period": job["period"],
+        "year": job["year"],
+        "format": job["format"],
+        "status": job["status"],
+        "progress": job_progress(job),
+        "rows_written": job["rows_written"],
+        "total_rows": job["total_rows"],
+        "error": job["error"],
+        "created_at": job["created_at"].isoformat(),
+        "finished_at": job["finished_at"].isoformat() if job["finished_at"] else None,
+        "status_url": f"/exports/{job['id']}",
+    }
+    if job["status"] == JOB_DONE:
+        body["file_size"] = job["file_size"]
+        body["download_url"] = f"/exports/{job['id']}/download?token={download_token(job['id'])}"
+    return body
+
+
+@app.route('/exports', methods=['POST'])
+@require_auth()
+def create_export():
+    data = request.get_json(silent=True) or {}
+    period = data.get("period", "yearly")
+    fmt = data.get("format", "xlsx")
+    try:
+        year = parse_export_params(period, fmt, data.get("year"))
+    except QueryError as e:
+        return jsonify({"error": str(e)}), 400
+
+    job, reused = enqueue_export(period, year, fmt, g.user.get("username"))
+    return jsonify({**_export_job_json(job), "reused": reused}), 202
+
+
+@app.route('/exports/<int:job_id>', methods=['GET'])
+@require_auth()
+def export_status(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Export not found"}), 404
+    return jsonify(_export_job_json(job))
+
+
+@app.route('/exports/<int:job_id>/download', methods=['GET'])
+def download_export(job_id):
+    # Authorised by the signed token in the URL, so browsers can follow it directly
+    if not check_download_token(request.args.get("token", ""), job_id):
+        return jsonify({"error": "Invalid or expired download link"}), 403
+    job = get_job(job_id)
+    path = cached_file(job)
+    if path is None:
+        return jsonify({"error": "Export is not available; request it again"}), 404
+    response = send_file(
+        os.path.abspath(path),
+        mimetype=EXPORT_FORMATS[job["format"]],
+        as_attachment=True,
+        download_name=f"report_{job['year'] or job['period']}.{job['format']}",
     )
+    response.headers["Cache-Control"] = "private, no-store"
+    return response
 
 # ------------------------------ #
 # Run Server                     #
@@ -3,25 +3,183 @@ import os
 load_dotenv()
 
 import datetime
+import functools
+import hashlib
+import threading
+import time
+import uuid
+
 import jwt
+from flask import g, jsonify, request
+
+from .cache import generations, get_cache
+from .db_connection import get_connection
+
+# ------------------------------ #
+# Authentication                 #
+# ------------------------------ #
+# Logins hand out a pair of JWTs: a short-lived access token sent as
+# "Authorization: Bearer <token>" and a refresh token that /refresh-token
+# exchanges for a new pair. Protected routes use @require_auth(roles...),
+# which parses the header once, verifies through a cache of decoded tokens
+# keyed by the token digest (repeat requests skip the HMAC check and JSON
+# decoding) and checks the role. /logout and refresh rotation add the
+# token's jti to the revocation list, which every request consults.
 
 # Use an env var in production
 SECRET_KEY = os.getenv('FLASK_SECRET_KEY')
 
-def generate_token(user_type, username, hours_valid=3):
+# The current frontend does not refresh yet, so access tokens keep the old
+# 3 hour lifetime by default; lower it once clients call /refresh-token
+ACCESS_TOKEN_MINUTES = float(os.getenv("ACCESS_TOKEN_MINUTES", 180))
+REFRESH_TOKEN_DAYS = float(os.getenv("REFRESH_TOKEN_DAYS", 14))
+REVOCATION_RELOAD_SECONDS = float(os.getenv("REVOCATION_RELOAD_SECONDS", 30))
+
+# Roles a token's user_type also counts as; Paul is the super admin
+ROLE_IMPLIES = {"Paul": {"Paul", "admin"}}
+
+token_cache = get_cache("tokens", maxsize=1024, ttl=300)
+
+
+def generate_token(user_type, username, token_type="access"):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    lifetime = (datetime.timedelta(minutes=ACCESS_TOKEN_MINUTES) if token_type == "access"
+                else datetime.timedelta(days=REFRESH_TOKEN_DAYS))
     payload = {
         "user_type": user_type,
         "username": username,
-        "exp": datetime.datetime.utcnow() + datetime.timedelta(hours=hours_valid)
+        "typ": token_type,
+        "jti": uuid.uuid4().hex,
+        "iat": now,
+        "exp": now + lifetime,
     }
     return jwt.encode(payload, SECRET_KEY, algorithm="HS256")
 
-def verify_token(token):
+
+def generate_tokens(user_type, username):
+    """ Login/refresh response fields: access token (as `token`), refresh token and lifetime """
+    return {
+        "token": generate_token(user_type, username),
+        "refresh_token": generate_token(user_type, username, "refresh"),
+        "expires_in": int(ACCESS_TOKEN_MINUTES * 60),
+    }
+
+
+def verify_token(token, token_type="access"):
     """ Verify JWT token and return decoded payload or None """
-    try:
-        decoded = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-        return decoded
-    except jwt.ExpiredSignatureError:
+    # The cached entry never outlives the token; revocation is checked on
+    # every call since it can happen after the token was cached
+    key = hashlib.sha256(token.encode()).digest()
+    decoded = token_cache.get(key)
+    if decoded is None or decoded.get("exp", 0) <= time.time():
+        try:
+            decoded = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+        except jwt.InvalidTokenError:
+            return None
+        token_cache.set(key, decoded, ttl=min(token_cache.ttl, decoded.get("exp", 0) - time.time()))
+    # Tokens issued before refresh existed carry no typ and act as access tokens
+    if decoded.get("typ", "access") != token_type:
         return None
-    except jwt.InvalidTokenError:
+    if decoded.get("jti") and revocations.is_revoked(decoded["jti"]):
         return None
+    return decoded
+
+
+def revoke_token(decoded):
+    if decoded.get("jti"):
+        revocations.revoke(decoded["jti"], decoded["exp"])
+
+
+# ------------------------------ #
+# Revocation List                #
+# ------------------------------ #
+class RevocationList:
+    """
+    Revoked jtis, stored in `revoked_tokens` until the token would have
+    expired anyway. Each worker keeps them in a dict of 16-byte ids for O(1)
+    lookups and reloads it when another worker revokes something (through
+    the shared cache generation) or every REVOCATION_RELOAD_SECONDS.
+    """
+
+    name = "revoked_tokens"
+
+    def __init__(self, reload_seconds=REVOCATION_RELOAD_SECONDS):
+        self.reload_seconds = reload_seconds
+        self._revoked = {}   # jti bytes -> expiry (epoch seconds)
+        self._generation = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def _maybe_reload(self):
+        generation = generations.get(self.name)
+        now = time.monotonic()
+        if generation == self._generation and now - self._loaded_at < self.reload_seconds:
+            return
+        with self._lock:
+            if generation == self._generation and now - self._loaded_at < self.reload_seconds:
+                return
+            try:
+                with get_connection() as conn, conn.cursor() as cur:
+                    cur.execute("SELECT jti, extract(epoch FROM expires_at) FROM revoked_tokens WHERE expires_at > NOW()")
+                    self._revoked = {uuid.UUID(jti).bytes: float(exp) for jti, exp in cur.fetchall()}
+                    conn.commit()
+            except Exception as e:
+                # Keep serving with the last known list rather than failing every request
+                print(f"Revocation list reload failed: {e}")
+            self._generation = generation
+            self._loaded_at = now
+
+    def is_revoked(self, jti):
+        self._maybe_reload()
+        expires = self._revoked.get(uuid.UUID(jti).bytes)
+        return expires is not None and expires > time.time()
+
+    def revoke(self, jti, expires):
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO revoked_tokens (jti, expires_at) VALUES (%s, to_timestamp(%s))
+                ON CONFLICT (jti) DO NOTHING
+            """, (jti, expires))
+            cur.execute("DELETE FROM revoked_tokens WHERE expires_at <= NOW()")
+            conn.commit()
+        with self._lock:
+            self._revoked[uuid.UUID(jti).bytes] = float(expires)
+        generations.bump(self.name)
+
+    def stats(self):
+        return {"size": len(self._revoked)}
+
+
+revocations = RevocationList()
+
+
+# ------------------------------ #
+# Route Decorator                #
+# ------------------------------ #
+def _has_role(decoded, roles):
+    user_type = decoded.get("user_type")
+    return bool(ROLE_IMPLIES.get(user_type, {user_type}) & set(roles))
+
+
+def require_auth(*roles):
+    """
+    Require a valid access token, and one of `roles` when given. The decoded
+    token is available to the view as flask.g.user. CORS preflights pass.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method == "OPTIONS":
+                return view(*args, **kwargs)
+            scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+            if scheme != "Bearer" or not token:
+                return jsonify({"success": False, "message": "Missing or invalid token"}), 401
+            decoded = verify_token(token.strip())
+            if decoded is None:
+                return jsonify({"success": False, "message": "Invalid or expired token"}), 401
+            if roles and not _has_role(decoded, roles):
+                return jsonify({"success": False, "message": "Unauthorized"}), 403
+            g.user = decoded
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
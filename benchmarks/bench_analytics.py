@@ -0,0 +1,111 @@
+"""
+/analytics views computed over the pandas snapshot against the same
+aggregates run in Postgres.
+
+    python -m Backend.benchmarks.bench_analytics --repeat 20
+
+Run from the directory that contains Backend/ against a database holding a
+realistic amount of reports (bench_api --keep seeds one). The snapshot is
+built from scratch in a temporary ANALYTICS_SNAPSHOT_PATH, then timed:
+the build, reloading it from Parquet, catching up after --inserts new
+reports (deleted again afterwards), and each view computed cold (memoization
+bypassed) and memoized, next to a GROUP BY over `reports` that answers the
+same question.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from .. import analytics
+from ..db_connection import get_connection
+
+SQL_EQUIVALENTS = {
+    "visits": """
+        SELECT hostel_id, date_trunc('month', created_at AT TIME ZONE 'UTC'), COUNT(*)
+        FROM reports GROUP BY 1, 2
+    """,
+    "coverage": """
+        SELECT hostel_id, MAX(created_at) FROM reports GROUP BY 1
+        HAVING MAX(created_at) < NOW() - INTERVAL '30 days'
+    """,
+    "teachers": """
+        SELECT teacher_id, COUNT(*), COUNT(DISTINCT hostel_id),
+            COUNT(DISTINCT (created_at AT TIME ZONE 'UTC')::date), MAX(created_at)
+        FROM reports GROUP BY 1
+    """,
+    "hotspots": """
+        SELECT hostel_id, date_trunc('month', created_at AT TIME ZONE 'UTC'), COUNT(*),
+            COUNT(*) FILTER (WHERE NULLIF(btrim(maintenance_required), '') IS NOT NULL),
+            COUNT(*) FILTER (WHERE NULLIF(btrim(complaints), '') IS NOT NULL)
+        FROM reports GROUP BY 1, 2
+    """,
+}
+VIEW_ARGS = {"visits": {"period": "month"}, "coverage": {}, "teachers": {}, "hotspots": {"period": "month"}}
+
+
+def median_ms(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def sql_ms(query, repeat):
+    with get_connection() as conn, conn.cursor() as cur:
+        def run():
+            cur.execute(query)
+            cur.fetchall()
+        ms = median_ms(run, repeat)
+        conn.rollback()
+    return ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--inserts", type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "reports.parquet")
+        snapshot = analytics.snapshot = analytics.ReportSnapshot(path)
+
+        started = time.perf_counter()
+        snapshot.refresh()
+        print(f"build    {len(snapshot.frame):,} reports  {(time.perf_counter() - started) * 1000:>8.0f}ms")
+
+        reloaded = analytics.ReportSnapshot(path)
+        started = time.perf_counter()
+        reloaded.refresh()
+        print(f"reload from Parquet          {(time.perf_counter() - started) * 1000:>8.0f}ms")
+
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO reports (teacher_id, subordinate_teacher_id, hostel_id, complaints, created_at)
+                SELECT teacher_id, subordinate_teacher_id, hostel_id, 'bench-analytics', NOW()
+                FROM reports ORDER BY created_at DESC LIMIT %s
+            """, (args.inserts,))
+            conn.commit()
+        try:
+            started = time.perf_counter()
+            snapshot.refresh()
+            print(f"catch up {args.inserts} inserts           {(time.perf_counter() - started) * 1000:>8.0f}ms")
+        finally:
+            with get_connection() as conn, conn.cursor() as cur:
+                cur.execute("DELETE FROM reports WHERE complaints = 'bench-analytics'")
+                conn.commit()
+
+        print(f"{'view':<12}{'postgres':>12}{'pandas':>12}{'memoized':>12}")
+        for view, view_args in VIEW_ARGS.items():
+            params = analytics.parse_analytics_params(view, view_args)
+            cold = median_ms(lambda: analytics.VIEWS[view](snapshot.frame, params), args.repeat)
+            memoized = median_ms(lambda: analytics.run_analytics(view, view_args), args.repeat)
+            print(f"{view:<12}{sql_ms(SQL_EQUIVALENTS[view], args.repeat):>10.1f}ms{cold:>10.1f}ms{memoized:>10.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+"""
+End-to-end benchmark of the main API routes, with JSON results for
+comparing commits.
+
+    python -m Backend.benchmarks.bench_api --reports 50000 --concurrency 8
+    python -m Backend.benchmarks.bench_api --compare benchmarks/results/<earlier>.json
+    python -m Backend.benchmarks.bench_api --temp-cluster --pg-bin /usr/lib/postgresql/16/bin
+
+Run from the directory that contains Backend/. By default it uses the
+database in DATABASE_URL, which must be a scratch database. --temp-cluster
+instead initdb's a throwaway Postgres cluster in a temp directory (initdb
+refuses to run as root). Migrations are applied, then teachers, admins and
+reports named 'bench-api-*' are seeded. They are removed at the end unless
+--keep is given.
+
+Every scenario drives the Flask app in-process through its test client
+from --concurrency threads, standing in for one worker's request threads.
+Images go to a fake Drive backend that sleeps --drive-latency-ms per
+upload. Each scenario reports throughput, p50/p95/p99 latency, DB queries
+per request (from the metrics instrumentation) and the process's peak RSS.
+Results go to benchmarks/results/ (or --output) with the git commit.
+"""
+import argparse
+import datetime
+import io
+import json
+import os
+import random
+import resource
+import shutil
+import socket
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from PIL import Image
+
+from ..app import app
+from ..conditional import touch_tables
+from ..db_connection import get_connection
+from ..dimensions import DIMENSION_TABLES, forget_ids
+from ..metrics import request_db_stats
+from ..migrations import migrate
+from ..partitions import ensure_partitions
+from ..passwords import hash_password
+from ..storage import set_storage
+from ..summary import rebuild_summary
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+PREFIX = "bench-api-"
+PASSWORD = "bench-password"
+
+
+# ------------------------------ #
+# Database                       #
+# ------------------------------ #
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextmanager
+def temp_cluster(pg_bin):
+    """ A throwaway Postgres cluster; yields its DATABASE_URL and removes it afterwards """
+    def tool(name):
+        return os.path.join(pg_bin, name) if pg_bin else name
+
+    directory = tempfile.mkdtemp(prefix="bench-pg-")
+    data, port = os.path.join(directory, "data"), _free_port()
+    subprocess.run([tool("initdb"), "-D", data, "-U", "postgres", "-A", "trust"], check=True,
+                   stdout=subprocess.DEVNULL)
+    subprocess.run([tool("pg_ctl"), "-D", data, "-l", os.path.join(directory, "log"), "-w", "start",
+                    "-o", f"-p {port} -k {directory} -c listen_addresses=127.0.0.1"], check=True,
+                   stdout=subprocess.DEVNULL)
+    try:
+        yield f"postgresql://postgres@127.0.0.1:{port}/postgres"
+    finally:
+        subprocess.run([tool("pg_ctl"), "-D", data, "-m", "fast", "stop"], stdout=subprocess.DEVNULL)
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def seed(args):
+    started = time.perf_counter()
+    hashed = hash_password(PASSWORD)
+    with get_connection() as conn, conn.cursor() as cur:
+        for table, count in (("teachers", args.teachers), ("admins", args.admins)):
+            cur.execute(f"""
+                INSERT INTO {table} (name, password)
+                SELECT %s || g, %s FROM generate_series(1, %s) g
+                ON CONFLICT (name) DO NOTHING
+            """, (f"{PREFIX}{table[:-1]}-", hashed, count))
+        # Subordinate teachers and hostels, referenced by id from reports
+        cur.execute("INSERT INTO teachers (name) SELECT %s || g FROM generate_series(0, 49) g ON CONFLICT (name) DO NOTHING",
+                    (f"{PREFIX}sub-",))
+        cur.execute("INSERT INTO hostels (name) SELECT %s || g FROM generate_series(0, 39) g ON CONFLICT (name) DO NOTHING",
+                    (f"{PREFIX}hostel-",))
+        ensure_partitions(cur, start=datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=400))
+        cur.execute("""
+            INSERT INTO reports (teacher_id, subordinate_teacher_id, hostel_id, general_comments,
+                maintenance_required, complaints, created_at)
+            SELECT t.id, s.id, h.id,
+                'routine visit, rooms checked ' || g,
+                CASE WHEN g %% 3 = 0 THEN 'leaking tap in block ' || (g %% 7) END,
+                CASE WHEN g %% 5 = 0 THEN 'mess food quality' END,
+                NOW() - (g %% 365) * INTERVAL '1 day' - (g %% 86400) * INTERVAL '1 second'
+            FROM generate_series(1, %s) g
+            JOIN teachers t ON t.name = %s || (g %% %s + 1)
+            JOIN teachers s ON s.name = %s || (g %% 50)
+            JOIN hostels h ON h.name = %s || (g %% 40)
+        """, (args.reports, f"{PREFIX}teacher-", args.teachers, f"{PREFIX}sub-", f"{PREFIX}hostel-"))
+        rebuild_summary(cur)
+        cur.execute("ANALYZE reports")
+        conn.commit()
+    print(f"seeded {args.teachers} teachers, {args.admins} admins, {args.reports:,} reports "
+          f"in {time.perf_counter() - started:.1f}s")
+
+
+def deletable(table, count):
+    """ Rows for a delete scenario; returns their ids """
+    with get_connection() as conn, conn.cursor() as cur:
+        if table == "reports":
+            cur.execute("""
+                INSERT INTO reports (teacher_id, hostel_id)
+                SELECT (SELECT id FROM teachers WHERE name = %s), (SELECT id FROM hostels WHERE name = %s)
+                FROM generate_series(1, %s) RETURNING id
+            """, (f"{PREFIX}teacher-1", f"{PREFIX}hostel-0", count))
+        else:
+            cur.execute(f"""
+                INSERT INTO {table} (name, password)
+                SELECT %s || g, 'x' FROM generate_series(1, %s) g RETURNING id
+            """, (f"{PREFIX}{table[:-1]}-delete-{time.time_ns()}-", count))
+        ids = [row[0] for row in cur.fetchall()]
+        conn.commit()
+    return ids
+
+
+def cleanup():
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute("DELETE FROM reports WHERE hostel_id IN (SELECT id FROM hostels WHERE name LIKE %s)", (PREFIX + "%",))
+        rebuild_summary(cur)
+        cur.execute("DELETE FROM hostels WHERE name LIKE %s", (PREFIX + "%",))
+        cur.execute("DELETE FROM teachers WHERE name LIKE %s", (PREFIX + "%",))
+        cur.execute("DELETE FROM admins WHERE name LIKE %s", (PREFIX + "%",))
+        conn.commit()
+    for table in DIMENSION_TABLES:
+        forget_ids(table)
+    touch_tables("reports", "teachers", "admins")
+
+
+# ------------------------------ #
+# Scenarios                      #
+# ------------------------------ #
+class FakeDrive:
+    """ Storage backend standing in for Google Drive: waits, then returns a fake link """
+
+    name = "fake-drive"
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    def available(self):
+        return True
+
+    def upload(self, data, filename, mimetype):
+        time.sleep(self.latency)
+        return f"https://drive.example/uc?id={random.getrandbits(64):x}"
+
+
+def _sample_image():
+    buffer = io.BytesIO()
+    Image.new("RGB", (1280, 960), (120, 160, 200)).save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def build_scenarios(client, args):
+    """ name -> (request function taking the request index, expected status) """
+    def login(kind, name, ip="10.0.0.1"):
+        path, field = ("/teacher-login", "teacherId") if kind == "teacher" else ("/admin-login", "adminId")
+        r = client.post(path, json={field: name, "password": PASSWORD if name != "Paul" else "1234"},
+                        environ_base={"REMOTE_ADDR": ip})
+        return {"Authorization": f"Bearer {r.get_json()['token']}"}
+
+    teacher = login("teacher", f"{PREFIX}teacher-1")
+    admin = login("admin", f"{PREFIX}admin-1")
+    paul = login("admin", "Paul")
+    image = _sample_image()
+    forms_to_delete = deque(deletable("reports", args.requests))
+    teachers_to_delete = deque(deletable("teachers", args.requests))
+    admins_to_delete = deque(deletable("admins", args.requests))
+
+    def teacher_login(i):
+        # A different client address per attempt, as for a real user base
+        return client.post("/teacher-login", environ_base={"REMOTE_ADDR": f"10.{i // 62500 % 250}.{i // 250 % 250}.{i % 250}"},
+                           json={"teacherId": f"{PREFIX}teacher-{i % args.teachers + 1}", "password": PASSWORD})
+
+    def submit_form(i):
+        data = {"teacherName": f"{PREFIX}teacher-1", "subordinateTeacherName": f"{PREFIX}sub-0",
+                "hostelName": f"{PREFIX}hostel-{i % 40}", "complaints": "bench submission"}
+        if i % 2 == 0:
+            data["image"] = (io.BytesIO(image), "visit.jpg", "image/jpeg")
+        return client.post("/submit-form", data=data, headers=teacher, content_type="multipart/form-data")
+
+    return {
+        "teacher_login": (teacher_login, 200),
+        "submit_form": (submit_form, 200),
+        "get_forms_page": (lambda i: client.get(f"/forms?limit=50&hostel_name={PREFIX}hostel-{i % 40}"), 200),
+        "get_forms_full": (lambda i: client.get("/forms?legacy=1"), 200),
+        "download_weekly_csv": (lambda i: client.get("/download/weekly?format=csv"), 200),
+        "download_monthly_xlsx": (lambda i: client.get("/download/monthly?format=xlsx"), 200),
+        "delete_form": (lambda i: client.delete(f"/delete-form/{forms_to_delete.popleft()}", headers=paul), 200),
+        "delete_teacher": (lambda i: client.delete(f"/delete-teacher/{teachers_to_delete.popleft()}"), 200),
+        "delete_admin": (lambda i: client.delete(f"/delete-admin/{admins_to_delete.popleft()}", headers=admin), 200),
+    }
+
+
+# ------------------------------ #
+# Runner                         #
+# ------------------------------ #
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run_scenario(request_fn, expected, requests, concurrency):
+    latencies, queries, db_ms, errors = [], [], [], 0
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def worker():
+        nonlocal errors
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            started = time.perf_counter()
+            response = request_fn(i)
+            response.get_data()   # streamed exports run their queries while being read
+            elapsed = time.perf_counter() - started
+            count, seconds = request_db_stats()
+            with lock:
+                latencies.append(elapsed * 1000)
+                queries.append(count)
+                db_ms.append(seconds * 1000)
+                errors += response.status_code != expected
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        for future in [pool.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": requests,
+        "errors": errors,
+        "throughput_rps": round(requests / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "mean_ms": round(statistics.mean(latencies), 2),
+        "db_queries_per_request": round(statistics.mean(queries), 2),
+        "db_queries_max": max(queries),
+        "db_ms_p50": round(percentile(db_ms, 50), 2),
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(RESULTS_DIR)).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, baseline=None):
+    print(f"{'scenario':<24}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'queries':>9}{'errors':>8}{'RSS MB':>8}")
+    for name, r in results["scenarios"].items():
+        line = (f"{name:<24}{r['throughput_rps']:>9.1f}{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}"
+                f"{r['db_queries_per_request']:>9.1f}{r['errors']:>8}{r['peak_rss_mb']:>8.0f}")
+        before = (baseline or {}).get("scenarios", {}).get(name)
+        if before:
+            change = lambda key: (r[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+            line += f"   vs {baseline['commit'] or 'baseline'}: p95 {change('p95_ms'):+.0f}%, req/s {change('throughput_rps'):+.0f}%"
+        print(line)
+
+
+def run(args):
+    migrate()
+    seed(args)
+    set_storage(FakeDrive(args.drive_latency_ms / 1000))
+    try:
+        client = app.test_client()
+        scenarios = build_scenarios(client, args)
+        selected = args.scenarios.split(",") if args.scenarios else list(scenarios)
+        results = {
+            "commit": _git_commit(),
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "config": {k: v for k, v in vars(args).items() if k not in ("compare", "output")},
+            "scenarios": {},
+        }
+        for name in selected:
+            request_fn, expected = scenarios[name]
+            requests = args.requests if not name.startswith("download") else max(1, args.requests // 10)
+            results["scenarios"][name] = run_scenario(request_fn, expected, requests, args.concurrency)
+            print(f"  {name}: done")
+    finally:
+        if not args.keep:
+            cleanup()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--teachers", type=int, default=200)
+    parser.add_argument("--admins", type=int, default=20)
+    parser.add_argument("--reports", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario (a tenth for downloads)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--drive-latency-ms", type=float, default=150)
+    parser.add_argument("--scenarios", help="comma-separated subset to run")
+    parser.add_argument("--temp-cluster", action="store_true")
+    parser.add_argument("--pg-bin", help="directory with initdb/pg_ctl for --temp-cluster")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/api-<commit>-<time>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare with")
+    parser.add_argument("--keep", action="store_true")
+    args = parser.parse_args()
+
+    random.seed(1)
+    if args.temp_cluster:
+        with temp_cluster(args.pg_bin) as url:
+            os.environ["DATABASE_URL"] = url
+            results = run(args)
+    else:
+        results = run(args)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"api-{results['commit'] or 'nogit'}-{results['timestamp'][:19].replace(':', '')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"results saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
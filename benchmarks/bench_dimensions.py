@@ -0,0 +1,123 @@
+"""
+Storage and filter latency of reports keyed by teacher/hostel name (before
+migration 12) versus integer ids into the teachers and hostels tables.
+
+    python -m Backend.benchmarks.bench_dimensions --rows 500000
+
+Run from the directory that contains Backend/ against any database
+(DATABASE_URL). Both layouts are built as temporary tables with the same
+synthetic rows and their own (name|id, created_at, id) indexes, so nothing
+outside the session is touched. Reported sizes include indexes; query times
+are medians over --repeat runs of a /forms page filtered by hostel and a
+per-hostel count like the summary rollup rebuild.
+"""
+import argparse
+import statistics
+import time
+
+from ..db_connection import get_connection
+
+SETUP = """
+    CREATE TEMP TABLE bench_hostels (id SERIAL PRIMARY KEY, name VARCHAR(255) UNIQUE NOT NULL);
+    CREATE TEMP TABLE bench_teachers (id SERIAL PRIMARY KEY, name VARCHAR(255) UNIQUE NOT NULL);
+    INSERT INTO bench_hostels (name) SELECT 'Sir Seretse Khama Boys Hostel Block ' || g FROM generate_series(0, %(hostels)s - 1) g;
+    INSERT INTO bench_teachers (name) SELECT 'Teacher Firstname Lastname ' || g FROM generate_series(0, %(teachers)s - 1) g;
+
+    CREATE TEMP TABLE bench_by_name (
+        id SERIAL, teacher_name VARCHAR(255) NOT NULL, subordinate_teacher_name VARCHAR(255),
+        hostel_name VARCHAR(255) NOT NULL, general_comments TEXT, maintenance_required TEXT, complaints TEXT,
+        created_at TIMESTAMP WITH TIME ZONE NOT NULL, PRIMARY KEY (id, created_at)
+    );
+    INSERT INTO bench_by_name (teacher_name, subordinate_teacher_name, hostel_name,
+        general_comments, maintenance_required, complaints, created_at)
+    SELECT t.name, s.name, h.name, 'routine visit, rooms checked',
+        CASE WHEN g %% 3 = 0 THEN 'leaking tap' END, CASE WHEN g %% 5 = 0 THEN 'mess food' END,
+        NOW() - (g %% 365) * INTERVAL '1 day' - (g %% 86400) * INTERVAL '1 second'
+    FROM generate_series(1, %(rows)s) g
+    JOIN bench_teachers t ON t.id = 1 + g %% %(teachers)s
+    JOIN bench_teachers s ON s.id = 1 + (g / 7) %% %(teachers)s
+    JOIN bench_hostels h ON h.id = 1 + g %% %(hostels)s;
+    CREATE INDEX ON bench_by_name (hostel_name, created_at DESC, id DESC);
+    CREATE INDEX ON bench_by_name (teacher_name, created_at DESC, id DESC);
+
+    CREATE TEMP TABLE bench_by_id AS
+    SELECT r.id, t.id AS teacher_id, s.id AS subordinate_teacher_id, h.id AS hostel_id,
+        r.general_comments, r.maintenance_required, r.complaints, r.created_at
+    FROM bench_by_name r
+    JOIN bench_teachers t ON t.name = r.teacher_name
+    JOIN bench_teachers s ON s.name = r.subordinate_teacher_name
+    JOIN bench_hostels h ON h.name = r.hostel_name;
+    ALTER TABLE bench_by_id ADD PRIMARY KEY (id, created_at);
+    CREATE INDEX ON bench_by_id (hostel_id, created_at DESC, id DESC);
+    CREATE INDEX ON bench_by_id (teacher_id, created_at DESC, id DESC);
+    ANALYZE bench_hostels, bench_teachers, bench_by_name, bench_by_id;
+"""
+
+QUERIES = {
+    "forms page by hostel": (
+        """
+        SELECT id, teacher_name, subordinate_teacher_name, hostel_name, complaints, created_at
+        FROM bench_by_name WHERE hostel_name = %s ORDER BY created_at DESC, id DESC LIMIT 50
+        """,
+        """
+        SELECT r.id, t.name, s.name, h.name, r.complaints, r.created_at
+        FROM bench_by_id r
+        LEFT JOIN bench_teachers t ON t.id = r.teacher_id
+        LEFT JOIN bench_teachers s ON s.id = r.subordinate_teacher_id
+        LEFT JOIN bench_hostels h ON h.id = r.hostel_id
+        WHERE r.hostel_id = (SELECT id FROM bench_hostels WHERE name = %s)
+        ORDER BY r.created_at DESC, r.id DESC LIMIT 50
+        """,
+    ),
+    "count per hostel and teacher": (
+        "SELECT hostel_name, teacher_name, COUNT(*) FROM bench_by_name GROUP BY 1, 2",
+        "SELECT hostel_id, teacher_id, COUNT(*) FROM bench_by_id GROUP BY 1, 2",
+    ),
+}
+
+
+def timed(cur, query, params, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        cur.execute(query, params)
+        cur.fetchall()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def size(cur, table):
+    cur.execute("SELECT pg_table_size(%s::regclass), pg_indexes_size(%s::regclass)", (table, table))
+    return cur.fetchone()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=500000)
+    parser.add_argument("--hostels", type=int, default=40)
+    parser.add_argument("--teachers", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with get_connection() as conn, conn.cursor() as cur:
+        started = time.perf_counter()
+        cur.execute(SETUP, vars(args))
+        print(f"built {args.rows:,} rows in each layout in {time.perf_counter() - started:.1f}s")
+
+        mb = 1024 * 1024
+        print(f"{'layout':<10}{'table':>10}{'indexes':>10}{'total':>10}")
+        for label, table in (("names", "bench_by_name"), ("ids", "bench_by_id")):
+            table_bytes, index_bytes = size(cur, table)
+            print(f"{label:<10}{table_bytes / mb:>8.1f}MB{index_bytes / mb:>8.1f}MB{(table_bytes + index_bytes) / mb:>8.1f}MB")
+
+        hostel = f"Sir Seretse Khama Boys Hostel Block {args.hostels // 2}"
+        print(f"{'query':<32}{'names p50':>11}{'ids p50':>11}")
+        for label, (by_name, by_id) in QUERIES.items():
+            params = [hostel] if "%s" in by_name else None
+            repeat = args.repeat if params else max(3, args.repeat // 4)
+            print(f"{label:<32}{timed(cur, by_name, params, repeat):>9.1f}ms{timed(cur, by_id, params, repeat):>9.1f}ms")
+        conn.rollback()
+
+
+if __name__ == "__main__":
+    main()
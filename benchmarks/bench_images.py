@@ -0,0 +1,68 @@
+"""
+Content-addressed image storage: deduplicated uploads and /images serving.
+
+    python -m Backend.benchmarks.bench_images --images 50 --requests 500
+
+Run from the directory that contains Backend/. Needs no database: images
+are stored in a temporary directory (a LocalBlobStore), each uploaded twice
+as a retried submission would be, then fetched through the app in full,
+revalidated with If-None-Match and read with a Range request. Prints the
+bytes written against the bytes uploaded and the median latency of each
+kind of request.
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from .. import storage
+from ..app import app
+from ..storage import ContentAddressedStorage, LocalBlobStore
+
+
+def median_ms(client, urls, requests, headers):
+    samples = []
+    for _ in range(requests):
+        url = random.choice(urls)
+        started = time.perf_counter()
+        response = client.get(url, headers=headers(url))
+        response.get_data()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), response.status_code
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=50)
+    parser.add_argument("--size", type=int, default=400_000, help="bytes per image")
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        blobs = LocalBlobStore(directory)
+        storage._blob_store = blobs
+        store = ContentAddressedStorage(blobs)
+        images = [b"\xff\xd8\xff" + os.urandom(args.size - 3) for _ in range(args.images)]
+
+        started = time.perf_counter()
+        urls = [store.upload(data, "photo.jpg", "image/jpeg") for data in images]
+        urls += [store.upload(data, "photo.jpg", "image/jpeg") for data in images]   # retries
+        upload_ms = (time.perf_counter() - started) * 1000 / len(urls)
+        written = sum(os.path.getsize(os.path.join(root, name))
+                      for root, _, names in os.walk(directory) for name in names)
+
+        client = app.test_client()
+        print(f"uploaded {len(urls) * args.size / 1e6:.1f}MB, stored {written / 1e6:.1f}MB "
+              f"({upload_ms:.2f}ms per upload)")
+        for label, headers in (
+                ("full GET", lambda url: {}),
+                ("If-None-Match", lambda url: {"If-None-Match": f'"{url.rsplit("/", 1)[1]}"'}),
+                ("Range 64KiB", lambda url: {"Range": "bytes=0-65535"})):
+            ms, status = median_ms(client, urls, args.requests, headers)
+            print(f"{label:<16}{status:>5}{ms:>9.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Bulk account import (/import-teachers) against one /add-teacher call per
+account.
+
+    python -m Backend.benchmarks.bench_import --rows 10000
+
+Run from the directory that contains Backend/ against a scratch database
+(DATABASE_URL) with migrations applied. Teachers named 'bench-import-*' are
+created and deleted again. Hashing and the database work are timed
+separately: the database side of the import (pre-check, COPY, merge) is
+measured on pre-hashed passwords, and scrypt throughput on a sample of
+--hash-sample passwords, serially and on PASSWORD_IMPORT_WORKERS threads.
+"""
+import argparse
+import io
+import time
+
+from .. import account_imports
+from ..account_imports import import_accounts, read_account_rows
+from ..db_connection import get_connection
+from ..passwords import IMPORT_HASH_WORKERS, hash_password, hash_passwords
+
+PREFIX = "bench-import-"
+
+
+def sheet(rows, tag):
+    lines = ["name,password"] + [f"{PREFIX}{tag}-{i},password-{i}" for i in range(rows)]
+    return io.BytesIO("\n".join(lines).encode())
+
+
+def cleanup():
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute("DELETE FROM teachers WHERE name LIKE %s", (PREFIX + "%",))
+        conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--hash-sample", type=int, default=100)
+    args = parser.parse_args()
+
+    account_imports.ACCOUNT_IMPORT_MAX_ROWS = max(account_imports.ACCOUNT_IMPORT_MAX_ROWS, args.rows)
+    stored = hash_password("bench")
+    cleanup()
+    try:
+        started = time.perf_counter()
+        rows, _ = read_account_rows(sheet(args.rows, "bulk"), "accounts.csv")
+        parsed = time.perf_counter()
+        for row in rows:
+            row["password"] = stored
+        results = import_accounts("teachers", rows)
+        merged = time.perf_counter()
+        assert all(r["status"] == "created" for r in results), "unexpected rejections"
+
+        # What /add-teacher does per account, minus the hashing
+        single_started = time.perf_counter()
+        for i in range(args.rows):
+            with get_connection() as conn, conn.cursor() as cur:
+                cur.execute("INSERT INTO teachers (name, password) VALUES (%s, %s)", (f"{PREFIX}single-{i}", stored))
+                conn.commit()
+        single = time.perf_counter() - single_started
+
+        sample = [f"password-{i}" for i in range(args.hash_sample)]
+        hash_started = time.perf_counter()
+        hash_passwords(sample, workers=1)
+        serial_ms = (time.perf_counter() - hash_started) * 1000 / len(sample)
+        hash_started = time.perf_counter()
+        hash_passwords(sample)
+        parallel_ms = (time.perf_counter() - hash_started) * 1000 / len(sample)
+    finally:
+        cleanup()
+
+    print(f"{args.rows:,} accounts")
+    print(f"  parse CSV                   {(parsed - started) * 1000:>9.0f}ms")
+    print(f"  import (check, COPY, merge) {(merged - parsed) * 1000:>9.0f}ms")
+    print(f"  one INSERT per account      {single * 1000:>9.0f}ms")
+    print(f"  scrypt, 1 thread            {serial_ms * args.rows / 1000:>9.1f}s  ({serial_ms:.1f}ms each)")
+    print(f"  scrypt, {IMPORT_HASH_WORKERS:<2} threads          {parallel_ms * args.rows / 1000:>9.1f}s  ({parallel_ms:.1f}ms each)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Login throughput for legitimate users while an attacker stuffs credentials,
+with and without the login throttle.
+
+    python -m Backend.benchmarks.bench_login --seconds 10 --attack-rate 300 --users 4
+
+Run from the directory that contains Backend/ against a scratch database
+that migrations have been applied to. The app is driven in-process through
+Flask's test client from a thread pool standing in for gunicorn threads.
+The attacker sends --attack-rate requests per second, with random usernames
+and wrong passwords, from a few IPs and never backs off. Legitimate users
+log in with the right password, each attempt from a different IP.
+Seeded teachers are named 'bench-login-*' and are deleted afterwards.
+"""
+import argparse
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ..app import app
+from ..db_connection import get_connection
+from ..passwords import hash_password
+from ..ratelimit import login_throttle
+
+PASSWORD = "correct horse"
+
+
+def seed(users):
+    hashed = hash_password(PASSWORD)
+    with get_connection() as conn, conn.cursor() as cur:
+        for i in range(users):
+            cur.execute("INSERT INTO teachers (name, password) VALUES (%s, %s) ON CONFLICT (name) DO NOTHING",
+                        (f"bench-login-{i}", hashed))
+        conn.commit()
+
+
+def cleanup():
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute("DELETE FROM teachers WHERE name LIKE 'bench-login-%%'")
+        conn.commit()
+
+
+def run(args, throttled):
+    login_throttle.__init__(enabled=throttled)
+    client = app.test_client()
+    # Stands in for the worker's request threads; attack and legitimate
+    # requests queue for the same threads as they would in gunicorn
+    server = ThreadPoolExecutor(max_workers=args.server_threads)
+    stop = time.monotonic() + args.seconds
+    lock = threading.Lock()
+    legit = {"ok": 0, "rejected": 0, "latencies": []}
+    attack = {"total": 0, "throttled": 0}
+
+    def login(ip, name, password):
+        return client.post("/teacher-login", environ_base={"REMOTE_ADDR": ip},
+                           json={"teacherId": name, "password": password}).status_code
+
+    def attack_done(future):
+        if future.cancelled():
+            return   # still queued when the run ended
+        with lock:
+            attack["total"] += 1
+            attack["throttled"] += future.result() == 429
+
+    def attacker():
+        # Open loop at a fixed rate: the attacker does not wait for answers
+        interval = 1 / args.attack_rate
+        next_at = time.monotonic()
+        while time.monotonic() < stop:
+            ip = f"10.66.0.{random.randrange(args.attacker_ips)}"
+            future = server.submit(login, ip, f"victim-{random.randrange(10000)}", "guess")
+            future.add_done_callback(attack_done)
+            next_at += interval
+            time.sleep(max(0.0, next_at - time.monotonic()))
+
+    def user(n):
+        attempt = 0
+        while time.monotonic() < stop:
+            # Each login comes from a different client, as for a real user base
+            attempt += 1
+            ip = f"192.168.{n}.{attempt % 250}"
+            started = time.perf_counter()
+            status = server.submit(login, ip, f"bench-login-{n}", PASSWORD).result()
+            elapsed = time.perf_counter() - started
+            with lock:
+                if status == 200:
+                    legit["ok"] += 1
+                    legit["latencies"].append(elapsed * 1000)
+                else:
+                    legit["rejected"] += 1
+            time.sleep(args.think_ms / 1000)
+
+    threads = [threading.Thread(target=attacker)] + [threading.Thread(target=user, args=(n,)) for n in range(args.users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    server.shutdown(wait=True, cancel_futures=True)
+
+    latencies = sorted(legit["latencies"]) or [0.0]
+    return {
+        "legit_ok_per_s": legit["ok"] / args.seconds,
+        "legit_rejected": legit["rejected"],
+        "legit_p50_ms": statistics.median(latencies),
+        "legit_p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        "attack_per_s": attack["total"] / args.seconds,
+        "attack_throttled_pct": 100 * attack["throttled"] / max(attack["total"], 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--attack-rate", type=float, default=300, help="attack requests per second")
+    parser.add_argument("--attacker-ips", type=int, default=4)
+    parser.add_argument("--server-threads", type=int, default=8)
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--think-ms", type=float, default=50)
+    args = parser.parse_args()
+
+    seed(args.users)
+    try:
+        print(f"{'throttle':<10}{'legit ok/s':>12}{'rejected':>10}{'p50':>10}{'p95':>10}{'attack/s':>11}{'throttled':>11}")
+        for throttled in (False, True):
+            r = run(args, throttled)
+            print(f"{'on' if throttled else 'off':<10}{r['legit_ok_per_s']:>12.1f}{r['legit_rejected']:>10}"
+                  f"{r['legit_p50_ms']:>8.1f}ms{r['legit_p95_ms']:>8.1f}ms"
+                  f"{r['attack_per_s']:>11.0f}{r['attack_throttled_pct']:>10.1f}%")
+    finally:
+        cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Report submissions while yearly exports stream, with and without read
+replicas.
+
+    python -m Backend.benchmarks.bench_replicas --exporters 4 --submissions 200
+    DATABASE_REPLICA_URLS=postgresql://...replica... python -m Backend.benchmarks.bench_replicas
+
+Run from the directory that contains Backend/ against a scratch primary
+(DATABASE_URL) holding a realistic amount of reports (bench_api --keep
+seeds one). --exporters threads download /download/yearly?format=csv in a
+loop while one thread submits reports; the submit latency and where the
+exports' reads went are printed. Run it once without and once with
+DATABASE_REPLICA_URLS to compare. A replica on the same host shares its
+CPU and disk with the primary, so the difference only shows when it runs
+elsewhere. The teacher and reports it creates are deleted afterwards.
+"""
+import argparse
+import statistics
+import threading
+import time
+
+from ..app import app
+from ..db_connection import get_connection, get_replicas, replica_stats
+from ..passwords import hash_password
+
+TEACHER = "bench-replicas-teacher"
+HOSTEL = "bench-replicas-hostel"
+PASSWORD = "bench-password"
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def cleanup():
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute("DELETE FROM reports WHERE hostel_id IN (SELECT id FROM hostels WHERE name = %s)", (HOSTEL,))
+        cur.execute("DELETE FROM report_summary WHERE hostel_id IN (SELECT id FROM hostels WHERE name = %s)", (HOSTEL,))
+        cur.execute("DELETE FROM hostels WHERE name = %s", (HOSTEL,))
+        cur.execute("DELETE FROM teachers WHERE name = %s", (TEACHER,))
+        conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--exporters", type=int, default=4)
+    parser.add_argument("--submissions", type=int, default=200)
+    args = parser.parse_args()
+
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute("INSERT INTO teachers (name, password) VALUES (%s, %s) ON CONFLICT (name) DO UPDATE SET password = EXCLUDED.password",
+                    (TEACHER, hash_password(PASSWORD)))
+        conn.commit()
+
+    client = app.test_client()
+    token = client.post("/teacher-login", json={"teacherId": TEACHER, "password": PASSWORD}).get_json()["token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    stop = threading.Event()
+    exports = []
+
+    def export_loop():
+        # Its own client: the submitting client's read-your-writes cookie must not apply
+        exporter = app.test_client()
+        while not stop.is_set():
+            started = time.perf_counter()
+            exporter.get("/download/yearly?format=csv").get_data()
+            exports.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=export_loop, daemon=True) for _ in range(args.exporters)]
+    latencies = []
+    try:
+        for thread in threads:
+            thread.start()
+        time.sleep(1)   # let the exports get going
+        for i in range(args.submissions):
+            started = time.perf_counter()
+            response = client.post("/submit-form", headers=headers, data={
+                "teacherName": TEACHER, "subordinateTeacherName": TEACHER, "hostelName": HOSTEL,
+                "complaints": f"bench submission {i}"})
+            latencies.append((time.perf_counter() - started) * 1000)
+            assert response.status_code == 200, response.get_data(as_text=True)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+        cleanup()
+
+    print(f"replicas: {len(get_replicas().replicas) if get_replicas() else 0}, exporters: {args.exporters}")
+    print(f"submit  p50 {percentile(latencies, 50):.1f}ms  p95 {percentile(latencies, 95):.1f}ms  "
+          f"p99 {percentile(latencies, 99):.1f}ms")
+    if exports:
+        print(f"exports {len(exports)} completed, median {statistics.median(exports):.2f}s")
+    stats = replica_stats()
+    if stats:
+        print(f"replica reads {[r['reads'] for r in stats['replicas']]}, primary fallbacks {stats['fallbacks']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Measure /reports/search query latency on a large synthetic reports table.
+
+    python -m Backend.benchmarks.bench_search --rows 100000
+
+Run from the directory that contains Backend/ against a scratch database
+(DATABASE_URL) that init_db has been run on. Seeded rows use hostel and
+teacher names starting with 'bench-' and are deleted afterwards unless
+--keep is given.
+The GIN-backed search is compared with the same ranked query computing
+to_tsvector on the fly, i.e. without the generated column and index.
+"""
+import argparse
+import datetime
+import statistics
+import time
+
+from psycopg2.extras import RealDictCursor
+
+from ..db_connection import get_connection
+from ..partitions import ensure_partitions
+from ..search import build_search_query
+
+WORDS = (
+    "leaking tap bathroom broken window fan light bulb door lock water heater "
+    "mess food quality hygiene wifi slow noise corridor roof damp paint wall "
+    "bed mattress cupboard pest cockroach drainage blocked shower geyser power "
+    "outage generator security guard gate register visitor clean tidy good fine"
+).split()
+
+RANDOM_TEXT_FUNCTION = """
+    CREATE OR REPLACE FUNCTION pg_temp.bench_text(n int, w text[]) RETURNS text AS $$
+        SELECT string_agg(w[1 + floor(random() * array_length(w, 1))::int], ' ')
+        FROM generate_series(1, n)
+    $$ LANGUAGE sql VOLATILE
+"""
+
+SEED_NAMES = """
+    INSERT INTO teachers (name) SELECT 'bench-teacher-' || g FROM generate_series(0, 199) g ON CONFLICT (name) DO NOTHING;
+    INSERT INTO hostels (name) SELECT 'bench-hostel-' || g FROM generate_series(0, 39) g ON CONFLICT (name) DO NOTHING;
+"""
+
+SEED = """
+    INSERT INTO reports (teacher_id, subordinate_teacher_id, hostel_id,
+        general_comments, maintenance_required, complaints, created_at)
+    SELECT t.id, s.id, h.id,
+        pg_temp.bench_text(12 + g %% 3, w),
+        CASE WHEN g %% 3 = 0 THEN pg_temp.bench_text(6 + g %% 2, w) END,
+        CASE WHEN g %% 4 = 0 THEN pg_temp.bench_text(6 + g %% 2, w) END,
+        NOW() - (g %% 730) * INTERVAL '1 day'
+    FROM generate_series(1, %s) g
+    JOIN teachers t ON t.name = 'bench-teacher-' || (g %% 200)
+    JOIN teachers s ON s.name = 'bench-teacher-' || (g %% 50)
+    JOIN hostels h ON h.name = 'bench-hostel-' || (g %% 40),
+    (SELECT %s::text[] AS w) words
+"""
+
+UNINDEXED_SEARCH = """
+    SELECT id, ts_rank(v, q) AS rank FROM (
+        SELECT id, to_tsvector('english', coalesce(complaints, '') || ' ' ||
+            coalesce(maintenance_required, '') || ' ' || coalesce(general_comments, '')) AS v
+        FROM reports
+    ) r, websearch_to_tsquery('english', %s) q
+    WHERE v @@ q
+    ORDER BY rank DESC, id DESC LIMIT 20
+"""
+
+QUERIES = [
+    {"q": "leaking tap"},
+    {"q": "cockroach"},
+    {"q": "water heater -geyser"},
+    {"q": "broken window", "hostel_name": "bench-hostel-7"},
+    {"q": "wifi slow", "from": "2025-01-01"},
+]
+
+
+def timed(cur, query, params, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        cur.execute(query, params)
+        cur.fetchall()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), max(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--keep", action="store_true")
+    args = parser.parse_args()
+
+    with get_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+        started = time.perf_counter()
+        cur.execute(RANDOM_TEXT_FUNCTION)
+        cur.execute(SEED_NAMES)
+        with conn.cursor() as plain:
+            ensure_partitions(plain, start=datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=730))
+        cur.execute(SEED, (args.rows, list(WORDS)))
+        cur.execute("ANALYZE reports")
+        conn.commit()
+        print(f"seeded {args.rows:,} rows in {time.perf_counter() - started:.1f}s")
+
+        try:
+            print(f"{'query':<48}{'fts p50':>10}{'fts max':>10}{'unindexed p50':>15}")
+            for params in QUERIES:
+                query, qparams, _ = build_search_query(dict(params, limit="20"))
+                fts_p50, fts_max = timed(cur, query, qparams, args.repeat)
+                baseline_p50, _ = timed(cur, UNINDEXED_SEARCH, [params["q"]], max(3, args.repeat // 4))
+                label = ", ".join(f"{k}={v}" for k, v in params.items())
+                print(f"{label:<48}{fts_p50:>8.1f}ms{fts_max:>8.1f}ms{baseline_p50:>11.1f}ms")
+        finally:
+            if not args.keep:
+                cur.execute("DELETE FROM reports WHERE hostel_id IN (SELECT id FROM hostels WHERE name LIKE 'bench-%%')")
+                cur.execute("DELETE FROM hostels WHERE name LIKE 'bench-%%'")
+                cur.execute("DELETE FROM teachers WHERE name LIKE 'bench-%%' AND password IS NULL")
+                conn.commit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Load-test the sync and async (gevent) gunicorn modes at the same memory budget.
+
+    python -m Backend.benchmarks.bench_serving --workers 2 --concurrency 50 \
+        --path "/forms?limit=50" --db-latency-ms 20
+
+Run from the directory that contains Backend/ with DATABASE_URL pointing at a
+seeded database. Postgres traffic goes through a local proxy that adds
+--db-latency-ms per round trip, standing in for a database on another host.
+Each mode is started with the same number of workers; the report shows
+throughput, latency percentiles and the summed RSS of the workers.
+"""
+import argparse
+import os
+import select
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, urlunparse
+
+
+# ------------------------------ #
+# Latency proxy                  #
+# ------------------------------ #
+def _pipe(src, dst, delay):
+    try:
+        while True:
+            ready, _, _ = select.select([src], [], [], 1.0)
+            if not ready:
+                continue
+            data = src.recv(65536)
+            if not data:
+                break
+            if delay:
+                time.sleep(delay)
+            dst.sendall(data)
+    except OSError:
+        pass
+    finally:
+        for s in (src, dst):
+            try:
+                s.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+def start_latency_proxy(target_host, target_port, delay):
+    """ Forward a local port to Postgres, delaying each server response by `delay` seconds """
+    listener = socket.socket()
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(256)
+
+    def accept_loop():
+        while True:
+            client, _ = listener.accept()
+            upstream = socket.create_connection((target_host, target_port))
+            threading.Thread(target=_pipe, args=(client, upstream, 0), daemon=True).start()
+            threading.Thread(target=_pipe, args=(upstream, client, delay), daemon=True).start()
+
+    threading.Thread(target=accept_loop, daemon=True).start()
+    return listener.getsockname()[1]
+
+
+# ------------------------------ #
+# Server control                 #
+# ------------------------------ #
+def _rss_kb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def _children(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+
+
+def start_server(mode, port, workers, database_url, pool_max):
+    env = dict(os.environ, SERVE_MODE=mode, PORT=str(port), WEB_CONCURRENCY=str(workers),
+               DATABASE_URL=database_url, DB_POOL_MAX=str(pool_max))
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "python:Backend.gunicorn_conf", "Backend.app:app"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1).read()
+            return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f"gunicorn ({mode}) did not start")
+
+
+# ------------------------------ #
+# Load generator                 #
+# ------------------------------ #
+def drive(url, concurrency, duration):
+    latencies, errors = [], 0
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def client():
+        nonlocal errors
+        while time.perf_counter() < stop_at:
+            started = time.perf_counter()
+            try:
+                urllib.request.urlopen(url, timeout=60).read()
+                ok = True
+            except OSError:
+                ok = False
+            with lock:
+                if ok:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(client)
+    return latencies, errors, time.perf_counter() - started
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--path", default="/forms?limit=50")
+    parser.add_argument("--db-latency-ms", type=float, default=20)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--modes", default="sync,async")
+    args = parser.parse_args()
+
+    db = urlparse(os.environ["DATABASE_URL"])
+    proxy_port = start_latency_proxy(db.hostname or "localhost", db.port or 5432, args.db_latency_ms / 1000)
+    netloc = db.netloc.rsplit("@", 1)
+    host = f"127.0.0.1:{proxy_port}"
+    proxied_url = urlunparse(db._replace(netloc=f"{netloc[0]}@{host}" if len(netloc) == 2 else host))
+
+    print(f"{args.workers} workers, {args.concurrency} clients, {args.duration:.0f}s, "
+          f"GET {args.path}, +{args.db_latency_ms:.0f} ms per DB round trip")
+    print(f"{'mode':<8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}{'RSS MB':>9}")
+    for mode in args.modes.split(","):
+        # Sync workers can only use one connection each; async workers share a larger pool
+        pool_max = 1 if mode == "sync" else max(1, min(20, args.concurrency // args.workers))
+        proc = start_server(mode, args.port, args.workers, proxied_url, pool_max)
+        try:
+            latencies, errors, elapsed = drive(f"http://127.0.0.1:{args.port}{args.path}", args.concurrency,
+                                               args.duration)
+            rss = sum(_rss_kb(pid) for pid in _children(proc.pid)) / 1024
+        finally:
+            proc.send_signal(signal.SIGTERM)
+            proc.wait(timeout=30)
+        print(f"{mode:<8}{len(latencies) / elapsed:>9.1f}{percentile(latencies, 50) * 1000:>9.0f}"
+              f"{percentile(latencies, 95) * 1000:>9.0f}{percentile(latencies, 99) * 1000:>9.0f}"
+              f"{errors:>8}{rss:>9.1f}")
+        if latencies:
+            print(f"{'':<8}mean {statistics.mean(latencies) * 1000:.0f} ms over {len(latencies)} requests")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Cold-start cost of a worker: importing the app in a fresh interpreter, the
+first request to / and the process's peak RSS after it, for this tree and
+optionally an older git revision.
+
+    python -m Backend.benchmarks.bench_startup --runs 5 --ref HEAD~1
+
+Run from the directory that contains Backend/. No database is touched, but
+DATABASE_URL etc. are passed through so the app configures as it would in
+production. --ref exports that revision with git archive into a temporary
+directory and measures it the same way.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+PACKAGE = __package__.split(".")[0]
+# Libraries that should only be loaded by the code paths that need them
+HEAVY_MODULES = ("numpy", "pandas", "pyarrow", "openpyxl", "googleapiclient", "google.oauth2", "httplib2", "PIL", "boto3")
+
+PROBE = f"""
+import json, resource, sys, time
+started = time.perf_counter()
+from {PACKAGE}.app import app
+imported = time.perf_counter()
+app.test_client().get("/")
+served = time.perf_counter()
+print(json.dumps({{
+    "import_ms": (imported - started) * 1000,
+    "first_request_ms": (served - imported) * 1000,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "modules": len(sys.modules),
+    "heavy": [m for m in {HEAVY_MODULES!r} if m in sys.modules],
+}}))
+"""
+
+
+def measure(parent_dir, runs):
+    env = dict(os.environ, PYTHONPATH=str(parent_dir))
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", PROBE], env=env, cwd=parent_dir,
+                             capture_output=True, text=True, check=True).stdout
+        samples.append(json.loads(out.strip().splitlines()[-1]))
+    return {
+        "import_ms": statistics.median(s["import_ms"] for s in samples),
+        "first_request_ms": statistics.median(s["first_request_ms"] for s in samples),
+        "rss_mb": statistics.median(s["rss_mb"] for s in samples),
+        "modules": samples[-1]["modules"],
+        "heavy": samples[-1]["heavy"],
+    }
+
+
+def export_revision(ref, repo_dir, target):
+    package_dir = Path(target) / PACKAGE
+    package_dir.mkdir()
+    archive = subprocess.run(["git", "-C", str(repo_dir), "archive", ref], capture_output=True, check=True).stdout
+    subprocess.run(["tar", "-x", "-C", str(package_dir)], input=archive, check=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--ref", help="git revision to compare against, e.g. HEAD~1")
+    args = parser.parse_args()
+
+    package_dir = Path(__file__).absolute().parent.parent
+    targets = [("current", package_dir.parent)]
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.ref:
+            export_revision(args.ref, package_dir.resolve(), tmp)
+            targets.insert(0, (args.ref, Path(tmp)))
+
+        print(f"{'tree':<12}{'import':>10}{'first req':>11}{'rss':>9}{'modules':>9}  heavy modules loaded")
+        for label, parent_dir in targets:
+            r = measure(parent_dir, args.runs)
+            print(f"{label:<12}{r['import_ms']:>8.0f}ms{r['first_request_ms']:>9.1f}ms{r['rss_mb']:>7.1f}MB"
+                  f"{r['modules']:>9}  {', '.join(r['heavy']) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
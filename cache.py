@@ -0,0 +1,163 @@
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+# ------------------------------ #
+# In-process TTL cache           #
+# ------------------------------ #
+# Each cache is a bounded LRU whose entries expire after `ttl` seconds. Every
+# cache also has a generation number; invalidate() bumps it and entries filled
+# under an older generation are treated as misses. When CACHE_SHARED_FILE is
+# set the generations live in a small mmap'd file, so an invalidation in one
+# gunicorn worker is seen by all the others without any network round trip.
+
+_SLOTS = 64
+_SLOT = struct.Struct("Q")
+
+
+class LocalGenerations:
+    """ Generation counters visible to this process only """
+
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+        self._new_epoch()
+        # A worker forked from a preloaded master must not share its epoch
+        # with its siblings, since their counters diverge from here on
+        os.register_at_fork(after_in_child=self._new_epoch)
+
+    def _new_epoch(self):
+        # Tells these counters apart from any other set that also started at 0
+        self.epoch = int.from_bytes(os.urandom(8), "big")
+
+    def get(self, name):
+        return self._values.get(name, 0)
+
+    def bump(self, name):
+        with self._lock:
+            self._values[name] = self._values.get(name, 0) + 1
+
+
+class SharedGenerations:
+    """ Generation counters in a memory-mapped file shared by every worker on the host """
+
+    def __init__(self, path):
+        # One extra slot after the counters holds the file's random epoch
+        size = (_SLOTS + 1) * _SLOT.size
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self._map = mmap.mmap(fd, size)
+            if not _SLOT.unpack_from(self._map, _SLOTS * _SLOT.size)[0]:
+                _SLOT.pack_into(self._map, _SLOTS * _SLOT.size, int.from_bytes(os.urandom(8), "big") or 1)
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+        self._path = path
+        self.epoch = _SLOT.unpack_from(self._map, _SLOTS * _SLOT.size)[0]
+
+    @staticmethod
+    def _offset(name):
+        # Hash collisions only cause extra invalidations, never stale reads
+        return (zlib.crc32(name.encode()) % _SLOTS) * _SLOT.size
+
+    def get(self, name):
+        return _SLOT.unpack_from(self._map, self._offset(name))[0]
+
+    def bump(self, name):
+        offset = self._offset(name)
+        with open(self._path, "rb") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                _SLOT.pack_into(self._map, offset, _SLOT.unpack_from(self._map, offset)[0] + 1)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+_shared_file = os.getenv("CACHE_SHARED_FILE")
+generations = SharedGenerations(_shared_file) if _shared_file else LocalGenerations()
+
+_MISSING = object()
+
+
+class TTLCache:
+    def __init__(self, name, maxsize=128, ttl=60):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()   # key -> (expires_at, generation, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        generation = generations.get(self.name)
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                expires_at, entry_generation, value = entry
+                if expires_at > now and entry_generation == generation:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None, generation=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        if generation is None:
+            generation = generations.get(self.name)
+        with self._lock:
+            self._data[key] = (expires_at, generation, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_load(self, key, loader):
+        # Read the generation before loading so an invalidation that lands
+        # while the loader runs makes the stored value stale straight away
+        generation = generations.get(self.name)
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            self.set(key, value, generation=generation)
+        return value
+
+    def invalidate(self):
+        """ Drop every entry here and, through the generation, in other workers """
+        generations.bump(self.name)
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._data), "maxsize": self.maxsize, "ttl": self.ttl,
+                    "hits": self.hits, "misses": self.misses}
+
+
+_caches = {}
+
+
+def get_cache(name, maxsize=128, ttl=60):
+    """ Named cache, created on first use; sizes/TTLs can be overridden via CACHE_<NAME>_MAXSIZE/_TTL """
+    if name not in _caches:
+        prefix = f"CACHE_{name.upper()}_"
+        _caches[name] = TTLCache(
+            name,
+            maxsize=int(os.getenv(prefix + "MAXSIZE", maxsize)),
+            ttl=float(os.getenv(prefix + "TTL", ttl)),
+        )
+    return _caches[name]
+
+
+def cache_stats():
+    return {name: cache.stats() for name, cache in _caches.items()}
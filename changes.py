@@ -0,0 +1,242 @@
+"""
+Change feed for `reports`.
+
+    python -m Backend.changes prune   # drop log entries older than CHANGE_LOG_RETENTION_DAYS
+
+A trigger appends a row to report_changes for every insert, update and
+delete on reports (migration 11). /reports/changes?since=<cursor> returns
+what changed after the cursor, so clients keep a local copy in sync without
+re-fetching /forms, deletions included.
+
+The cursor is the (txid, id) of the last change returned. Sequence ids are
+handed out before commit, so a change with a lower id can become visible
+after one with a higher id; the feed therefore only returns changes whose
+transaction is older than every transaction still running (the snapshot
+xmin), in transaction id order. A long write transaction holds the feed
+back until it finishes; nothing is ever skipped.
+"""
+import os
+import select
+import sys
+import threading
+import time
+
+import psycopg2
+from psycopg2 import extensions, sql
+from psycopg2.extras import RealDictCursor
+
+from .db_connection import database_url, get_connection
+from .pagination import REPORT_COLUMNS, QueryError
+
+CHANGE_LOG_RETENTION_DAYS = float(os.getenv("CHANGE_LOG_RETENTION_DAYS", 30))
+CHANGES_PAGE_SIZE = 200
+CHANGES_MAX_PAGE_SIZE = 1000
+CHANGE_STREAM_ENABLED = os.getenv("CHANGE_STREAM_ENABLED", "0") == "1"
+CHANGE_STREAM_HEARTBEAT = float(os.getenv("CHANGE_STREAM_HEARTBEAT", 15))
+CHANGE_STREAM_MAX_SECONDS = float(os.getenv("CHANGE_STREAM_MAX_SECONDS", 300))
+
+NOTIFY_CHANNEL = "report_changes"
+
+OPS = {"I": "insert", "U": "update", "D": "delete"}
+
+# The page of log entries, then each report's current row; partition pruning
+# happens per entry through report_created_at
+CHANGES_QUERY = sql.SQL("""
+    WITH page AS (
+        SELECT id, txid, report_id, report_created_at, op FROM report_changes
+        WHERE (txid, id) > (%s, %s)
+          AND txid < pg_snapshot_xmin(pg_current_snapshot())::text::bigint
+        ORDER BY txid, id
+        LIMIT %s
+    )
+    SELECT page.id AS change_id, page.txid, page.report_id, page.op, r.id AS row_id, {columns}
+    FROM page
+    LEFT JOIN report_rows r ON page.op <> 'D' AND r.id = page.report_id AND r.created_at = page.report_created_at
+    ORDER BY page.txid, page.id
+""").format(columns=sql.SQL(", ").join(sql.SQL("r.") + sql.Identifier(c) for c in REPORT_COLUMNS if c != "id"))
+
+
+# ------------------------------ #
+# Cursors                        #
+# ------------------------------ #
+def encode_change_cursor(txid, change_id):
+    return f"{txid}-{change_id}"
+
+
+def decode_change_cursor(cursor):
+    txid, sep, change_id = cursor.partition("-")
+    if not sep or not txid.isdigit() or not change_id.isdigit():
+        raise QueryError("Invalid cursor")
+    return int(txid), int(change_id)
+
+
+def head_cursor(cur):
+    """ Cursor for "from now on": every change committed so far is behind it """
+    cur.execute("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint")
+    return encode_change_cursor(cur.fetchone()[0], 0)
+
+
+def cursor_expired(cur, position):
+    cur.execute("SELECT txid, change_id FROM report_changes_horizon")
+    horizon = cur.fetchone()
+    return horizon is not None and position < tuple(horizon)
+
+
+# ------------------------------ #
+# Feed                           #
+# ------------------------------ #
+def fetch_changes(conn, since, limit=CHANGES_PAGE_SIZE):
+    """
+    Changes after cursor `since`, oldest first, as (changes, cursor, has_more).
+    Several changes to one report in a page are folded into the last one.
+    Each change carries the report's current row; a report that no longer
+    exists is reported as deleted. Raises QueryError for a bad cursor.
+    """
+    position = decode_change_cursor(since)
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(CHANGES_QUERY, (*position, limit + 1))
+        rows = cur.fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if not rows:
+        return [], since, False
+
+    latest = {}
+    for row in rows:
+        latest.pop(row["report_id"], None)   # keep insertion order = last change
+        if row["row_id"] is None:
+            latest[row["report_id"]] = {"op": "delete", "id": row["report_id"], "report": None}
+        else:
+            report = {c: row[c] for c in REPORT_COLUMNS if c != "id"}
+            report["id"] = row["report_id"]
+            latest[row["report_id"]] = {"op": OPS[row["op"]], "id": row["report_id"], "report": report}
+    last = rows[-1]
+    return list(latest.values()), encode_change_cursor(last["txid"], last["change_id"]), has_more
+
+
+def log_partition_deletes(cur, partition):
+    """ Record every row of a partition about to be dropped as deleted (DROP fires no triggers) """
+    cur.execute(sql.SQL("""
+        INSERT INTO report_changes (report_id, report_created_at, op)
+        SELECT id, created_at, 'D' FROM {}
+    """).format(sql.Identifier(partition)))
+
+
+def prune_changes(conn, retention_days=CHANGE_LOG_RETENTION_DAYS):
+    """ Delete entries older than `retention_days` and move the horizon past them """
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT txid, id FROM report_changes
+            WHERE changed_at < NOW() - make_interval(secs => %s)
+            ORDER BY txid DESC, id DESC LIMIT 1
+        """, (retention_days * 86400,))
+        last = cur.fetchone()
+        if last is None:
+            conn.commit()
+            return 0
+        cur.execute("DELETE FROM report_changes WHERE (txid, id) <= (%s, %s)", last)
+        deleted = cur.rowcount
+        cur.execute("""
+            INSERT INTO report_changes_horizon (txid, change_id) VALUES (%s, %s)
+            ON CONFLICT (singleton) DO UPDATE SET txid = EXCLUDED.txid, change_id = EXCLUDED.change_id
+        """, last)
+        conn.commit()
+    return deleted
+
+
+# ------------------------------ #
+# Server-Sent Events             #
+# ------------------------------ #
+class ChangeHub:
+    """
+    One LISTEN connection per worker process, shared by every open stream.
+    The trigger's NOTIFY bumps `version` and wakes the streams, which then
+    read the log through the pool like any other request.
+    """
+
+    def __init__(self):
+        self.version = 0
+        self._cond = threading.Condition()
+        self._pid = None
+
+    def _ensure_listener(self):
+        with self._cond:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        threading.Thread(target=self._listen, name="report-changes-listener", daemon=True).start()
+
+    def _bump(self):
+        with self._cond:
+            self.version += 1
+            self._cond.notify_all()
+
+    def _listen(self):
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(database_url())
+                conn.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                # Anything may have changed while (re)connecting
+                self._bump()
+                while True:
+                    if select.select([conn], [], [], 60) != ([], [], []):
+                        conn.poll()
+                        if conn.notifies:
+                            conn.notifies.clear()
+                            self._bump()
+            except Exception as e:
+                print(f"WARNING: Change listener failed ({e}); reconnecting")
+                if conn is not None:
+                    conn.close()
+                time.sleep(5)
+
+    def wait(self, version, timeout):
+        """ Block until the version moves past `version` or `timeout` passes; returns the version """
+        self._ensure_listener()
+        with self._cond:
+            self._cond.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+
+change_hub = ChangeHub()
+
+
+def stream_changes(since, dumps, max_seconds=CHANGE_STREAM_MAX_SECONDS):
+    """
+    SSE events for the changes after `since`, as they are committed. Each
+    event's id is the cursor, so a reconnecting EventSource resumes from it
+    through Last-Event-ID. The stream ends after `max_seconds`.
+    """
+    deadline = time.monotonic() + max_seconds
+    version = change_hub.version
+    while time.monotonic() < deadline:
+        with get_connection() as conn:
+            changes, since, has_more = fetch_changes(conn, since)
+            conn.commit()
+        if changes:
+            yield f"id: {since}\nevent: changes\ndata: {dumps(changes)}\n\n"
+        if has_more:
+            continue
+        # Also re-reads after a quiet heartbeat, for changes that were held
+        # back behind a transaction that has finished since
+        new_version = change_hub.wait(version, min(CHANGE_STREAM_HEARTBEAT, max(0, deadline - time.monotonic())))
+        if new_version == version:
+            yield ": keep-alive\n\n"
+        version = new_version
+
+
+if __name__ == "__main__":
+    from .migrations import connect
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "prune"
+    conn = connect()
+    try:
+        if command == "prune":
+            print(f"Pruned {prune_changes(conn)} change log entries.")
+        else:
+            sys.exit(f"Unknown command: {command} (expected prune)")
+    finally:
+        conn.close()
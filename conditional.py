@@ -0,0 +1,136 @@
+import datetime
+import functools
+import hashlib
+
+import psycopg2
+from flask import g, has_request_context, make_response, request
+
+from .db_connection import get_connection
+
+# ------------------------------ #
+# Conditional Requests           #
+# ------------------------------ #
+# Every table a list endpoint reads has a row in `table_versions`
+# (migration 14), bumped by touch_tables() after each committed write: by
+# the routes, the background jobs and the CLI tools alike. The ETag of a
+# response is derived from those versions and the request URL, and
+# Last-Modified is when the newest of them changed, so every worker and
+# every process hands out the same validators. A poll that sends
+# If-None-Match (or If-Modified-Since) gets 304 Not Modified after one
+# primary-key lookup instead of the list query. That lookup is the price
+# of validators every process agrees on: caching the versions in a worker
+# would again miss writes made by the others. When the versions cannot be
+# read the response goes out without validators, never with stale ones.
+# Views that cache their body key it on table_version(), read here once
+# per request, so body and ETag always come from the same version.
+
+BUMP_VERSIONS = """
+    INSERT INTO table_versions (table_name)
+    SELECT unnest(%s::text[]) ORDER BY 1
+    ON CONFLICT (table_name) DO UPDATE SET
+        version = table_versions.version + 1,
+        changed_at = clock_timestamp()
+"""
+
+READ_VERSIONS = """
+    SELECT table_name, version, changed_at, EXTRACT(EPOCH FROM clock_timestamp() - changed_at)
+    FROM table_versions WHERE table_name = ANY(%s)
+"""
+
+
+def touch_tables(*tables):
+    """ Call after committing a write to `tables` """
+    try:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(BUMP_VERSIONS, (sorted(set(tables)),))
+            conn.commit()
+    except psycopg2.Error as e:
+        # The write itself is committed; failing the request would only invite a retry
+        print(f"WARNING: Could not bump versions of {', '.join(tables)}: {e}")
+    if has_request_context():
+        g.pop("table_versions", None)
+
+
+def table_versions(tables):
+    """
+    {table: (version, changed_at, age in seconds)} read from the primary, or
+    None when the database cannot be reached. Read once per request.
+    """
+    key = tuple(sorted(set(tables)))
+    cached = g.setdefault("table_versions", {}) if has_request_context() else {}
+    if key not in cached:
+        try:
+            with get_connection() as conn, conn.cursor() as cur:
+                cur.execute(READ_VERSIONS, (list(key),))
+                rows = cur.fetchall()
+                conn.commit()
+        except psycopg2.Error as e:
+            print(f"WARNING: Could not read table versions: {e}")
+            return None
+        versions = {table: (0, None, None) for table in key}
+        versions.update({name: (version, changed_at, float(age)) for name, version, changed_at, age in rows})
+        cached[key] = versions
+    return cached[key]
+
+
+def table_version(table):
+    """ Current version of `table`, or None when it cannot be read """
+    versions = table_versions([table])
+    return None if versions is None else versions[table][0]
+
+
+def table_validators(tables):
+    """ (etag, last_modified) for the current versions of `tables` and this request's URL, or None """
+    versions = table_versions(tables)
+    if versions is None:
+        return None
+    changed = [changed_at for _, changed_at, _ in versions.values() if changed_at is not None]
+    last_modified = max(changed).replace(microsecond=0) if changed else None
+    raw = f"{','.join(f'{t}={versions[t][0]}' for t in sorted(versions))}:{request.full_path}"
+    return hashlib.sha1(raw.encode()).hexdigest()[:20], last_modified
+
+
+def changed_within(tables, seconds):
+    """ Whether any of `tables` changed in the last `seconds`; True when that cannot be told """
+    versions = table_versions(tables)
+    if versions is None:
+        return True
+    return any(age is not None and age < seconds for _, _, age in versions.values())
+
+
+def _not_modified(etag, last_modified):
+    # If-None-Match wins when both are sent (RFC 9110 13.2.2)
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    since = request.if_modified_since
+    return since is not None and last_modified is not None and last_modified <= since
+
+
+def conditional(*tables):
+    """
+    Serve 304 Not Modified when the client's validators still match the
+    versions of `tables`, otherwise run the view and attach ETag and
+    Last-Modified to its 200 response. Put it below @require_auth.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            # Read before the view runs: a write that lands while it queries
+            # leaves this response with the older ETag, never the newer one
+            validators = table_validators(tables)
+            if validators is None:
+                return view(*args, **kwargs)
+            etag, last_modified = validators
+            if _not_modified(etag, last_modified):
+                response = make_response("", 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            response.last_modified = last_modified
+            # Revalidate on every use; some of these lists are behind auth
+            response.headers["Cache-Control"] = "private, no-cache"
+            return response
+        return wrapper
+    return decorator
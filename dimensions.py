@@ -0,0 +1,104 @@
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+
+from .cache import get_cache
+from .db_connection import get_connection
+
+# ------------------------------ #
+# Hostels and Teachers           #
+# ------------------------------ #
+# reports references teachers and hostels by id (teacher_id,
+# subordinate_teacher_id, hostel_id). The report_rows view joins the names
+# back under their old column names, so everything that reads reports for
+# clients selects from report_rows and returns the same fields as before.
+# Renaming a teacher or hostel is a single-row update.
+#
+# Names only seen in reports (subordinate teachers, hostels) get a row on
+# first use; teachers created that way have no password and cannot log in.
+
+# Report column -> (id column, dimension table, alias in report_rows)
+NAME_COLUMNS = {
+    "teacher_name": ("teacher_id", "teachers", "t"),
+    "subordinate_teacher_name": ("subordinate_teacher_id", "teachers", "s"),
+    "hostel_name": ("hostel_id", "hostels", "h"),
+}
+DIMENSION_TABLES = ("teachers", "hostels")
+
+# A name keeps its id unless the row is renamed; call forget_ids() then
+_id_caches = {table: get_cache(f"{table}_ids", maxsize=4096, ttl=3600) for table in DIMENSION_TABLES}
+
+
+def named_reports_select(columns, table="reports"):
+    """
+    SELECT of `columns` from `table` (reports or one of its partitions),
+    with name columns joined in from the dimension tables. LEFT JOINs let
+    the planner drop the joins when a query does not use the names.
+    """
+    columns = [
+        sql.SQL("{}.name AS {}").format(sql.Identifier(NAME_COLUMNS[c][2]), sql.Identifier(c))
+        if c in NAME_COLUMNS else sql.SQL("r.{}").format(sql.Identifier(c))
+        for c in columns
+    ]
+    joins = [
+        sql.SQL("LEFT JOIN {table} {alias} ON {alias}.id = r.{column}").format(
+            table=sql.Identifier(dimension), alias=sql.Identifier(alias), column=sql.Identifier(column))
+        for column, dimension, alias in NAME_COLUMNS.values()
+    ]
+    return sql.SQL("SELECT {columns} FROM {table} r {joins}").format(
+        columns=sql.SQL(", ").join(columns), table=sql.Identifier(table), joins=sql.SQL(" ").join(joins))
+
+
+def name_filter(column):
+    """
+    WHERE clause matching reports by a name column, taking the name as %s.
+    The id is looked up in a scalar subquery, so the planner can use the
+    (<id>, created_at, id) index; an unknown name matches nothing.
+    """
+    id_column, table, _ = NAME_COLUMNS[column]
+    return sql.SQL("{} = (SELECT id FROM {} WHERE name = %s)").format(sql.Identifier(id_column), sql.Identifier(table))
+
+
+def resolve_ids(table, names):
+    """ {name: id} for `names` in a dimension table, creating missing rows """
+    cache = _id_caches[table]
+    ids = {}
+    missing = []
+    for name in set(names):
+        cached = cache.get(name)
+        if cached is None:
+            missing.append(name)
+        else:
+            ids[name] = cached
+    if missing:
+        # Committed on its own connection, so a cached id always exists even
+        # if the report insert that needed it rolls back
+        with get_connection() as conn, conn.cursor() as cur:
+            execute_values(cur, sql.SQL("INSERT INTO {} (name) VALUES %s ON CONFLICT (name) DO NOTHING").format(
+                sql.Identifier(table)).as_string(cur), [(name,) for name in sorted(missing)])
+            cur.execute(sql.SQL("SELECT name, id FROM {} WHERE name = ANY(%s)").format(sql.Identifier(table)),
+                        (missing,))
+            found = dict(cur.fetchall())
+            conn.commit()
+        for name, row_id in found.items():
+            cache.set(name, row_id)
+        ids.update(found)
+    return ids
+
+
+def resolve_report_names(reports):
+    """
+    Add teacher_id, subordinate_teacher_id and hostel_id to report dicts
+    that carry the names (see submissions.validate_report).
+    """
+    for table in DIMENSION_TABLES:
+        columns = [(c, id_column) for c, (id_column, t, _) in NAME_COLUMNS.items() if t == table]
+        ids = resolve_ids(table, [r[c] for r in reports for c, _ in columns if r.get(c)])
+        for report in reports:
+            for column, id_column in columns:
+                report[id_column] = ids.get(report.get(column))
+    return reports
+
+
+def forget_ids(table):
+    """ Drop cached ids after names in `table` were changed or reused """
+    _id_caches[table].invalidate()
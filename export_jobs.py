@@ -0,0 +1,300 @@
+import datetime
+import os
+import select
+import signal
+import sys
+import time
+
+import jwt
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.extras import RealDictCursor
+
+from .auth_utils import SECRET_KEY
+from .db_connection import database_url, get_connection
+from .exports import count_period_rows, open_period_export, stream_export
+from .pagination import REPORT_COLUMNS
+
+# ------------------------------ #
+# Export Jobs                    #
+# ------------------------------ #
+# POST /exports queues a row in export_jobs and returns at once; a separate
+# worker process (python -m Backend.export_jobs work) claims pending rows
+# with SELECT ... FOR UPDATE SKIP LOCKED, so any number of workers can share
+# the table without handing out a job twice, and writes the file into
+# EXPORT_CACHE_DIR. The web process serves finished files from the same
+# directory, so both must run on the same host (see EXPORT_WORKER in
+# gunicorn_conf.py). A request matching a queued, running or recently
+# finished job gets that job back instead of a new one. Workers heartbeat
+# while exporting; a job whose worker died is requeued after
+# EXPORT_JOB_STALE_SECONDS, and failed after EXPORT_JOB_MAX_ATTEMPTS tries.
+
+EXPORT_CACHE_DIR = os.getenv("EXPORT_CACHE_DIR", "export_cache")
+EXPORT_CACHE_MAX_BYTES = int(os.getenv("EXPORT_CACHE_MAX_BYTES", 1024 ** 3))
+EXPORT_DEDUP_SECONDS = float(os.getenv("EXPORT_DEDUP_SECONDS", 300))
+EXPORT_JOB_STALE_SECONDS = float(os.getenv("EXPORT_JOB_STALE_SECONDS", 300))
+EXPORT_JOB_MAX_ATTEMPTS = int(os.getenv("EXPORT_JOB_MAX_ATTEMPTS", 3))
+EXPORT_POLL_SECONDS = float(os.getenv("EXPORT_POLL_SECONDS", 10))
+EXPORT_HEARTBEAT_SECONDS = float(os.getenv("EXPORT_HEARTBEAT_SECONDS", 2))
+EXPORT_DOWNLOAD_MINUTES = float(os.getenv("EXPORT_DOWNLOAD_MINUTES", 15))
+
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_EXPIRED = "expired"   # finished, but the file was evicted from the cache
+
+NOTIFY_CHANNEL = "export_jobs"
+
+JOB_FIELDS = """
+    id, period, year, format, status, attempts, rows_written, total_rows,
+    file_name, file_size, error, requested_by, created_at, started_at, finished_at
+"""
+
+
+def _file_path(file_name):
+    return os.path.join(EXPORT_CACHE_DIR, file_name)
+
+
+def enqueue_export(period, year, fmt, requested_by=None):
+    """
+    Queue an export and return (job, reused). `reused` is True when an
+    identical job was already queued or running, or finished within
+    EXPORT_DEDUP_SECONDS and its file is still cached.
+    """
+    with get_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+        # Serialises concurrent requests for the same export, so they cannot
+        # both miss the lookup and queue two jobs
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (f"export:{period}:{year}:{fmt}",))
+        cur.execute(f"""
+            SELECT {JOB_FIELDS} FROM export_jobs
+            WHERE period = %s AND year IS NOT DISTINCT FROM %s AND format = %s
+              AND (status IN (%s, %s) OR (status = %s AND finished_at > NOW() - make_interval(secs => %s)))
+            ORDER BY id DESC LIMIT 1
+        """, (period, year, fmt, JOB_PENDING, JOB_RUNNING, JOB_DONE, EXPORT_DEDUP_SECONDS))
+        job = cur.fetchone()
+        if job is not None and job["status"] == JOB_DONE and not os.path.exists(_file_path(job["file_name"])):
+            cur.execute("UPDATE export_jobs SET status = %s WHERE id = %s", (JOB_EXPIRED, job["id"]))
+            job = None
+        reused = job is not None
+        if job is None:
+            cur.execute(f"""
+                INSERT INTO export_jobs (period, year, format, requested_by)
+                VALUES (%s, %s, %s, %s) RETURNING {JOB_FIELDS}
+            """, (period, year, fmt, requested_by))
+            job = cur.fetchone()
+            cur.execute(f"NOTIFY {NOTIFY_CHANNEL}")
+        conn.commit()
+    return job, reused
+
+
+def get_job(job_id):
+    with get_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(f"SELECT {JOB_FIELDS} FROM export_jobs WHERE id = %s", (job_id,))
+        job = cur.fetchone()
+        conn.commit()
+    return job
+
+
+def job_progress(job):
+    """ Percent complete; the row count is an estimate until the job is done """
+    if job["status"] in (JOB_DONE, JOB_EXPIRED):
+        return 100
+    if job["status"] != JOB_RUNNING or not job["total_rows"]:
+        return 0
+    return min(99, int(100 * job["rows_written"] / job["total_rows"]))
+
+
+def download_token(job_id):
+    """ Short-lived token for the download URL, so it works without an Authorization header """
+    exp = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(minutes=EXPORT_DOWNLOAD_MINUTES)
+    return jwt.encode({"export": job_id, "typ": "export", "exp": exp}, SECRET_KEY, algorithm="HS256")
+
+
+def check_download_token(token, job_id):
+    try:
+        decoded = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+    except jwt.InvalidTokenError:
+        return False
+    return decoded.get("typ") == "export" and decoded.get("export") == job_id
+
+
+def cached_file(job):
+    """ Path of a finished job's file, or None when it is not (or no longer) available """
+    if job is None or job["status"] != JOB_DONE:
+        return None
+    path = _file_path(job["file_name"])
+    return path if os.path.exists(path) else None
+
+
+# ------------------------------ #
+# Worker                         #
+# ------------------------------ #
+def claim_job():
+    """ Mark the oldest pending job running and return it, or None """
+    with get_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(f"""
+            UPDATE export_jobs SET status = %s, attempts = attempts + 1, rows_written = 0,
+                error = NULL, started_at = NOW(), heartbeat_at = NOW()
+            WHERE id = (
+                SELECT id FROM export_jobs WHERE status = %s
+                ORDER BY id FOR UPDATE SKIP LOCKED LIMIT 1
+            )
+            RETURNING {JOB_FIELDS}
+        """, (JOB_RUNNING, JOB_PENDING))
+        job = cur.fetchone()
+        conn.commit()
+    return job
+
+
+def _update_job(job, fields, status=JOB_RUNNING):
+    """ Update a job this worker still owns; False once it was requeued to someone else """
+    assignments = ", ".join(f"{name} = %s" for name in fields)
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute(f"""
+            UPDATE export_jobs SET {assignments}, heartbeat_at = NOW()
+            WHERE id = %s AND attempts = %s AND status = %s
+        """, (*fields.values(), job["id"], job["attempts"], status))
+        owned = cur.rowcount == 1
+        conn.commit()
+    return owned
+
+
+def _counted(job, batches):
+    """ Pass batches through, recording progress and a heartbeat every few seconds """
+    written = 0
+    reported_at = time.monotonic()
+    for batch in batches:
+        written += len(batch)
+        yield batch
+        if time.monotonic() - reported_at >= EXPORT_HEARTBEAT_SECONDS:
+            if not _update_job(job, {"rows_written": written}):
+                raise RuntimeError("job was requeued by another worker")
+            reported_at = time.monotonic()
+    job["rows_written"] = written
+
+
+def run_job(job):
+    os.makedirs(EXPORT_CACHE_DIR, exist_ok=True)
+    file_name = f"export-{job['id']}.{job['format']}"
+    tmp_path = _file_path(f".{file_name}.{os.getpid()}.tmp")
+    started = time.perf_counter()
+    try:
+        _update_job(job, {"total_rows": count_period_rows(job["period"], job["year"])})
+        export = open_period_export(job["period"], job["year"])
+        # An empty period still produces a file with just the header row
+        columns, batches = export if export is not None else (list(REPORT_COLUMNS), iter(()))
+        with open(tmp_path, "wb") as f:
+            for chunk in stream_export(job["format"], columns, _counted(job, batches)):
+                f.write(chunk)
+        os.replace(tmp_path, _file_path(file_name))
+        done = _update_job(job, {
+            "status": JOB_DONE, "rows_written": job["rows_written"], "total_rows": job["rows_written"],
+            "file_name": file_name, "file_size": os.path.getsize(_file_path(file_name)),
+            "finished_at": datetime.datetime.now(datetime.timezone.utc),
+        })
+        print(f"Export job {job['id']} {'done' if done else 'discarded'}: "
+              f"{job['rows_written']} rows in {time.perf_counter() - started:.1f}s")
+    except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        retry = job["attempts"] < EXPORT_JOB_MAX_ATTEMPTS
+        _update_job(job, {"status": JOB_PENDING if retry else JOB_FAILED, "error": str(e)[:1000]})
+        print(f"ERROR: Export job {job['id']} attempt {job['attempts']} failed: {e}")
+
+
+def requeue_stale(stale_seconds=EXPORT_JOB_STALE_SECONDS):
+    """ Requeue (or fail) running jobs whose worker stopped heartbeating """
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+            UPDATE export_jobs
+            SET status = CASE WHEN attempts < %s THEN %s ELSE %s END, error = 'worker stopped responding'
+            WHERE status = %s AND heartbeat_at < NOW() - make_interval(secs => %s)
+            RETURNING id
+        """, (EXPORT_JOB_MAX_ATTEMPTS, JOB_PENDING, JOB_FAILED, JOB_RUNNING, stale_seconds))
+        stale = [row[0] for row in cur.fetchall()]
+        conn.commit()
+    if stale:
+        print(f"WARNING: Requeued stale export jobs {stale}")
+    return stale
+
+
+def evict_cache(max_bytes=EXPORT_CACHE_MAX_BYTES):
+    """ Delete the least recently written files until the cache fits in `max_bytes` """
+    try:
+        entries = [e for e in os.scandir(EXPORT_CACHE_DIR) if e.is_file() and e.name.startswith("export-")]
+    except FileNotFoundError:
+        return []
+    files = sorted(((e.stat().st_mtime, e.stat().st_size, e.name) for e in entries))
+    total = sum(size for _, size, _ in files)
+    evicted = []
+    for _, size, name in files:
+        if total <= max_bytes:
+            break
+        os.remove(_file_path(name))
+        total -= size
+        evicted.append(name)
+    if evicted:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute("UPDATE export_jobs SET status = %s WHERE status = %s AND file_name = ANY(%s)",
+                        (JOB_EXPIRED, JOB_DONE, evicted))
+            conn.commit()
+        print(f"Evicted {len(evicted)} cached export(s)")
+    return evicted
+
+
+def run_pending(stopping=()):
+    """ Run queued jobs until none are left (or `stopping` is set); returns how many ran """
+    ran = 0
+    while not stopping:
+        job = claim_job()
+        if job is None:
+            return ran
+        run_job(job)
+        evict_cache()
+        ran += 1
+    return ran
+
+
+def work(poll_seconds=EXPORT_POLL_SECONDS):
+    """
+    Run jobs as they are queued until SIGTERM/SIGINT. NOTIFY wakes the
+    worker straight away; polling covers notifications missed while it was
+    busy or reconnecting, and stale-job recovery.
+    """
+    stopping = []
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: stopping.append(True))
+    # Signals also write to this pipe, which ends the wait in select()
+    wakeup, wakeup_w = os.pipe()
+    os.set_blocking(wakeup_w, False)
+    signal.set_wakeup_fd(wakeup_w)
+
+    listener = psycopg2.connect(database_url())
+    listener.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+    with listener.cursor() as cur:
+        cur.execute(f"LISTEN {NOTIFY_CHANNEL}")
+    print(f"Export worker {os.getpid()} waiting for jobs")
+    try:
+        while not stopping:
+            requeue_stale()
+            run_pending(stopping)
+            ready, _, _ = select.select([listener, wakeup], [], [], poll_seconds)
+            if listener in ready:
+                listener.poll()
+                listener.notifies.clear()
+    finally:
+        listener.close()
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "work"
+    if command == "work":
+        work()
+    elif command == "once":
+        requeue_stale()
+        print(f"Ran {run_pending()} export job(s).")
+    elif command == "evict":
+        print(f"Evicted {len(evict_cache())} file(s).")
+    else:
+        sys.exit(f"Unknown command: {command} (expected work, once or evict)")
@@ -0,0 +1,336 @@
+import csv
+import datetime
+import decimal
+import io
+import os
+import re
+import uuid
+import zipfile
+from xml.sax.saxutils import escape
+from zoneinfo import ZoneInfo
+
+from psycopg2 import sql
+
+from .db_connection import get_read_connection
+from .pagination import REPORT_COLUMNS, QueryError
+from .partitions import archived_batches
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 2000))
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+PERIOD_INTERVALS = {
+    "weekly": "7 days",
+    "monthly": "1 month",
+    "yearly": "1 year",
+}
+
+EXPORT_FORMATS = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def parse_export_params(period, fmt, year):
+    """ Validate /download and /exports parameters; returns year as int or None, raises QueryError """
+    if period not in PERIOD_INTERVALS:
+        raise QueryError("Invalid period")
+    if fmt not in EXPORT_FORMATS:
+        raise QueryError("Invalid format")
+    if year is None:
+        return None
+    year = str(year)
+    if period != "yearly" or not year.isdigit() or not 1900 < int(year) < 10000:
+        raise QueryError("Invalid year")
+    return int(year)
+
+
+def build_export_query(period):
+    """
+    Report rows (with names, from report_rows) for an export period. Excel
+    cannot store timezone-aware datetimes, so created_at is converted to the
+    session's wall-clock time by Postgres for the whole result set instead
+    of row by row in Python.
+    """
+    interval = PERIOD_INTERVALS.get(period)
+    if not interval:
+        return None
+    return sql.SQL("SELECT {} FROM report_rows WHERE created_at >= NOW() - INTERVAL {} ORDER BY created_at, id").format(
+        _export_columns(), sql.Literal(interval)
+    )
+
+
+def build_range_export_query(bounded=False):
+    """ Rows with created_at >= %s (and < %s when bounded); the bounds let the planner prune partitions """
+    upper = sql.SQL(" AND created_at < %s") if bounded else sql.SQL("")
+    return sql.SQL("SELECT {} FROM report_rows WHERE created_at >= %s{} ORDER BY created_at, id").format(
+        _export_columns(), upper
+    )
+
+
+def _export_columns():
+    return sql.SQL(", ").join(
+        sql.SQL("created_at AT TIME ZONE current_setting('TimeZone') AS created_at")
+        if c == "created_at" else sql.Identifier(c)
+        for c in REPORT_COLUMNS
+    )
+
+
+def iter_row_batches(query, params=None, batch_size=EXPORT_BATCH_SIZE, primary=False):
+    """
+    Run `query` on a server-side (named) cursor and yield the column names
+    followed by lists of at most `batch_size` rows. The pooled connection
+    (a read replica's unless `primary`) is held until the generator is
+    exhausted or closed.
+    """
+    with get_read_connection(primary) as conn:
+        with conn.cursor(name=f"export_{uuid.uuid4().hex}") as cur:
+            cur.itersize = batch_size
+            cur.execute(query, params)
+            batch = cur.fetchmany(batch_size)
+            yield [desc[0] for desc in cur.description]
+            while batch:
+                yield batch
+                batch = cur.fetchmany(batch_size)
+        conn.commit()
+
+
+def open_export(query, params=None, batch_size=EXPORT_BATCH_SIZE, primary=False):
+    """
+    Start an export and return (columns, batches) or None when the query
+    returned no rows. `batches` is a generator that still owns the DB cursor.
+    """
+    batches = iter_row_batches(query, params, batch_size, primary)
+    columns = next(batches)
+    first = next(batches, None)
+    if first is None:
+        batches.close()
+        return None
+
+    def chained():
+        yield first
+        yield from batches
+
+    return columns, chained()
+
+
+def _year_bounds(cur, year):
+    """ (time zone, start, end) of the last year (end None) or of calendar `year` """
+    if year is None:
+        cur.execute("SELECT current_setting('TimeZone'), NOW() - INTERVAL '1 year', NULL::timestamptz")
+    else:
+        cur.execute("""
+            SELECT current_setting('TimeZone'),
+                make_timestamptz(%s, 1, 1, 0, 0, 0), make_timestamptz(%s, 1, 1, 0, 0, 0)
+        """, (year, year + 1))
+    return cur.fetchone()
+
+
+def open_period_export(period, year=None, primary=False):
+    """ open_export / open_yearly_export for a /download period; None when empty """
+    if period == "yearly":
+        return open_yearly_export(year, primary=primary)
+    return open_export(build_export_query(period), primary=primary)
+
+
+def count_period_rows(period, year=None, primary=False):
+    """ Rows a period export will contain from the live table (archived months not included) """
+    with get_read_connection(primary) as conn, conn.cursor() as cur:
+        if period == "yearly":
+            _, start, end = _year_bounds(cur, year)
+            cur.execute("SELECT count(*) FROM reports WHERE created_at >= %s AND (%s::timestamptz IS NULL OR created_at < %s)",
+                        (start, end, end))
+        else:
+            cur.execute(sql.SQL("SELECT count(*) FROM reports WHERE created_at >= NOW() - INTERVAL {}").format(
+                sql.Literal(PERIOD_INTERVALS[period])))
+        count = cur.fetchone()[0]
+        conn.commit()
+    return count
+
+
+def open_yearly_export(year=None, batch_size=EXPORT_BATCH_SIZE, primary=False):
+    """
+    Like open_export for the last year, or calendar `year` in the database's
+    time zone, including months that retention has moved to archive files.
+    Archived months are always older than the live partitions, so their rows
+    come first and the output stays in created_at order.
+    """
+    with get_read_connection(primary) as conn, conn.cursor() as cur:
+        tz_name, start, end = _year_bounds(cur, year)
+        conn.commit()
+
+    archived = archived_batches(start, end, tz=ZoneInfo(tz_name), batch_size=batch_size)
+    first = next(archived, None)
+    params = [start] if end is None else [start, end]
+    live = open_export(build_range_export_query(bounded=end is not None), params, batch_size, primary)
+    if first is None and live is None:
+        return None
+
+    def chained():
+        if first is not None:
+            yield first
+            yield from archived
+        if live is not None:
+            yield from live[1]
+
+    return list(REPORT_COLUMNS), chained()
+
+
+def stream_csv(columns, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for batch in batches:
+        writer.writerows(batch)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+
+
+# ------------------------------ #
+# Streaming XLSX                 #
+# ------------------------------ #
+# An XLSX file is a zip of XML parts. The sheet is written as one deflated
+# zip entry while rows arrive (sizes go in data descriptors, so the zip
+# needs no seeking), and the compressed bytes are sent as soon as a chunk
+# is ready. The first byte leaves before the query has finished and memory
+# does not grow with the export. Strings are written inline, never as
+# formulas, so a cell that starts with "=" stays text.
+_XLSX_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'
+    ),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Sheet" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '<Relationship Id="rId2" Target="styles.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles"/>'
+        '</Relationships>'
+    ),
+    # Style 1 is the date-time format openpyxl used for created_at
+    "xl/styles.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<numFmts count="1"><numFmt numFmtId="164" formatCode="yyyy-mm-dd h:mm:ss"/></numFmts>'
+        '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+        '<fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+        '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+        '</styleSheet>'
+    ),
+}
+_SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_SHEET_END = '</sheetData></worksheet>'
+_EXCEL_EPOCH = datetime.datetime(1899, 12, 30)
+# Control characters XML 1.0 cannot carry (openpyxl refused them too)
+_ILLEGAL_XML_CHARS = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def _column_letter(index):
+    letters = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def _xlsx_cell(ref, value):
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return f'<c r="{ref}" t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float, decimal.Decimal)):
+        return f'<c r="{ref}"><v>{value}</v></c>'
+    if isinstance(value, datetime.datetime):
+        return f'<c r="{ref}" s="1"><v>{(value - _EXCEL_EPOCH) / datetime.timedelta(days=1)!r}</v></c>'
+    text = escape(_ILLEGAL_XML_CHARS.sub("", str(value)))
+    return f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_row(letters, number, values):
+    cells = "".join(_xlsx_cell(f"{letter}{number}", value) for letter, value in zip(letters, values))
+    return f'<row r="{number}">{cells}</row>'
+
+
+class _ChunkSink(io.RawIOBase):
+    """ Write-only, unseekable file that collects what zipfile writes until it is drained """
+
+    def __init__(self):
+        self._parts = []
+        self.size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self._parts)
+        self._parts.clear()
+        self.size = 0
+        return data
+
+
+def stream_xlsx(columns, batches):
+    """ Write the rows as an XLSX file, yielding compressed chunks as they are produced """
+    letters = [_column_letter(i) for i in range(len(columns))]
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, content in _XLSX_PARTS.items():
+            archive.writestr(name, content)
+        with archive.open("xl/worksheets/sheet1.xml", "w") as sheet:
+            sheet.write(_SHEET_START.encode())
+            sheet.write(_xlsx_row(letters, 1, columns).encode("utf-8"))
+            number = 1
+            for batch in batches:
+                rows = []
+                for values in batch:
+                    number += 1
+                    rows.append(_xlsx_row(letters, number, values))
+                sheet.write("".join(rows).encode("utf-8"))
+                if sink.size >= EXPORT_CHUNK_SIZE:
+                    yield sink.drain()
+            sheet.write(_SHEET_END.encode())
+    yield sink.drain()
+
+
+def stream_export(fmt, columns, batches):
+    if fmt == "csv":
+        return stream_csv(columns, batches)
+    return stream_xlsx(columns, batches)
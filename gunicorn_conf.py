@@ -0,0 +1,80 @@
+"""
+Gunicorn settings, selected with SERVE_MODE:
+
+    gunicorn -c python:Backend.gunicorn_conf Backend.app:app
+
+sync  (default) - the classic one-request-per-worker setup.
+async           - gevent workers. Sockets are cooperative and psycopg2 is
+                  switched to non-blocking mode through psycogreen, so a
+                  worker keeps serving other requests while one waits on
+                  Postgres, Drive or a long export. Every route works in
+                  both modes, with two differences under the hood:
+                  CPU-bound work (password hashing, image processing) runs
+                  on real OS threads (native_threads.py), and psycopg2
+                  cannot COPY, so account imports and the analytics
+                  snapshot fall back to batched INSERTs and a server-side
+                  cursor (db_connection.copy_available). Both are covered
+                  by tests/test_async_mode.py.
+
+PRELOAD_APP=1 (sync mode only) imports the app once in the master before
+forking workers, so they boot faster and share its memory copy-on-write.
+Everything that holds sockets or threads (connection pool, thread pools,
+Drive client, change listener) is created per process on first use, and
+cache epochs are re-randomised in each worker, so preloading is safe. It
+is not used with gevent, which has to patch the standard library before
+the app is imported.
+
+EXPORT_WORKER=embedded also starts the export job worker
+(python -m Backend.export_jobs work) next to the web workers, for hosts
+where a separate worker service would not share EXPORT_CACHE_DIR.
+"""
+import os
+import subprocess
+import sys
+
+SERVE_MODE = os.getenv("SERVE_MODE", "sync")
+EXPORT_WORKER = os.getenv("EXPORT_WORKER", "separate")
+
+bind = f"0.0.0.0:{os.getenv('PORT', 8000)}"
+workers = int(os.getenv("WEB_CONCURRENCY", 1))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
+
+preload_app = SERVE_MODE != "async" and os.getenv("PRELOAD_APP", "0") == "1"
+
+if SERVE_MODE == "async":
+    worker_class = "gevent"
+    # Concurrent requests per worker; keep DB_POOL_MAX in step so greenlets
+    # wait on the pool rather than opening more connections than Postgres allows
+    worker_connections = int(os.getenv("WORKER_CONNECTIONS", 200))
+
+
+def post_worker_init(worker):
+    if SERVE_MODE == "async":
+        # gevent has already monkey-patched sockets; this makes libpq wait on
+        # the gevent hub instead of blocking the whole worker
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+
+    # Retries image uploads whose worker died before finishing them
+    from Backend.image_jobs import start_upload_recovery
+    start_upload_recovery()
+
+
+_export_worker = None
+
+
+def when_ready(server):
+    global _export_worker
+    if EXPORT_WORKER == "embedded":
+        _export_worker = subprocess.Popen([sys.executable, "-m", "Backend.export_jobs", "work"])
+        server.log.info("Started export worker (pid %s)", _export_worker.pid)
+
+
+def on_exit(server):
+    if _export_worker is not None and _export_worker.poll() is None:
+        # The worker finishes the job in hand; one killed mid-way is requeued
+        _export_worker.terminate()
+        try:
+            _export_worker.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            _export_worker.kill()
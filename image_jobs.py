@@ -0,0 +1,210 @@
+import os
+import random
+import threading
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import psycopg2
+from PIL import Image
+
+from .conditional import touch_tables
+from .db_connection import get_connection
+from .images import process_image, processed_filename
+from .metrics import observe_upload
+from .native_threads import run_cpu_bound
+from .storage import get_storage
+
+# ------------------------------ #
+# Background Image Uploads       #
+# ------------------------------ #
+# submit_form commits the report with image_status = 'pending' and hands the
+# image bytes to this per-worker thread pool. The upload is retried with
+# exponential backoff; on success the row gets its image_url (plus a
+# thumbnail_url when the image could be processed) and 'done', after the last
+# failed attempt it is marked 'failed'.
+#
+# The bytes are also saved in `image_uploads` in the same transaction as the
+# report and deleted with the final status, so an upload lost with its worker
+# (crash, deploy, OOM kill) is not lost for good. Every worker runs a
+# recovery thread that claims uploads left unfinished for
+# IMAGE_UPLOAD_STALE_SECONDS and queues them again, up to
+# IMAGE_UPLOAD_MAX_RECOVERIES times before the report is marked 'failed'.
+
+IMAGE_STATUS_PENDING = "pending"
+IMAGE_STATUS_DONE = "done"
+IMAGE_STATUS_FAILED = "failed"
+
+UPLOAD_WORKERS = int(os.getenv("IMAGE_UPLOAD_WORKERS", 2))
+UPLOAD_ATTEMPTS = int(os.getenv("IMAGE_UPLOAD_ATTEMPTS", 4))
+UPLOAD_BACKOFF = float(os.getenv("IMAGE_UPLOAD_BACKOFF", 1.0))
+UPLOAD_STALE_SECONDS = float(os.getenv("IMAGE_UPLOAD_STALE_SECONDS", 900))
+UPLOAD_MAX_RECOVERIES = int(os.getenv("IMAGE_UPLOAD_MAX_RECOVERIES", 3))
+UPLOAD_RECOVERY_SECONDS = float(os.getenv("IMAGE_UPLOAD_RECOVERY_SECONDS", 300))
+# Claimed uploads are held in memory until re-queued, so claim a few at a time
+UPLOAD_RECOVERY_BATCH = int(os.getenv("IMAGE_UPLOAD_RECOVERY_BATCH", 20))
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    # Threads do not survive a fork, so each gunicorn worker builds its own pool
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix="image-upload")
+            _executor_pid = os.getpid()
+    return _executor
+
+
+def save_pending_upload(cur, report_id, data, filename, mimetype):
+    """ Keep the image of a report being inserted on `cur` until its upload finishes """
+    cur.execute("""
+        INSERT INTO image_uploads (report_id, data, filename, mimetype) VALUES (%s, %s, %s, %s)
+    """, (report_id, psycopg2.Binary(data), filename, mimetype))
+
+
+def _set_image_result(report_id, status, image_url=None, thumbnail_url=None):
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+            UPDATE reports SET image_status = %s,
+                image_url = COALESCE(%s, image_url),
+                thumbnail_url = COALESCE(%s, thumbnail_url)
+            WHERE id = %s
+        """, (status, image_url, thumbnail_url, report_id))
+        cur.execute("DELETE FROM image_uploads WHERE report_id = %s", (report_id,))
+        conn.commit()
+    touch_tables("reports")
+
+
+def upload_with_retry(data, filename, mimetype, attempts=UPLOAD_ATTEMPTS, backoff=UPLOAD_BACKOFF):
+    """ Upload through the configured storage backend, backing off between failures """
+    storage = get_storage()
+    for attempt in range(1, attempts + 1):
+        started = time.perf_counter()
+        try:
+            url = storage.upload(data, filename, mimetype)
+            observe_upload(storage.name, started, ok=True)
+            return url
+        except Exception as e:
+            observe_upload(storage.name, started, ok=False)
+            if attempt == attempts:
+                raise
+            delay = backoff * 2 ** (attempt - 1) * (1 + random.random() / 2)
+            print(f"WARNING: Image upload attempt {attempt} failed ({e}); retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def _process_upload(report_id, data, filename, mimetype):
+    try:
+        processed = run_cpu_bound(process_image, data)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        # Not something Pillow can decode; store the original untouched
+        print(f"WARNING: Could not process image for report {report_id}: {e}")
+        processed = None
+
+    image_url = thumbnail_url = None
+    try:
+        if processed:
+            image_url = upload_with_retry(
+                processed.data, processed_filename(filename, "", processed.extension), processed.mimetype)
+            thumbnail_url = upload_with_retry(
+                processed.thumbnail, processed_filename(filename, "_thumb", processed.extension), processed.mimetype)
+        else:
+            image_url = upload_with_retry(data, filename, mimetype)
+        status = IMAGE_STATUS_DONE
+    except Exception as e:
+        print(f"ERROR: Image upload for report {report_id} failed: {e}")
+        status = IMAGE_STATUS_FAILED
+    try:
+        _set_image_result(report_id, status, image_url, thumbnail_url)
+    except Exception as e:
+        print(f"ERROR: Could not record image status for report {report_id}: {e}")
+
+
+def enqueue_image_upload(report_id, data, filename, mimetype):
+    """ Schedule the upload for an already committed report; returns the Future """
+    return _get_executor().submit(_process_upload, report_id, data, filename, mimetype)
+
+
+# ------------------------------ #
+# Recovering Lost Uploads        #
+# ------------------------------ #
+def recover_image_uploads(stale_seconds=UPLOAD_STALE_SECONDS, limit=UPLOAD_RECOVERY_BATCH):
+    """
+    Claim uploads unfinished for `stale_seconds` and queue them again in
+    this worker, or mark their reports 'failed' once they have been
+    recovered UPLOAD_MAX_RECOVERIES times. Returns ({report id: Future}
+    of the requeued uploads, [failed report ids]).
+    """
+    with get_connection() as conn, conn.cursor() as cur:
+        # Claiming resets claimed_at, so other workers leave these alone
+        cur.execute("""
+            UPDATE image_uploads SET attempts = attempts + 1, claimed_at = NOW()
+            WHERE report_id IN (
+                SELECT report_id FROM image_uploads
+                WHERE claimed_at < NOW() - make_interval(secs => %s)
+                ORDER BY report_id FOR UPDATE SKIP LOCKED LIMIT %s
+            )
+            RETURNING report_id, attempts, data, filename, mimetype
+        """, (stale_seconds, limit))
+        claimed = cur.fetchall()
+        conn.commit()
+
+    requeued, failed = {}, []
+    for report_id, attempts, data, filename, mimetype in claimed:
+        if attempts > UPLOAD_MAX_RECOVERIES:
+            _set_image_result(report_id, IMAGE_STATUS_FAILED)
+            failed.append(report_id)
+        else:
+            requeued[report_id] = enqueue_image_upload(report_id, bytes(data), filename, mimetype)
+    if requeued or failed:
+        print(f"WARNING: Recovered lost image uploads: requeued {list(requeued)}, failed {failed}")
+    return requeued, failed
+
+
+def recover_all_image_uploads():
+    """ Recover batch after batch, finishing each before claiming the next; returns the counts """
+    total_requeued = total_failed = 0
+    while True:
+        requeued, failed = recover_image_uploads()
+        wait(requeued.values())
+        total_requeued += len(requeued)
+        total_failed += len(failed)
+        if len(requeued) + len(failed) < UPLOAD_RECOVERY_BATCH:
+            return total_requeued, total_failed
+
+
+_recovery_pid = None
+_recovery_lock = threading.Lock()
+
+
+def start_upload_recovery(interval=UPLOAD_RECOVERY_SECONDS):
+    """ Recover lost uploads now and every `interval` seconds in this process """
+    global _recovery_pid
+    with _recovery_lock:
+        if _recovery_pid == os.getpid():
+            return
+        _recovery_pid = os.getpid()
+
+    def loop():
+        while True:
+            try:
+                recover_all_image_uploads()
+            except Exception as e:
+                print(f"WARNING: Image upload recovery failed: {e}")
+            # Jitter keeps the workers from sweeping in lockstep
+            time.sleep(interval * (0.5 + random.random()))
+
+    threading.Thread(target=loop, name="image-upload-recovery", daemon=True).start()
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "recover"
+    if command == "recover":
+        requeued, failed = recover_all_image_uploads()
+        print(f"Retried {requeued} lost image upload(s); marked {failed} report(s) failed.")
+    else:
+        sys.exit(f"Unknown command: {command} (expected recover)")
@@ -0,0 +1,114 @@
+"""
+Copy report images from Google Drive into the content-addressed store.
+
+    python -m Backend.image_migration status   # count reports still pointing at Drive
+    python -m Backend.image_migration drive    # copy them and repoint image_url/thumbnail_url
+
+Images go to the blob store behind /images (IMAGE_S3_BUCKET or
+IMAGE_STORAGE_DIR, see storage.py) whatever IMAGE_STORAGE is set to, so
+the copy can run before new uploads are switched over. Reports are read in
+(created_at, id) order, IMAGE_MIGRATION_BATCH at a time, and their files
+downloaded on IMAGE_MIGRATION_WORKERS threads. Each URL is only replaced if
+it is still the Drive link that was copied, so reports edited meanwhile are
+left alone. A file that fails to copy keeps its Drive link and is picked up
+by the next run; nothing is deleted from Drive.
+"""
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from psycopg2 import sql
+
+from .conditional import touch_tables
+from .storage import ContentAddressedStorage, download_drive_file, get_blob_store
+
+DRIVE_URL_PREFIX = "https://drive.google.com/uc?id="
+IMAGE_MIGRATION_WORKERS = int(os.getenv("IMAGE_MIGRATION_WORKERS", 4))
+IMAGE_MIGRATION_BATCH = int(os.getenv("IMAGE_MIGRATION_BATCH", 200))
+
+URL_COLUMNS = ("image_url", "thumbnail_url")
+
+DRIVE_REPORTS_QUERY = """
+    SELECT id, created_at, image_url, thumbnail_url FROM reports
+    WHERE (created_at, id) > (%s, %s) AND (image_url LIKE %s OR thumbnail_url LIKE %s)
+    ORDER BY created_at, id
+    LIMIT %s
+"""
+
+
+def drive_file_id(url):
+    """ The Drive file id of a drive.google.com/uc link, or None for any other URL """
+    if not url or not url.startswith(DRIVE_URL_PREFIX):
+        return None
+    return url[len(DRIVE_URL_PREFIX):].split("&", 1)[0] or None
+
+
+def count_drive_reports(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT COUNT(*) FROM reports WHERE image_url LIKE %s OR thumbnail_url LIKE %s",
+                    (DRIVE_URL_PREFIX + "%",) * 2)
+        count = cur.fetchone()[0]
+    conn.rollback()
+    return count
+
+
+def _copy(store, url):
+    data = download_drive_file(drive_file_id(url))
+    return store.upload(data, None, None)
+
+
+def migrate_drive_images(conn, workers=IMAGE_MIGRATION_WORKERS, batch_size=IMAGE_MIGRATION_BATCH):
+    """ Copy every Drive image referenced by a report; returns (urls replaced, urls failed) """
+    store = ContentAddressedStorage(get_blob_store())
+    pattern = DRIVE_URL_PREFIX + "%"
+    position = ("-infinity", 0)
+    replaced = failed = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image-migration") as executor:
+        while True:
+            with conn.cursor() as cur:
+                cur.execute(DRIVE_REPORTS_QUERY, (*position, pattern, pattern, batch_size))
+                rows = cur.fetchall()
+            conn.rollback()
+            if not rows:
+                break
+            position = (rows[-1][1], rows[-1][0])
+
+            # A file linked from several reports is downloaded once per batch
+            urls = {url for row in rows for url in row[2:] if drive_file_id(url)}
+            futures = {url: executor.submit(_copy, store, url) for url in urls}
+            copied = {}
+            for url, future in futures.items():
+                try:
+                    copied[url] = future.result()
+                except Exception as e:
+                    failed += 1
+                    print(f"WARNING: Could not copy {url}: {e}")
+
+            with conn.cursor() as cur:
+                for report_id, created_at, *old_urls in rows:
+                    for column, old_url in zip(URL_COLUMNS, old_urls):
+                        if old_url in copied:
+                            cur.execute(sql.SQL("UPDATE reports SET {column} = %s WHERE id = %s AND created_at = %s AND {column} = %s")
+                                        .format(column=sql.Identifier(column)), (copied[old_url], report_id, created_at, old_url))
+                            replaced += cur.rowcount
+            conn.commit()
+            touch_tables("reports")
+            print(f"Copied images of {len(rows)} report(s) up to {position[0]:%Y-%m-%d}")
+    return replaced, failed
+
+
+if __name__ == "__main__":
+    from .migrations import connect
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "status"
+    conn = connect()
+    try:
+        if command == "status":
+            print(f"{count_drive_reports(conn)} report(s) still link images on Google Drive.")
+        elif command == "drive":
+            replaced, failed = migrate_drive_images(conn)
+            print(f"Replaced {replaced} Drive link(s); {failed} file(s) failed and keep their Drive link.")
+        else:
+            sys.exit(f"Unknown command: {command} (expected status or drive)")
+    finally:
+        conn.close()
@@ -0,0 +1,65 @@
+import os
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+# ------------------------------ #
+# Image Processing               #
+# ------------------------------ #
+# Phone photos arrive at full sensor resolution. Before storage they are
+# rotated per their EXIF orientation, downscaled, re-encoded without any
+# metadata (EXIF carries GPS coordinates) and given a small thumbnail.
+
+IMAGE_MAX_DIMENSION = int(os.getenv("IMAGE_MAX_DIMENSION", 1600))
+IMAGE_THUMB_DIMENSION = int(os.getenv("IMAGE_THUMB_DIMENSION", 320))
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", 80))
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "JPEG").upper()
+
+_MIMETYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+_EXTENSIONS = {"JPEG": ".jpg", "WEBP": ".webp"}
+
+
+class ProcessedImage:
+    def __init__(self, data, thumbnail, mimetype, extension):
+        self.data = data
+        self.thumbnail = thumbnail
+        self.mimetype = mimetype
+        self.extension = extension
+
+
+def _encode(image, fmt, quality):
+    out = BytesIO()
+    if fmt == "JPEG":
+        image.save(out, "JPEG", quality=quality, optimize=True, progressive=True)
+    else:
+        image.save(out, fmt, quality=quality, method=4)
+    return out.getvalue()
+
+
+def process_image(data, max_dimension=IMAGE_MAX_DIMENSION, thumb_dimension=IMAGE_THUMB_DIMENSION,
+                  quality=IMAGE_QUALITY, fmt=IMAGE_FORMAT):
+    """
+    Downscale and re-encode `data`. Raises PIL.UnidentifiedImageError (an
+    OSError) when the bytes are not an image Pillow can read.
+    """
+    if fmt not in _MIMETYPES:
+        raise ValueError(f"Unsupported IMAGE_FORMAT: {fmt}")
+
+    with Image.open(BytesIO(data)) as source:
+        # draft() lets the JPEG decoder skip straight to a reduced scale
+        source.draft("RGB", (max_dimension, max_dimension))
+        image = ImageOps.exif_transpose(source)
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+        main = _encode(image, fmt, quality)
+
+        image.thumbnail((thumb_dimension, thumb_dimension), Image.LANCZOS)
+        thumbnail = _encode(image, fmt, quality)
+
+    return ProcessedImage(main, thumbnail, _MIMETYPES[fmt], _EXTENSIONS[fmt])
+
+
+def processed_filename(filename, suffix, extension):
+    stem = os.path.splitext(os.path.basename(filename or "image"))[0]
+    return f"{stem}{suffix}{extension}"
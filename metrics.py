@@ -0,0 +1,272 @@
+import glob
+import json
+import os
+import threading
+import time
+
+from flask import g, request
+from psycopg2 import extensions
+
+# ------------------------------ #
+# Metrics Registry               #
+# ------------------------------ #
+# Counters and histograms are kept per process. With METRICS_DIR set, every
+# gunicorn worker flushes a snapshot to METRICS_DIR/<pid>.json (at most once
+# per METRICS_FLUSH_INTERVAL seconds) and /metrics sums all of them, so the
+# scrape shows the whole service whichever worker answers it. Files of
+# exited workers are kept so counters never go backwards.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+METRICS_DIR = os.getenv("METRICS_DIR")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", 5))
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", 500))
+
+_HELP = {
+    "http_requests_total": ("counter", "HTTP requests by endpoint, method and status"),
+    "http_request_duration_seconds": ("histogram", "Time spent in the Flask handler"),
+    "http_request_size_bytes": ("histogram", "Request body size"),
+    "http_response_size_bytes": ("histogram", "Response body size (streamed responses excluded)"),
+    "http_request_db_seconds": ("histogram", "DB time spent per request"),
+    "http_request_db_queries": ("histogram", "DB queries issued per request"),
+    "db_query_duration_seconds": ("histogram", "Duration of individual DB statements"),
+    "db_slow_queries_total": ("counter", "Statements slower than DB_SLOW_QUERY_MS"),
+    "storage_upload_duration_seconds": ("histogram", "Image storage upload calls"),
+    "storage_upload_failures_total": ("counter", "Failed image storage upload calls"),
+    "login_attempts_total": ("counter", "Login attempts by kind and result (success, failure, throttled, busy)"),
+    "db_replica_healthy": ("gauge", "1 while the replica is used for reads, 0 while ejected"),
+    "db_replica_lag_seconds": ("gauge", "Replay lag of the replica at its last check"),
+    "db_replica_reads_total": ("counter", "Connections handed out from the replica"),
+    "cache_size": ("gauge", "Entries held by the in-process cache"),
+    "cache_hits_total": ("counter", "In-process cache hits"),
+    "cache_misses_total": ("counter", "In-process cache misses"),
+}
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}     # (name, labels) -> value
+        self.histograms = {}   # (name, labels) -> [buckets, counts..., sum, count]
+        self._last_flush = 0.0
+
+    def inc(self, name, labels=(), value=1):
+        key = (name, tuple(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=(), buckets=LATENCY_BUCKETS):
+        key = (name, tuple(labels))
+        with self._lock:
+            entry = self.histograms.get(key)
+            if entry is None:
+                entry = self.histograms[key] = {"buckets": list(buckets), "counts": [0] * len(buckets),
+                                                 "sum": 0.0, "count": 0}
+            for i, bound in enumerate(entry["buckets"]):
+                if value <= bound:
+                    entry["counts"][i] += 1
+                    break
+            entry["sum"] += value
+            entry["count"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "counters": [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                "histograms": [[name, list(labels), dict(entry, counts=list(entry["counts"]))]
+                               for (name, labels), entry in self.histograms.items()],
+            }
+
+    def maybe_flush(self, force=False):
+        if not METRICS_DIR:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_flush < METRICS_FLUSH_INTERVAL:
+            return
+        self._last_flush = now
+        path = os.path.join(METRICS_DIR, f"{os.getpid()}.json")
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, path)
+
+
+registry = Registry()
+
+
+def _labels_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{str(v)}"'.replace("\n", " ") for k, v in labels) + "}"
+
+
+def _merge(snapshots):
+    counters, histograms = {}, {}
+    for snap in snapshots:
+        for name, labels, value in snap["counters"]:
+            key = (name, tuple(tuple(l) for l in labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, entry in snap["histograms"]:
+            key = (name, tuple(tuple(l) for l in labels))
+            merged = histograms.setdefault(key, {"buckets": entry["buckets"], "counts": [0] * len(entry["buckets"]),
+                                                 "sum": 0.0, "count": 0})
+            merged["counts"] = [a + b for a, b in zip(merged["counts"], entry["counts"])]
+            merged["sum"] += entry["sum"]
+            merged["count"] += entry["count"]
+    return counters, histograms
+
+
+def render_prometheus(gauges=None, process_counters=None):
+    """
+    Text exposition format, summed across workers when METRICS_DIR is set.
+    `gauges` and `process_counters` are (name, labels, value) samples read
+    from this process at scrape time.
+    """
+    snapshots = [registry.snapshot()]
+    if METRICS_DIR:
+        registry.maybe_flush(force=True)
+        snapshots = []
+        for path in glob.glob(os.path.join(METRICS_DIR, "*.json")):
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+    counters, histograms = _merge(snapshots)
+
+    lines, described = [], set()
+
+    def describe(name):
+        if name not in described and name in _HELP:
+            kind, text = _HELP[name]
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {kind}")
+            described.add(name)
+
+    for (name, labels), value in sorted(counters.items()):
+        describe(name)
+        lines.append(f"{name}{_labels_text(labels)} {value}")
+    for (name, labels), entry in sorted(histograms.items()):
+        describe(name)
+        cumulative = 0
+        for bound, count in zip(entry["buckets"], entry["counts"]):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels_text(labels + (('le', bound),))} {cumulative}")
+        lines.append(f"{name}_bucket{_labels_text(labels + (('le', '+Inf'),))} {entry['count']}")
+        lines.append(f"{name}_sum{_labels_text(labels)} {entry['sum']}")
+        lines.append(f"{name}_count{_labels_text(labels)} {entry['count']}")
+    # Samples of one metric family must be contiguous, under a single TYPE line
+    for kind, samples in (("gauge", gauges), ("counter", process_counters)):
+        families = {}
+        for name, labels, value in samples or ():
+            families.setdefault(name, []).append((labels, value))
+        for name, family in sorted(families.items()):
+            lines.append(f"# HELP {name} {_HELP[name][1] if name in _HELP else name.replace('_', ' ')}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in family:
+                lines.append(f"{name}{_labels_text(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# ------------------------------ #
+# DB Timing                      #
+# ------------------------------ #
+_request_state = threading.local()
+
+
+def _record_query(cursor, started):
+    elapsed = time.perf_counter() - started
+    registry.observe("db_query_duration_seconds", elapsed)
+    _request_state.db_seconds = getattr(_request_state, "db_seconds", 0.0) + elapsed
+    _request_state.db_queries = getattr(_request_state, "db_queries", 0) + 1
+    if elapsed * 1000 >= DB_SLOW_QUERY_MS:
+        registry.inc("db_slow_queries_total")
+        query = cursor.query.decode(errors="replace") if isinstance(cursor.query, bytes) else str(cursor.query)
+        print(f"SLOW QUERY ({elapsed * 1000:.0f} ms): {' '.join(query.split())[:500]}")
+
+
+def request_db_stats():
+    """ (queries, seconds) spent on the DB by the current or last request on this thread """
+    return getattr(_request_state, "db_queries", 0), getattr(_request_state, "db_seconds", 0.0)
+
+
+class _TimedCursorMixin:
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            _record_query(self, started)
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            _record_query(self, started)
+
+
+_timed_cursor_classes = {}
+
+
+def _timed_cursor_class(base):
+    cls = _timed_cursor_classes.get(base)
+    if cls is None:
+        cls = _timed_cursor_classes[base] = type("Timed" + base.__name__, (_TimedCursorMixin, base), {})
+    return cls
+
+
+class TimedConnection(extensions.connection):
+    """ psycopg2 connection whose cursors (of any cursor_factory) time every statement """
+
+    def cursor(self, *args, **kwargs):
+        kwargs["cursor_factory"] = _timed_cursor_class(
+            kwargs.get("cursor_factory") or self.cursor_factory or extensions.cursor)
+        return super().cursor(*args, **kwargs)
+
+
+# ------------------------------ #
+# Storage Timing                 #
+# ------------------------------ #
+def observe_upload(backend, started, ok):
+    registry.observe("storage_upload_duration_seconds", time.perf_counter() - started, (("backend", backend),))
+    if not ok:
+        registry.inc("storage_upload_failures_total", (("backend", backend),))
+
+
+# ------------------------------ #
+# Logins                         #
+# ------------------------------ #
+def count_login(kind, result):
+    registry.inc("login_attempts_total", (("kind", kind), ("result", result)))
+
+
+# ------------------------------ #
+# Flask Middleware               #
+# ------------------------------ #
+def instrument_app(app):
+    @app.before_request
+    def _start_timer():
+        g.metrics_started = time.perf_counter()
+        _request_state.db_seconds = 0.0
+        _request_state.db_queries = 0
+
+    @app.after_request
+    def _record_request(response):
+        started = g.pop("metrics_started", None)
+        if started is None:
+            return response
+        endpoint = (("endpoint", request.endpoint or "unmatched"),)
+        registry.observe("http_request_duration_seconds", time.perf_counter() - started, endpoint)
+        registry.inc("http_requests_total", endpoint + (("method", request.method), ("status", response.status_code)))
+        registry.observe("http_request_db_seconds", _request_state.db_seconds, endpoint)
+        registry.observe("http_request_db_queries", _request_state.db_queries, endpoint, COUNT_BUCKETS)
+        if request.content_length:
+            registry.observe("http_request_size_bytes", request.content_length, endpoint, SIZE_BUCKETS)
+        if not response.is_streamed:
+            registry.observe("http_response_size_bytes", response.calculate_content_length() or 0,
+                             endpoint, SIZE_BUCKETS)
+        registry.maybe_flush()
+        return response
@@ -0,0 +1,614 @@
+"""
+Versioned schema migrations.
+
+    python -m Backend.migrations up       # apply pending migrations
+    python -m Backend.migrations status   # list applied / pending
+    python -m Backend.migrations check    # EXPLAIN route queries, fail on seq scans
+
+Applied versions are recorded in `schema_migrations`. The runner holds a
+Postgres advisory lock, so concurrent deploys apply each migration exactly
+once; the second deploy waits and then finds nothing to do. Index builds run
+outside a transaction with CREATE INDEX CONCURRENTLY so large tables stay
+writable while they build.
+"""
+import base64
+import hashlib
+import os
+import re
+import sys
+
+import psycopg2
+from psycopg2 import sql
+
+from .db_connection import database_url
+
+# Arbitrary but fixed; every process running migrations must use the same key
+MIGRATION_LOCK_KEY = 727_001
+
+_PARTITION_NAME = re.compile(r"^reports_p\d{4}_\d{2}$")
+
+
+class Migration:
+    """
+    One schema change. `steps` are SQL strings or callables taking a cursor.
+    Transactional migrations run all steps and the version insert in one
+    transaction; non-transactional ones (concurrent index builds) run each
+    step in autocommit and must therefore be idempotent.
+    """
+
+    def __init__(self, version, name, steps, transactional=True):
+        self.version = version
+        self.name = name
+        self.steps = steps
+        self.transactional = transactional
+
+
+def concurrent_index(name, definition):
+    """
+    Step building `name` concurrently. A previous interrupted build leaves an
+    INVALID index behind that IF NOT EXISTS would happily skip, so drop it first.
+    """
+    def step(cur):
+        cur.execute("""
+            SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE c.relname = %s AND NOT i.indisvalid
+        """, (name,))
+        if cur.fetchone():
+            cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+        cur.execute(f"CREATE {definition.replace('INDEX', 'INDEX CONCURRENTLY IF NOT EXISTS ' + name, 1)}")
+    step.__name__ = f"index {name}"
+    return step
+
+
+# ------------------------------ #
+# Frozen definitions             #
+# ------------------------------ #
+# A migration must do the same thing whenever it runs, so it never calls
+# into the app: SQL and helpers it needs are copied here as they were when
+# it was written, and app code is free to change afterwards.
+
+# The generated search column of migrations 5 and 7
+_SEARCH_VECTOR_V5 = """
+    setweight(to_tsvector('english', coalesce(complaints, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(maintenance_required, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(general_comments, '')), 'B')
+"""
+
+
+def _hash_plaintext_passwords_v8(cur):
+    """ Migration 8: hash plaintext passwords as scrypt$14$8$1$<salt>$<key>, the format passwords.py reads """
+    def b64(data):
+        return base64.b64encode(data).decode().rstrip("=")
+
+    for table in ("admins", "teachers"):
+        cur.execute(f"SELECT id, password FROM {table} WHERE password NOT LIKE %s", ("scrypt$%",))
+        for row_id, password in cur.fetchall():
+            salt = os.urandom(16)
+            key = hashlib.scrypt(password.encode(), salt=salt, n=1 << 14, r=8, p=1,
+                                 maxmem=2 * 128 * 8 * (1 << 14) + 1024 * 1024, dklen=32)
+            cur.execute(f"UPDATE {table} SET password = %s WHERE id = %s",
+                        (f"scrypt$14$8$1${b64(salt)}${b64(key)}", row_id))
+
+
+# ------------------------------ #
+# Migrations                     #
+# ------------------------------ #
+# Written with IF NOT EXISTS throughout so databases set up by the old
+# init_db.py are adopted as-is on their first run.
+MIGRATIONS = [
+    Migration(1, "base tables", [
+        """
+        CREATE TABLE IF NOT EXISTS admins (
+            id SERIAL PRIMARY KEY,
+            name VARCHAR(255) UNIQUE NOT NULL,
+            password VARCHAR(255) NOT NULL
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS teachers (
+            id SERIAL PRIMARY KEY,
+            name VARCHAR(255) UNIQUE NOT NULL,
+            password VARCHAR(255) NOT NULL
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS reports (
+            id SERIAL PRIMARY KEY,
+            teacher_name VARCHAR(255) NOT NULL,
+            subordinate_teacher_name VARCHAR(255),
+            hostel_name VARCHAR(255) NOT NULL,
+            general_comments TEXT,
+            maintenance_required TEXT,
+            complaints TEXT,
+            image_url TEXT,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+        );
+        """,
+        # Default admin user (Paul/1234), the only account allowed to delete
+        # forms; migration 8 replaces the plaintext password with a hash
+        """
+        INSERT INTO admins (name, password) VALUES ('Paul', '1234')
+        ON CONFLICT (name) DO NOTHING;
+        """,
+    ]),
+    Migration(2, "report image columns", [
+        # Set to pending/done/failed by the background image upload queue;
+        # NULL for reports submitted without an image.
+        "ALTER TABLE reports ADD COLUMN IF NOT EXISTS image_status VARCHAR(16);",
+        "ALTER TABLE reports ADD COLUMN IF NOT EXISTS thumbnail_url TEXT;",
+    ]),
+    Migration(3, "report idempotency key", [
+        # Client-supplied key that makes /submit-forms/batch retries safe
+        "ALTER TABLE reports ADD COLUMN IF NOT EXISTS idempotency_key VARCHAR(255);",
+    ]),
+    Migration(4, "report summary rollup", [
+        """
+        CREATE TABLE IF NOT EXISTS report_summary (
+            day DATE NOT NULL,
+            hostel_name VARCHAR(255) NOT NULL,
+            teacher_name VARCHAR(255) NOT NULL,
+            report_count INTEGER NOT NULL DEFAULT 0,
+            maintenance_count INTEGER NOT NULL DEFAULT 0,
+            complaints_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, hostel_name, teacher_name)
+        );
+        """,
+        # Counts rows written before the rollup existed; routes keep it current
+        # afterwards. Frozen here: migration 12 re-keys the rollup by id
+        """
+        INSERT INTO report_summary (day, hostel_name, teacher_name,
+            report_count, maintenance_count, complaints_count)
+        SELECT (created_at AT TIME ZONE 'UTC')::date, hostel_name, teacher_name,
+            COUNT(*),
+            COUNT(*) FILTER (WHERE NULLIF(btrim(maintenance_required), '') IS NOT NULL),
+            COUNT(*) FILTER (WHERE NULLIF(btrim(complaints), '') IS NOT NULL)
+        FROM reports
+        GROUP BY 1, 2, 3
+        ON CONFLICT DO NOTHING;
+        """,
+    ]),
+    Migration(5, "report search vector", [
+        # Rewrites the table once, which also backfills existing rows
+        f"""
+        ALTER TABLE reports ADD COLUMN IF NOT EXISTS search_vector tsvector
+            GENERATED ALWAYS AS ({_SEARCH_VECTOR_V5}) STORED;
+        """,
+    ]),
+    Migration(6, "report indexes", [
+        # /forms keyset pages and /download periods order or filter by (created_at, id)
+        concurrent_index("reports_created_at_id_idx",
+                         "INDEX ON reports (created_at DESC, id DESC)"),
+        concurrent_index("reports_hostel_created_at_id_idx",
+                         "INDEX ON reports (hostel_name, created_at DESC, id DESC)"),
+        concurrent_index("reports_teacher_created_at_id_idx",
+                         "INDEX ON reports (teacher_name, created_at DESC, id DESC)"),
+        # NULL keys never conflict, so reports submitted without one are unaffected
+        concurrent_index("reports_idempotency_key_idx",
+                         "UNIQUE INDEX ON reports (idempotency_key)"),
+        concurrent_index("reports_search_vector_idx",
+                         "INDEX ON reports USING GIN (search_vector)"),
+    ], transactional=False),
+    Migration(7, "partition reports by month", [
+        # A unique index on a partitioned table must include the partition
+        # key, so idempotency keys move to their own table
+        """
+        CREATE TABLE IF NOT EXISTS report_idempotency_keys (
+            idempotency_key VARCHAR(255) PRIMARY KEY,
+            report_id INTEGER NOT NULL
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS report_idempotency_keys_report_id_idx ON report_idempotency_keys (report_id);",
+        # Copies every row into monthly partitions under one lock; the id
+        # sequence is kept so ids carry on where they left off. Partitions
+        # are UTC months from the oldest report to three months ahead.
+        f"""
+        DO $$
+        DECLARE
+            id_sequence text := pg_get_serial_sequence('reports', 'id');
+            part_start timestamp;
+        BEGIN
+            EXECUTE format('ALTER SEQUENCE %s OWNED BY NONE', id_sequence);
+            ALTER TABLE reports RENAME TO reports_unpartitioned;
+            EXECUTE format($create$
+                CREATE TABLE reports (
+                    id INTEGER NOT NULL DEFAULT nextval(%L),
+                    teacher_name VARCHAR(255) NOT NULL,
+                    subordinate_teacher_name VARCHAR(255),
+                    hostel_name VARCHAR(255) NOT NULL,
+                    general_comments TEXT,
+                    maintenance_required TEXT,
+                    complaints TEXT,
+                    image_url TEXT,
+                    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    image_status VARCHAR(16),
+                    thumbnail_url TEXT,
+                    search_vector tsvector GENERATED ALWAYS AS ({_SEARCH_VECTOR_V5}) STORED,
+                    PRIMARY KEY (id, created_at)
+                ) PARTITION BY RANGE (created_at)
+            $create$, id_sequence);
+            EXECUTE format('ALTER SEQUENCE %s OWNED BY reports.id', id_sequence);
+
+            FOR part_start IN
+                SELECT generate_series(
+                    (SELECT date_trunc('month', COALESCE(min(created_at), NOW()) AT TIME ZONE 'UTC') FROM reports_unpartitioned),
+                    date_trunc('month', NOW() AT TIME ZONE 'UTC') + INTERVAL '3 months',
+                    INTERVAL '1 month')
+            LOOP
+                EXECUTE format('CREATE TABLE %I PARTITION OF reports FOR VALUES FROM (%L) TO (%L)',
+                    'reports_p' || to_char(part_start, 'YYYY_MM'),
+                    part_start AT TIME ZONE 'UTC', (part_start + INTERVAL '1 month') AT TIME ZONE 'UTC');
+            END LOOP;
+        END
+        $$;
+        """,
+        """
+        INSERT INTO report_idempotency_keys (idempotency_key, report_id)
+        SELECT idempotency_key, id FROM reports_unpartitioned WHERE idempotency_key IS NOT NULL;
+        """,
+        """
+        INSERT INTO reports (id, teacher_name, subordinate_teacher_name, hostel_name, general_comments,
+            maintenance_required, complaints, image_url, thumbnail_url, image_status, created_at)
+        SELECT id, teacher_name, subordinate_teacher_name, hostel_name, general_comments,
+            maintenance_required, complaints, image_url, thumbnail_url, image_status,
+            COALESCE(created_at, CURRENT_TIMESTAMP)
+        FROM reports_unpartitioned;
+        """,
+        "DROP TABLE reports_unpartitioned;",
+        # Indexes on a partitioned parent cannot be built CONCURRENTLY; the
+        # table was just filled inside this transaction, so nothing waits on them
+        "CREATE INDEX reports_created_at_id_idx ON reports (created_at DESC, id DESC);",
+        "CREATE INDEX reports_hostel_created_at_id_idx ON reports (hostel_name, created_at DESC, id DESC);",
+        "CREATE INDEX reports_teacher_created_at_id_idx ON reports (teacher_name, created_at DESC, id DESC);",
+        "CREATE INDEX reports_search_vector_idx ON reports USING GIN (search_vector);",
+        "ANALYZE reports;",
+    ]),
+    Migration(8, "hash stored passwords", [
+        # Logins also upgrade plaintext on the fly, for rows written by
+        # older app versions during a rolling deploy
+        _hash_plaintext_passwords_v8,
+    ]),
+    Migration(9, "revoked tokens", [
+        # Rows are only needed until the token would have expired anyway
+        """
+        CREATE TABLE IF NOT EXISTS revoked_tokens (
+            jti UUID PRIMARY KEY,
+            expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS revoked_tokens_expires_at_idx ON revoked_tokens (expires_at);",
+    ]),
+    Migration(10, "export jobs", [
+        """
+        CREATE TABLE IF NOT EXISTS export_jobs (
+            id SERIAL PRIMARY KEY,
+            period VARCHAR(16) NOT NULL,
+            year INTEGER,
+            format VARCHAR(8) NOT NULL,
+            status VARCHAR(16) NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            rows_written INTEGER NOT NULL DEFAULT 0,
+            total_rows INTEGER,
+            file_name TEXT,
+            file_size BIGINT,
+            error TEXT,
+            requested_by VARCHAR(255),
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+            started_at TIMESTAMP WITH TIME ZONE,
+            heartbeat_at TIMESTAMP WITH TIME ZONE,
+            finished_at TIMESTAMP WITH TIME ZONE
+        );
+        """,
+        # Workers only ever scan for pending jobs; dedup looks up by parameters
+        "CREATE INDEX IF NOT EXISTS export_jobs_pending_idx ON export_jobs (id) WHERE status = 'pending';",
+        "CREATE INDEX IF NOT EXISTS export_jobs_params_idx ON export_jobs (period, year, format, created_at DESC);",
+    ]),
+    Migration(11, "report change log", [
+        # Append-only; read in (txid, id) order by /reports/changes
+        """
+        CREATE TABLE IF NOT EXISTS report_changes (
+            id BIGSERIAL PRIMARY KEY,
+            txid BIGINT NOT NULL DEFAULT pg_current_xact_id()::text::bigint,
+            report_id INTEGER NOT NULL,
+            report_created_at TIMESTAMP WITH TIME ZONE NOT NULL,
+            op CHAR(1) NOT NULL,
+            changed_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS report_changes_txid_id_idx ON report_changes (txid, id);",
+        "CREATE INDEX IF NOT EXISTS report_changes_changed_at_idx ON report_changes (changed_at);",
+        # Last (txid, id) deleted by pruning; older cursors have to resync
+        """
+        CREATE TABLE IF NOT EXISTS report_changes_horizon (
+            singleton BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (singleton),
+            txid BIGINT NOT NULL,
+            change_id BIGINT NOT NULL
+        );
+        """,
+        """
+        CREATE OR REPLACE FUNCTION log_report_change() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                INSERT INTO report_changes (report_id, report_created_at, op) VALUES (OLD.id, OLD.created_at, 'D');
+            ELSE
+                INSERT INTO report_changes (report_id, report_created_at, op) VALUES (NEW.id, NEW.created_at, left(TG_OP, 1));
+            END IF;
+            -- Identical notifications are folded into one per transaction
+            PERFORM pg_notify('report_changes', '');
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        # Defined on the partitioned parent, so every partition gets it
+        "DROP TRIGGER IF EXISTS reports_log_change ON reports;",
+        """
+        CREATE TRIGGER reports_log_change AFTER INSERT OR UPDATE OR DELETE ON reports
+        FOR EACH ROW EXECUTE FUNCTION log_report_change();
+        """,
+    ]),
+    Migration(12, "normalize report names", [
+        """
+        CREATE TABLE IF NOT EXISTS hostels (
+            id SERIAL PRIMARY KEY,
+            name VARCHAR(255) UNIQUE NOT NULL
+        );
+        """,
+        # Subordinate teachers and deleted teachers stay in `teachers` without
+        # a password; they are referenced by reports but cannot log in
+        "ALTER TABLE teachers ALTER COLUMN password DROP NOT NULL;",
+        "INSERT INTO hostels (name) SELECT DISTINCT hostel_name FROM reports ON CONFLICT (name) DO NOTHING;",
+        """
+        INSERT INTO teachers (name)
+        SELECT teacher_name FROM reports
+        UNION SELECT subordinate_teacher_name FROM reports WHERE subordinate_teacher_name IS NOT NULL
+        ON CONFLICT (name) DO NOTHING;
+        """,
+        """
+        ALTER TABLE reports
+            ADD COLUMN teacher_id INTEGER REFERENCES teachers (id),
+            ADD COLUMN subordinate_teacher_id INTEGER REFERENCES teachers (id),
+            ADD COLUMN hostel_id INTEGER REFERENCES hostels (id);
+        """,
+        """
+        UPDATE reports r SET
+            teacher_id = (SELECT id FROM teachers WHERE name = r.teacher_name),
+            subordinate_teacher_id = (SELECT id FROM teachers WHERE name = r.subordinate_teacher_name),
+            hostel_id = (SELECT id FROM hostels WHERE name = r.hostel_name);
+        """,
+        # The backfill is not a change clients need to sync
+        "DELETE FROM report_changes WHERE txid = pg_current_xact_id()::text::bigint;",
+        "ALTER TABLE reports ALTER COLUMN teacher_id SET NOT NULL, ALTER COLUMN hostel_id SET NOT NULL;",
+        "DROP INDEX IF EXISTS reports_hostel_created_at_id_idx;",
+        "DROP INDEX IF EXISTS reports_teacher_created_at_id_idx;",
+        "ALTER TABLE reports DROP COLUMN teacher_name, DROP COLUMN subordinate_teacher_name, DROP COLUMN hostel_name;",
+        # Reports with the names joined back in, for everything that returns them
+        """
+        CREATE OR REPLACE VIEW report_rows AS
+        SELECT r.id, t.name AS teacher_name, s.name AS subordinate_teacher_name, h.name AS hostel_name,
+            r.general_comments, r.maintenance_required, r.complaints, r.image_url, r.thumbnail_url,
+            r.image_status, r.created_at, r.teacher_id, r.subordinate_teacher_id, r.hostel_id
+        FROM reports r
+        LEFT JOIN teachers t ON t.id = r.teacher_id
+        LEFT JOIN teachers s ON s.id = r.subordinate_teacher_id
+        LEFT JOIN hostels h ON h.id = r.hostel_id;
+        """,
+        "CREATE INDEX reports_hostel_id_created_at_id_idx ON reports (hostel_id, created_at DESC, id DESC);",
+        "CREATE INDEX reports_teacher_id_created_at_id_idx ON reports (teacher_id, created_at DESC, id DESC);",
+        "DROP TABLE report_summary;",
+        """
+        CREATE TABLE report_summary (
+            day DATE NOT NULL,
+            hostel_id INTEGER NOT NULL REFERENCES hostels (id),
+            teacher_id INTEGER NOT NULL REFERENCES teachers (id),
+            report_count INTEGER NOT NULL DEFAULT 0,
+            maintenance_count INTEGER NOT NULL DEFAULT 0,
+            complaints_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, hostel_id, teacher_id)
+        );
+        """,
+        """
+        INSERT INTO report_summary (day, hostel_id, teacher_id,
+            report_count, maintenance_count, complaints_count)
+        SELECT (created_at AT TIME ZONE 'UTC')::date, hostel_id, teacher_id,
+            COUNT(*),
+            COUNT(*) FILTER (WHERE NULLIF(btrim(maintenance_required), '') IS NOT NULL),
+            COUNT(*) FILTER (WHERE NULLIF(btrim(complaints), '') IS NOT NULL)
+        FROM reports
+        GROUP BY 1, 2, 3;
+        """,
+        "ANALYZE reports;",
+    ]),
+    Migration(13, "analyze reports after normalization", [
+        # DROP COLUMN only hides the values. Rewriting the table to free the
+        # space locks it, so that is left to `python -m Backend.partitions
+        # reclaim` (or pg_repack) in a quiet window, never to a deploy
+        "ANALYZE reports;",
+    ]),
+    Migration(14, "table versions", [
+        # Bumped by touch_tables() after every write; the ETags and
+        # Last-Modified of the list routes are derived from it
+        """
+        CREATE TABLE IF NOT EXISTS table_versions (
+            table_name VARCHAR(63) PRIMARY KEY,
+            version BIGINT NOT NULL DEFAULT 1,
+            changed_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+        );
+        """,
+        """
+        INSERT INTO table_versions (table_name) VALUES ('reports'), ('teachers'), ('admins')
+        ON CONFLICT (table_name) DO NOTHING;
+        """,
+    ]),
+    Migration(15, "pending image uploads", [
+        # Image bytes of reports whose upload has not finished; see image_jobs.py
+        """
+        CREATE TABLE IF NOT EXISTS image_uploads (
+            report_id INTEGER PRIMARY KEY,
+            data BYTEA NOT NULL,
+            filename TEXT,
+            mimetype VARCHAR(255),
+            attempts INTEGER NOT NULL DEFAULT 0,
+            claimed_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS image_uploads_claimed_at_idx ON image_uploads (claimed_at);",
+        # Uploads queued before this table existed cannot be retried; an
+        # upload still running in an old worker sets its own status again
+        "UPDATE reports SET image_status = 'failed' WHERE image_status = 'pending';",
+    ]),
+]
+
+
+# ------------------------------ #
+# Runner                         #
+# ------------------------------ #
+def connect():
+    return psycopg2.connect(database_url())
+
+
+def _ensure_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+
+
+def _applied_versions(cur):
+    cur.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cur.fetchall()}
+
+
+def _run_step(cur, step):
+    if callable(step):
+        step(cur)
+    else:
+        cur.execute(step)
+
+
+def migrate(migrations=MIGRATIONS):
+    """ Apply pending migrations in version order; returns the versions applied """
+    conn = connect()
+    conn.autocommit = True
+    applied_now = []
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_KEY,))
+            try:
+                _ensure_table(cur)
+                applied = _applied_versions(cur)
+                for migration in sorted(migrations, key=lambda m: m.version):
+                    if migration.version in applied:
+                        continue
+                    print(f"Applying migration {migration.version}: {migration.name}...")
+                    if migration.transactional:
+                        cur.execute("BEGIN")
+                        try:
+                            for step in migration.steps:
+                                _run_step(cur, step)
+                            cur.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                                        (migration.version, migration.name))
+                            cur.execute("COMMIT")
+                        except Exception:
+                            cur.execute("ROLLBACK")
+                            raise
+                    else:
+                        for step in migration.steps:
+                            _run_step(cur, step)
+                        cur.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                                    (migration.version, migration.name))
+                    applied_now.append(migration.version)
+            finally:
+                cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_KEY,))
+    finally:
+        conn.close()
+    return applied_now
+
+
+def status(migrations=MIGRATIONS):
+    conn = connect()
+    try:
+        with conn.cursor() as cur:
+            _ensure_table(cur)
+            applied = _applied_versions(cur)
+        conn.commit()
+    finally:
+        conn.close()
+    return [(m.version, m.name, m.version in applied) for m in sorted(migrations, key=lambda m: m.version)]
+
+
+# ------------------------------ #
+# Query plan check               #
+# ------------------------------ #
+def route_queries():
+    """ (label, query, params) for the filtered/ranged queries the routes issue against `reports` and its side tables """
+    from .changes import CHANGES_QUERY
+    from .exports import build_export_query, build_range_export_query
+    from .pagination import build_reports_page_query
+    from .search import build_search_query
+
+    queries = [
+        ("/forms page", *build_reports_page_query({})[:2]),
+        ("/forms by hostel", *build_reports_page_query({"hostel_name": "x"})[:2]),
+        ("/forms by teacher", *build_reports_page_query({"teacher_name": "x"})[:2]),
+        ("/forms date range", *build_reports_page_query({"from": "2024-01-01", "to": "2024-02-01"})[:2]),
+        ("/reports/search", *build_search_query({"q": "leaking tap"})[:2]),
+        ("/delete-form", "DELETE FROM reports WHERE id = %s", [0]),
+        ("/submit-forms/batch duplicates",
+         "SELECT idempotency_key, report_id FROM report_idempotency_keys WHERE idempotency_key = ANY(%s)", [["x"]]),
+        ("/reports/changes", CHANGES_QUERY, [0, 0, 201]),
+    ]
+    for period in ("weekly", "monthly", "yearly"):
+        queries.append((f"/download/{period}", build_export_query(period), None))
+    queries.append(("/download/yearly?year=", build_range_export_query(bounded=True), ["2024-01-01", "2025-01-01"]))
+    return queries
+
+
+def _seq_scans(plan, found):
+    if plan.get("Node Type") == "Seq Scan":
+        name = plan.get("Relation Name")
+        # Scans of a monthly partition count against the partitioned table
+        found.append("reports" if _PARTITION_NAME.match(name) else name)
+    for child in plan.get("Plans", ()):
+        _seq_scans(child, found)
+    return found
+
+
+def check_query_plans(tables=("reports", "report_idempotency_keys", "report_changes")):
+    """
+    EXPLAIN every route query with sequential scans disabled. The planner
+    still picks a seq scan when no index can serve the query, so any that
+    remain on `tables` point at a missing index. Returns {label: [tables]}.
+    """
+    failures = {}
+    conn = connect()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SET enable_seqscan = off")
+            for label, query, params in route_queries():
+                if not isinstance(query, sql.Composable):
+                    query = sql.SQL(query)
+                cur.execute(sql.SQL("EXPLAIN (FORMAT JSON) ") + query, params)
+                scanned = [t for t in _seq_scans(cur.fetchone()[0][0]["Plan"], []) if t in tables]
+                print(f"{'FAIL' if scanned else 'ok':<6}{label}" + (f"  (seq scan on {', '.join(scanned)})" if scanned else ""))
+                if scanned:
+                    failures[label] = scanned
+        conn.rollback()
+    finally:
+        conn.close()
+    return failures
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "up"
+    if command == "up":
+        applied = migrate()
+        print(f"Applied {len(applied)} migration(s)." if applied else "Database is up to date.")
+    elif command == "status":
+        for version, name, done in status():
+            print(f"{version:>4}  {'applied' if done else 'pending':<8} {name}")
+    elif command == "check":
+        sys.exit(1 if check_query_plans() else 0)
+    else:
+        sys.exit(f"Unknown command: {command} (expected up, status or check)")
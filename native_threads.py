@@ -0,0 +1,41 @@
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+# ------------------------------ #
+# CPU-bound Work Under gevent    #
+# ------------------------------ #
+# With SERVE_MODE=async gevent monkey-patches `threading`, so a plain
+# ThreadPoolExecutor runs its "threads" as greenlets on the worker's one
+# event loop. scrypt and Pillow never yield, so a password check or an
+# image resize there would stall every other request of the worker. The
+# helpers below put that work on real OS threads in async mode (scrypt and
+# Pillow release the GIL) and wait for it cooperatively; in sync mode they
+# are the ordinary standard library behaviour.
+
+
+def gevent_patched():
+    """ Whether this process runs under gevent's monkey-patched threading """
+    monkey = sys.modules.get("gevent.monkey")
+    return monkey is not None and monkey.is_module_patched("threading")
+
+
+def native_executor(max_workers, thread_name_prefix=""):
+    """
+    Executor whose workers are OS threads in either mode. Under gevent its
+    futures' result() and done callbacks run on the submitting greenlet's hub.
+    """
+    if gevent_patched():
+        from gevent.threadpool import ThreadPoolExecutor as GeventThreadPoolExecutor
+        return GeventThreadPoolExecutor(max_workers=max_workers)
+    return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+
+
+def run_cpu_bound(fn, *args):
+    """
+    fn(*args) off the event loop under gevent (on the hub's pool of OS
+    threads), inline otherwise; callers are already on a worker thread.
+    """
+    if gevent_patched():
+        import gevent
+        return gevent.get_hub().threadpool.apply(fn, args)
+    return fn(*args)
@@ -0,0 +1,140 @@
+import base64
+import datetime
+import json
+
+from psycopg2 import sql
+
+from .dimensions import name_filter
+
+# Columns of `reports` that clients may ask for with ?fields=
+REPORT_COLUMNS = (
+    "id", "teacher_name", "subordinate_teacher_name", "hostel_name",
+    "general_comments", "maintenance_required", "complaints", "image_url", "thumbnail_url",
+    "image_status", "created_at",
+)
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+class QueryError(ValueError):
+    """ Bad pagination / filter parameters; reported to the client as a 400 """
+
+
+# ------------------------------ #
+# Cursors                        #
+# ------------------------------ #
+def encode_cursor(created_at, row_id):
+    """ Opaque keyset cursor for the (created_at, id) position of a row """
+    raw = json.dumps({"c": created_at.isoformat(), "i": row_id}).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.datetime.fromisoformat(data["c"]), int(data["i"])
+    except (ValueError, KeyError, TypeError):
+        raise QueryError("Invalid cursor")
+
+
+# ------------------------------ #
+# Parameter parsing              #
+# ------------------------------ #
+def parse_limit(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    if value in (None, ""):
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise QueryError("limit must be an integer")
+    if limit < 1:
+        raise QueryError("limit must be positive")
+    return min(limit, maximum)
+
+
+def parse_date_bound(value, name, end=False):
+    """
+    Parse an ISO date or datetime. A bare date used as an upper bound covers
+    the whole day, so `to=2024-05-01` includes reports made on May 1st.
+    """
+    if not value:
+        return None
+    try:
+        parsed = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise QueryError(f"{name} must be an ISO date or datetime")
+    if end and len(value) == 10:
+        parsed += datetime.timedelta(days=1)
+    return parsed
+
+
+def parse_fields(value):
+    """ Column projection for ?fields=a,b,c; id and created_at are always kept for the cursor """
+    if not value:
+        return list(REPORT_COLUMNS)
+    fields = [f.strip() for f in value.split(",") if f.strip()]
+    unknown = [f for f in fields if f not in REPORT_COLUMNS]
+    if unknown:
+        raise QueryError("Unknown fields: " + ", ".join(unknown))
+    for required in ("created_at", "id"):
+        if required not in fields:
+            fields.append(required)
+    return fields
+
+
+def report_filters(args):
+    """
+    Build the shared WHERE clauses for hostel/teacher/date filters.
+    Returns (list of sql.Composable, list of params).
+    """
+    clauses, params = [], []
+    for column in ("hostel_name", "teacher_name"):
+        if args.get(column):
+            clauses.append(name_filter(column))
+            params.append(args[column])
+    start = parse_date_bound(args.get("from"), "from")
+    if start:
+        clauses.append(sql.SQL("created_at >= %s"))
+        params.append(start)
+    end = parse_date_bound(args.get("to"), "to", end=True)
+    if end:
+        clauses.append(sql.SQL("created_at < %s"))
+        params.append(end)
+    return clauses, params
+
+
+def build_reports_page_query(args):
+    """
+    Keyset query over report_rows, newest first. Fetches one extra row so the
+    caller can tell whether there is a next page.
+    Returns (query, params, limit).
+    """
+    fields = parse_fields(args.get("fields"))
+    limit = parse_limit(args.get("limit"))
+    clauses, params = report_filters(args)
+
+    if args.get("cursor"):
+        created_at, row_id = decode_cursor(args["cursor"])
+        clauses.append(sql.SQL("(created_at, id) < (%s, %s)"))
+        params.extend([created_at, row_id])
+
+    where = sql.SQL(" WHERE ") + sql.SQL(" AND ").join(clauses) if clauses else sql.SQL("")
+    query = sql.SQL("SELECT {fields} FROM report_rows{where} ORDER BY created_at DESC, id DESC LIMIT %s").format(
+        fields=sql.SQL(", ").join(sql.Identifier(f) for f in fields),
+        where=where,
+    )
+    params.append(limit + 1)
+    return query, params, limit
+
+
+def paginate(rows, limit):
+    """ Trim the look-ahead row and return (items, next_cursor) """
+    has_more = len(rows) > limit
+    items = rows[:limit]
+    next_cursor = None
+    if has_more and items:
+        last = items[-1]
+        next_cursor = encode_cursor(last["created_at"], last["id"])
+    return items, next_cursor
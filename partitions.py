@@ -0,0 +1,265 @@
+"""
+Monthly partitions of `reports`, retention and archival.
+
+    python -m Backend.partitions maintain   # create partitions ahead of time
+    python -m Backend.partitions archive    # archive + drop months past retention
+    python -m Backend.partitions list
+    python -m Backend.partitions reclaim    # VACUUM FULL month by month (locks each month)
+
+`reports` is range-partitioned on created_at with one partition per UTC
+month (reports_pYYYY_MM). Partitions are kept PARTITION_MONTHS_AHEAD months
+ahead of the current month by this command (run it from cron or a deploy
+hook); the app also makes sure next month exists before inserting. Months older than REPORT_RETENTION_MONTHS are detached,
+written to ARCHIVE_DIR as gzip CSV and dropped. Yearly exports read those
+files back for archived months.
+"""
+import csv
+import datetime
+import glob
+import gzip
+import os
+import re
+import sys
+import threading
+
+from psycopg2 import sql
+
+from .changes import log_partition_deletes
+from .conditional import touch_tables
+from .dimensions import named_reports_select
+from .pagination import REPORT_COLUMNS
+from .summary import forget_partition
+
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", 3))
+REPORT_RETENTION_MONTHS = int(os.getenv("REPORT_RETENTION_MONTHS", 0))   # 0 keeps everything
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+
+# Archives hold the public columns in export order; search_vector is derived
+ARCHIVE_COLUMNS = REPORT_COLUMNS
+
+_PARTITION_RE = re.compile(r"^reports_p(\d{4})_(\d{2})$")
+
+
+def month_start(value):
+    """ First instant of value's UTC month, as an aware datetime """
+    value = value.astimezone(datetime.timezone.utc)
+    return datetime.datetime(value.year, value.month, 1, tzinfo=datetime.timezone.utc)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(month):
+    return f"reports_p{month.year:04d}_{month.month:02d}"
+
+
+def create_partition(cur, month):
+    # Creating a partition locks the parent, so skip the DDL when it exists
+    cur.execute("SELECT to_regclass(%s)", (partition_name(month),))
+    if cur.fetchone()[0]:
+        return
+    cur.execute(sql.SQL("""
+        CREATE TABLE IF NOT EXISTS {name} PARTITION OF reports
+            FOR VALUES FROM (%s) TO (%s)
+    """).format(name=sql.Identifier(partition_name(month))), (month, add_months(month, 1)))
+
+
+def ensure_partitions(cur, start=None, months_ahead=PARTITION_MONTHS_AHEAD):
+    """ Make sure a partition exists for every month from `start` (default: now) to months_ahead """
+    now = month_start(datetime.datetime.now(datetime.timezone.utc))
+    month = month_start(start) if start else now
+    last = add_months(now, months_ahead)
+    while month <= last:
+        create_partition(cur, month)
+        month = add_months(month, 1)
+    return last
+
+
+def list_partitions(cur):
+    """ [(month, name)] of attached partitions, oldest first """
+    cur.execute("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = 'reports'
+    """)
+    months = []
+    for (name,) in cur.fetchall():
+        match = _PARTITION_RE.match(name)
+        if match:
+            months.append((datetime.datetime(int(match[1]), int(match[2]), 1, tzinfo=datetime.timezone.utc), name))
+    return sorted(months)
+
+
+# ------------------------------ #
+# Runtime check                  #
+# ------------------------------ #
+_ensured_until = None
+_ensure_lock = threading.Lock()
+
+
+def ensure_partitions_cached():
+    """
+    Called before inserts. Only touches the database when this process has
+    not yet confirmed a partition for next month, i.e. about once a month.
+    """
+    global _ensured_until
+    needed = add_months(month_start(datetime.datetime.now(datetime.timezone.utc)), 1)
+    if _ensured_until is not None and _ensured_until >= needed:
+        return
+    from .db_connection import get_connection
+    with _ensure_lock:
+        if _ensured_until is not None and _ensured_until >= needed:
+            return
+        with get_connection() as conn, conn.cursor() as cur:
+            ensured = ensure_partitions(cur)
+            conn.commit()
+        _ensured_until = ensured
+
+
+# ------------------------------ #
+# Retention / archival           #
+# ------------------------------ #
+def archive_path(month, archive_dir=ARCHIVE_DIR):
+    return os.path.join(archive_dir, f"{partition_name(month)}.csv.gz")
+
+
+def archive_expired(conn, retention_months=REPORT_RETENTION_MONTHS, archive_dir=ARCHIVE_DIR):
+    """
+    Detach, archive and drop every partition that ended more than
+    `retention_months` ago. Each month is its own transaction and the file is
+    complete on disk before the partition is dropped. Returns archived names.
+    """
+    if retention_months <= 0:
+        return []
+    os.makedirs(archive_dir, exist_ok=True)
+    cutoff = add_months(month_start(datetime.datetime.now(datetime.timezone.utc)), -retention_months)
+    archived = []
+    with conn.cursor() as cur:
+        expired = [(m, n) for m, n in list_partitions(cur) if add_months(m, 1) <= cutoff]
+    conn.commit()
+
+    for month, name in expired:
+        path = archive_path(month, archive_dir)
+        tmp = path + ".tmp"
+        with conn.cursor() as cur:
+            cur.execute(sql.SQL("ALTER TABLE reports DETACH PARTITION {}").format(sql.Identifier(name)))
+            # Names are written out, so archives do not depend on the dimension tables
+            copy = sql.SQL("COPY ({select} ORDER BY r.created_at, r.id) TO STDOUT WITH CSV HEADER").format(
+                select=named_reports_select(ARCHIVE_COLUMNS, name),
+            )
+            try:
+                with gzip.open(tmp, "wb") as f:
+                    cur.copy_expert(copy.as_string(conn), f)
+                os.replace(tmp, path)
+                # Clients syncing through /reports/changes drop the rows too,
+                # and /reports/summary stops counting them
+                log_partition_deletes(cur, name)
+                forget_partition(cur, name)
+                cur.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(name)))
+                conn.commit()
+                touch_tables("reports")
+            except Exception:
+                # The partition is re-attached by the rollback; an archive
+                # left behind would duplicate its rows in yearly exports
+                conn.rollback()
+                for leftover in (tmp, path):
+                    if os.path.exists(leftover):
+                        os.remove(leftover)
+                raise
+        archived.append(name)
+        print(f"Archived {name} to {path}")
+    return archived
+
+
+def reclaim_partitions(conn):
+    """
+    Rewrite each partition with VACUUM FULL, oldest first, to give back the
+    space of dropped columns (see migration 12). Each rewrite holds an
+    ACCESS EXCLUSIVE lock on its month, so reads and inserts on that month
+    wait until it finishes; run it in a quiet window, or use pg_repack.
+    Returns [(name, bytes before, bytes after)].
+    """
+    with conn.cursor() as cur:
+        names = [name for _, name in list_partitions(cur)]
+    conn.commit()
+    conn.autocommit = True   # VACUUM cannot run inside a transaction
+    reclaimed = []
+    try:
+        with conn.cursor() as cur:
+            for name in names:
+                cur.execute("SELECT pg_total_relation_size(%s::regclass)", (name,))
+                before = cur.fetchone()[0]
+                cur.execute(sql.SQL("VACUUM (FULL, ANALYZE) {}").format(sql.Identifier(name)))
+                cur.execute("SELECT pg_total_relation_size(%s::regclass)", (name,))
+                reclaimed.append((name, before, cur.fetchone()[0]))
+                print(f"Rewrote {name}: {before / 1024 ** 2:.1f}MB -> {reclaimed[-1][2] / 1024 ** 2:.1f}MB")
+    finally:
+        conn.autocommit = False
+    return reclaimed
+
+
+def _parse_archived_row(row):
+    values = [None if value == "" else value for value in row]
+    values[0] = int(values[0])
+    values[-1] = datetime.datetime.fromisoformat(values[-1])
+    return values
+
+
+def archived_batches(start, end=None, tz=datetime.timezone.utc, batch_size=2000, archive_dir=ARCHIVE_DIR):
+    """
+    Batches of archived rows with start <= created_at < end (aware datetimes,
+    end=None for open-ended), read month by month. created_at comes back as
+    naive wall-clock time in `tz`, matching exports.build_export_query.
+    """
+    for path in sorted(glob.glob(os.path.join(archive_dir, "reports_p*.csv.gz"))):
+        match = _PARTITION_RE.match(os.path.basename(path)[:-len(".csv.gz")])
+        if not match:
+            continue
+        month = datetime.datetime(int(match[1]), int(match[2]), 1, tzinfo=datetime.timezone.utc)
+        if add_months(month, 1) <= start or (end is not None and month >= end):
+            continue
+        batch = []
+        with gzip.open(path, "rt", newline="") as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            for row in reader:
+                values = _parse_archived_row(row)
+                if values[-1] < start or (end is not None and values[-1] >= end):
+                    continue
+                values[-1] = values[-1].astimezone(tz).replace(tzinfo=None)
+                batch.append(values)
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+
+if __name__ == "__main__":
+    from .migrations import connect
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "maintain"
+    conn = connect()
+    try:
+        if command == "maintain":
+            with conn.cursor() as cur:
+                last = ensure_partitions(cur)
+            conn.commit()
+            print(f"Partitions exist through {last:%Y-%m}.")
+        elif command == "archive":
+            archived = archive_expired(conn)
+            print(f"Archived {len(archived)} partition(s)." if archived else "Nothing to archive.")
+        elif command == "reclaim":
+            reclaimed = reclaim_partitions(conn)
+            print(f"Freed {sum(before - after for _, before, after in reclaimed) / 1024 ** 2:.1f}MB.")
+        elif command == "list":
+            with conn.cursor() as cur:
+                for month, name in list_partitions(cur):
+                    print(name)
+        else:
+            sys.exit(f"Unknown command: {command} (expected maintain, archive, reclaim or list)")
+    finally:
+        conn.close()
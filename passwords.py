@@ -0,0 +1,158 @@
+import base64
+import hashlib
+import hmac
+import os
+import threading
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from .native_threads import native_executor, run_cpu_bound
+
+# ------------------------------ #
+# Password Hashing               #
+# ------------------------------ #
+# Passwords are stored as "scrypt$<log2 n>$<r>$<p>$<salt>$<hash>" using the
+# standard library's scrypt, so no extra dependency is needed. Raising
+# PASSWORD_SCRYPT_LOG_N makes every hash slower and stronger; stored hashes
+# with other parameters (and plaintext passwords from before hashing) are
+# rewritten the next time their owner logs in.
+#
+# The KDF runs in a small per-worker thread pool (scrypt releases the GIL)
+# with a bounded queue. Under a burst of logins the extra ones are turned
+# away with PasswordPoolBusy instead of tying up every request thread.
+
+SCRYPT_LOG_N = int(os.getenv("PASSWORD_SCRYPT_LOG_N", 14))
+SCRYPT_R = int(os.getenv("PASSWORD_SCRYPT_R", 8))
+SCRYPT_P = int(os.getenv("PASSWORD_SCRYPT_P", 1))
+HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", 16))
+HASH_TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", 5))
+# Bulk imports hash on a pool of their own, one thread per core by default
+IMPORT_HASH_WORKERS = int(os.getenv("PASSWORD_IMPORT_WORKERS", os.cpu_count() or 1))
+
+_PREFIX = "scrypt"
+_SALT_BYTES = 16
+_KEY_BYTES = 32
+
+
+class PasswordPoolBusy(Exception):
+    """ More password checks are queued than PASSWORD_HASH_QUEUE allows """
+
+
+def _b64(data):
+    return base64.b64encode(data).decode().rstrip("=")
+
+
+def _unb64(text):
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+
+def _scrypt(password, salt, log_n, r, p):
+    n = 1 << log_n
+    # OpenSSL's default memory cap (32 MiB) is too small for larger n
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                          maxmem=2 * 128 * r * n + 1024 * 1024, dklen=_KEY_BYTES)
+
+
+def hash_password(password):
+    salt = os.urandom(_SALT_BYTES)
+    key = _scrypt(password, salt, SCRYPT_LOG_N, SCRYPT_R, SCRYPT_P)
+    return f"{_PREFIX}${SCRYPT_LOG_N}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(key)}"
+
+
+def is_hashed(stored):
+    return stored.startswith(_PREFIX + "$")
+
+
+def needs_rehash(stored):
+    return not is_hashed(stored) or stored.split("$")[1:4] != [str(SCRYPT_LOG_N), str(SCRYPT_R), str(SCRYPT_P)]
+
+
+def verify_password(password, stored):
+    """ Constant-time check of `password` against a stored hash or legacy plaintext """
+    if not is_hashed(stored):
+        return hmac.compare_digest(password.encode(), stored.encode())
+    try:
+        _, log_n, r, p, salt, key = stored.split("$")
+        expected = _unb64(key)
+        actual = _scrypt(password, _unb64(salt), int(log_n), int(r), int(p))
+    except ValueError:
+        return False
+    return hmac.compare_digest(actual, expected)
+
+
+# ------------------------------ #
+# Bounded Verification Pool      #
+# ------------------------------ #
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(HASH_WORKERS + HASH_QUEUE)
+
+
+def _get_executor():
+    # Threads do not survive a fork, so each gunicorn worker builds its own pool
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = native_executor(HASH_WORKERS, "password-hash")
+            _executor_pid = os.getpid()
+    return _executor
+
+
+def _run_bounded(fn, *args):
+    if not _slots.acquire(blocking=False):
+        raise PasswordPoolBusy()
+    try:
+        future = _get_executor().submit(fn, *args)
+    except Exception:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    try:
+        return future.result(timeout=HASH_TIMEOUT)
+    except FutureTimeout:
+        raise PasswordPoolBusy()
+
+
+def check_password(password, stored):
+    """
+    Verify in the hashing pool. Returns (ok, new_hash) where new_hash is set
+    when the stored value should be replaced with a hash at current cost.
+    Raises PasswordPoolBusy when the pool is saturated.
+    """
+    def work():
+        ok = verify_password(password, stored)
+        return ok, hash_password(password) if ok and needs_rehash(stored) else None
+    return _run_bounded(work)
+
+
+def hash_password_bounded(password):
+    """ hash_password in the hashing pool, for account creation routes """
+    return _run_bounded(hash_password, password)
+
+
+def is_well_formed_hash(stored):
+    return is_hashed(stored) and len(stored.split("$")) == 6
+
+
+def hash_passwords(passwords, workers=IMPORT_HASH_WORKERS):
+    """
+    Hash many passwords at once, for bulk imports. Runs outside the bounded
+    login pool so an import does not turn logins away. Values that are
+    already hashes (see is_well_formed_hash) are stored as given.
+    """
+    def work(password):
+        return password if is_well_formed_hash(password) else hash_password(password)
+    with native_executor(max(1, workers), "password-import") as pool:
+        return list(pool.map(work, passwords))
+
+
+_dummy_hash = None
+
+
+def dummy_hash():
+    """ A valid hash to verify against for unknown users, so timing does not reveal which names exist """
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = run_cpu_bound(hash_password, _b64(os.urandom(_SALT_BYTES)))
+    return _dummy_hash
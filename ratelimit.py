@@ -0,0 +1,130 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+# ------------------------------ #
+# Login Throttling               #
+# ------------------------------ #
+# Checked before any DB query or password hashing, so a credential-stuffing
+# burst costs a dict lookup per attempt. Two limits apply:
+#   - per client IP, every attempt counts (LOGIN_IP_MAX_ATTEMPTS per
+#     LOGIN_IP_WINDOW seconds), which stops one host spraying many names;
+#   - per username, failed attempts count (LOGIN_USER_MAX_FAILURES per
+#     LOGIN_USER_WINDOW seconds); reaching it locks the name for
+#     LOGIN_LOCKOUT_SECONDS, which stops many hosts guessing one password.
+# A successful login clears the username's failures. State is per worker
+# process; with N workers an attacker gets at most N times the budget.
+
+LOGIN_IP_MAX_ATTEMPTS = int(os.getenv("LOGIN_IP_MAX_ATTEMPTS", 30))
+LOGIN_IP_WINDOW = float(os.getenv("LOGIN_IP_WINDOW", 60))
+LOGIN_USER_MAX_FAILURES = int(os.getenv("LOGIN_USER_MAX_FAILURES", 5))
+LOGIN_USER_WINDOW = float(os.getenv("LOGIN_USER_WINDOW", 300))
+LOGIN_LOCKOUT_SECONDS = float(os.getenv("LOGIN_LOCKOUT_SECONDS", 900))
+LOGIN_THROTTLE_ENABLED = os.getenv("LOGIN_THROTTLE_ENABLED", "1") == "1"
+
+# Upper bound on tracked keys so a spray of random names cannot grow memory
+LOGIN_THROTTLE_MAX_KEYS = int(os.getenv("LOGIN_THROTTLE_MAX_KEYS", 100000))
+
+
+class SlidingWindowLimiter:
+    """
+    Per-key sliding window: at most `limit` hits within `window` seconds. A
+    key that reaches the limit stays blocked for `lockout` seconds (or, with
+    no lockout, until its oldest hit leaves the window).
+    """
+
+    def __init__(self, limit, window, lockout=0.0, maxkeys=LOGIN_THROTTLE_MAX_KEYS):
+        self.limit = limit
+        self.window = window
+        self.lockout = lockout
+        self.maxkeys = maxkeys
+        self._lock = threading.Lock()
+        self._hits = OrderedDict()    # key -> deque of monotonic timestamps
+        self._locked = {}             # key -> monotonic time the lockout ends
+
+    def _trim(self, key, now):
+        hits = self._hits.get(key)
+        if hits is None:
+            return None
+        while hits and hits[0] <= now - self.window:
+            hits.popleft()
+        if not hits:
+            del self._hits[key]
+            return None
+        return hits
+
+    def retry_after(self, key, now=None):
+        """ Seconds until `key` may try again, or 0 when it is not blocked """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            until = self._locked.get(key)
+            if until is not None:
+                if until > now:
+                    return until - now
+                del self._locked[key]
+            hits = self._trim(key, now)
+            if hits is not None and len(hits) >= self.limit:
+                return hits[0] + self.window - now
+        return 0.0
+
+    def hit(self, key, now=None):
+        """ Record a hit; starts the lockout when it reaches the limit """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            hits = self._trim(key, now)
+            if hits is None:
+                hits = self._hits[key] = deque()
+                if len(self._hits) > self.maxkeys:
+                    self._hits.popitem(last=False)
+            else:
+                self._hits.move_to_end(key)
+            hits.append(now)
+            if len(hits) >= self.limit and self.lockout:
+                self._locked[key] = now + self.lockout
+                if len(self._locked) > self.maxkeys:
+                    self._locked = {k: t for k, t in self._locked.items() if t > now}
+
+    def reset(self, key):
+        with self._lock:
+            self._hits.pop(key, None)
+            self._locked.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {"tracked": len(self._hits), "locked": len(self._locked)}
+
+
+class LoginThrottle:
+    def __init__(self, enabled=LOGIN_THROTTLE_ENABLED):
+        self.enabled = enabled
+        self.by_ip = SlidingWindowLimiter(LOGIN_IP_MAX_ATTEMPTS, LOGIN_IP_WINDOW)
+        self.by_user = SlidingWindowLimiter(LOGIN_USER_MAX_FAILURES, LOGIN_USER_WINDOW, LOGIN_LOCKOUT_SECONDS)
+
+    def check(self, kind, username, ip):
+        """
+        Count an attempt and return seconds to wait, or 0 when it may go
+        ahead. Blocked attempts are not counted again for the username, so a
+        lockout is not extended by the attacker hammering it.
+        """
+        if not self.enabled:
+            return 0.0
+        wait = max(self.by_ip.retry_after(ip), self.by_user.retry_after((kind, username)))
+        if wait:
+            return wait
+        self.by_ip.hit(ip)
+        return 0.0
+
+    def failed(self, kind, username):
+        if self.enabled:
+            self.by_user.hit((kind, username))
+
+    def succeeded(self, kind, username):
+        if self.enabled:
+            self.by_user.reset((kind, username))
+
+    def stats(self):
+        return {"enabled": self.enabled, "ip": self.by_ip.stats(), "user": self.by_user.stats()}
+
+
+login_throttle = LoginThrottle()
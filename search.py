@@ -0,0 +1,121 @@
+import base64
+import html
+import json
+
+from psycopg2 import sql
+
+from .pagination import QueryError, parse_limit, report_filters
+
+# ------------------------------ #
+# Full-text Search               #
+# ------------------------------ #
+# reports.search_vector is a stored generated column over the three free-text
+# fields (complaints and maintenance weigh more than general comments) with a
+# GIN index, so matching never touches rows that cannot match. Both are
+# created in migrations.py.
+
+SEARCH_CONFIG = "english"
+
+SEARCH_FIELDS = ("general_comments", "maintenance_required", "complaints")
+RESULT_COLUMNS = ("id", "teacher_name", "subordinate_teacher_name", "hostel_name", "created_at")
+# Highlights are returned as HTML. The report text is user input, so
+# ts_headline marks matches with control characters (stripped from the text
+# first); the fragment is then HTML-escaped and only the markers become
+# <mark> tags.
+HIGHLIGHT_START, HIGHLIGHT_STOP = "\x02", "\x03"
+HEADLINE_OPTIONS = f"StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_STOP}, MaxFragments=2, MaxWords=20, MinWords=5"
+
+
+def encode_search_cursor(rank, row_id):
+    raw = json.dumps({"r": rank, "i": row_id}).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_search_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return float(data["r"]), int(data["i"])
+    except (ValueError, KeyError, TypeError):
+        raise QueryError("Invalid cursor")
+
+
+def build_search_query(args):
+    """
+    Ranked search with ts_headline highlights. Ranks and keyset-paginates in
+    an inner query and only builds headlines for the rows of the page.
+    Returns (query, params, limit).
+    """
+    q = (args.get("q") or "").strip()
+    if not q:
+        raise QueryError("q is required")
+    limit = parse_limit(args.get("limit"), default=20, maximum=100)
+    clauses, params = report_filters(args)
+
+    after = sql.SQL("")
+    after_params = []
+    if args.get("cursor"):
+        rank, row_id = decode_search_cursor(args["cursor"])
+        # ts_rank returns real; compare in real so the cursor value round-trips exactly
+        after = sql.SQL(" WHERE (rank, id) < (%s::real, %s)")
+        after_params = [rank, row_id]
+
+    filters = sql.SQL("").join(sql.SQL(" AND ") + clause for clause in clauses)
+    # created_at is carried through so the final join is a primary key
+    # lookup in one partition rather than a probe of every month
+    query = sql.SQL("""
+        WITH query AS (SELECT websearch_to_tsquery({config}, %s) AS tsq),
+        ranked AS (
+            SELECT r.id, r.created_at, ts_rank(r.search_vector, query.tsq) AS rank
+            FROM reports r, query
+            WHERE r.search_vector @@ query.tsq{filters}
+        ),
+        page AS (
+            SELECT id, created_at, rank FROM ranked{after}
+            ORDER BY rank DESC, id DESC
+            LIMIT %s
+        )
+        SELECT {columns}, page.rank, {headlines}
+        FROM page JOIN report_rows r ON r.id = page.id AND r.created_at = page.created_at, query
+        ORDER BY page.rank DESC, page.id DESC
+    """).format(
+        config=sql.Literal(SEARCH_CONFIG),
+        filters=filters,
+        after=after,
+        columns=sql.SQL(", ").join(sql.SQL("r.") + sql.Identifier(c) for c in RESULT_COLUMNS),
+        headlines=sql.SQL(", ").join(
+            sql.SQL("ts_headline({config}, translate(coalesce(r.{field}, ''), {markers}, ''), query.tsq, {options}) AS {alias}").format(
+                config=sql.Literal(SEARCH_CONFIG),
+                field=sql.Identifier(field),
+                markers=sql.Literal(HIGHLIGHT_START + HIGHLIGHT_STOP),
+                options=sql.Literal(HEADLINE_OPTIONS),
+                alias=sql.Identifier(f"{field}_headline"),
+            )
+            for field in SEARCH_FIELDS
+        ),
+    )
+    return query, [q] + params + after_params + [limit + 1], limit
+
+
+def render_highlight(headline):
+    """ HTML for a ts_headline fragment: the text escaped, matches wrapped in <mark> """
+    return (html.escape(headline, quote=True)
+            .replace(HIGHLIGHT_START, "<mark>").replace(HIGHLIGHT_STOP, "</mark>"))
+
+
+def shape_search_results(rows, limit):
+    """ Trim the look-ahead row, group headlines and build the next cursor """
+    has_more = len(rows) > limit
+    items = []
+    for row in rows[:limit]:
+        highlights = {}
+        for field in SEARCH_FIELDS:
+            headline = row.pop(f"{field}_headline")
+            if HIGHLIGHT_START in headline:
+                highlights[field] = render_highlight(headline)
+        row["highlights"] = highlights
+        items.append(row)
+    next_cursor = None
+    if has_more and items:
+        next_cursor = encode_search_cursor(items[-1]["rank"], items[-1]["id"])
+    return items, next_cursor
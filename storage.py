@@ -0,0 +1,372 @@
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+import uuid
+from io import BytesIO
+
+# ------------------------------ #
+# Google Drive API Configuration #
+# ------------------------------ #
+# The Google client libraries take a large share of the app's import time,
+# so they are imported, and the Drive client built, on the first upload.
+# The client is built from the discovery document bundled with
+# google-api-python-client, never fetched over the network. It is cached per
+# thread (httplib2 is not thread-safe) and rebuilt after a fork.
+SCOPES = ['https://www.googleapis.com/auth/drive']
+SERVICE_ACCOUNT_FILE = os.getenv("GOOGLE_CREDENTIALS", "hostelmanagement-455018-5e40c6a6113c.json")
+UPLOAD_FOLDER_ID = os.getenv("UPLOAD_FOLDER_ID", "1-bPtMwp6rPE3D2yqmk5qnq8Ytvl_O07A")
+
+_creds = None
+_creds_pid = None
+_creds_lock = threading.Lock()
+_local = threading.local()
+
+
+def load_credentials():
+    """ Service account credentials from the environment or a local file; raises when unavailable """
+    from google.oauth2 import service_account
+
+    # Support loading Google service account credentials from an environment variable
+    # (recommended for hosted environments like Render). If `GOOGLE_DRIVE_CREDENTIALS_JSON`
+    # is set, it should contain the full JSON contents of the service account file.
+    ga_json = os.getenv("GOOGLE_DRIVE_CREDENTIALS_JSON")
+    if ga_json:
+        ga_json_str = ga_json.strip()
+        # If the env var contains JSON text, parse it. If it contains a filename
+        # (for example someone placed the filename, possibly wrapped in braces
+        # like "{hostelmanagement-...json}"), load from that file. Otherwise
+        # raise a helpful error.
+        if ga_json_str.startswith("{") and '"' in ga_json_str:
+            # Likely actual JSON (contains double quotes)
+            try:
+                info = json.loads(ga_json_str)
+                return service_account.Credentials.from_service_account_info(info, scopes=SCOPES)
+            except Exception as e:
+                raise RuntimeError("Failed to parse GOOGLE_DRIVE_CREDENTIALS_JSON: {}".format(e))
+        # Treat value as a filename (strip surrounding braces or quotes if present)
+        candidate = ga_json_str.strip().strip('{}').strip('"').strip("'")
+        if os.path.isfile(candidate):
+            return service_account.Credentials.from_service_account_file(candidate, scopes=SCOPES)
+        raise RuntimeError(
+            "GOOGLE_DRIVE_CREDENTIALS_JSON is set but is not valid JSON nor a path to a file: '{}'".format(ga_json_str)
+        )
+    # Fall back to loading from a file path (useful for local development only)
+    return service_account.Credentials.from_service_account_file(SERVICE_ACCOUNT_FILE, scopes=SCOPES)
+
+
+def get_credentials():
+    """ Credentials loaded once per process, or None (with a warning) when they cannot be """
+    global _creds, _creds_pid
+    with _creds_lock:
+        if _creds_pid != os.getpid():
+            _creds_pid = os.getpid()
+            try:
+                _creds = load_credentials()
+            except Exception as e:
+                print(f"WARNING: Failed to initialize Google Drive service due to credential error: {e}")
+                _creds = None
+        return _creds
+
+
+def get_drive_service():
+    """ Drive v3 client for this thread, or None when there are no credentials """
+    if getattr(_local, "pid", None) != os.getpid():
+        creds = get_credentials()
+        if creds is None:
+            return None
+        from googleapiclient.discovery import build
+        _local.service = build('drive', 'v3', credentials=creds, static_discovery=True, cache_discovery=False)
+        _local.pid = os.getpid()
+    return _local.service
+
+
+def download_drive_file(file_id):
+    """ Bytes of a Drive file, for moving images off Drive """
+    from googleapiclient.http import MediaIoBaseDownload
+
+    service = get_drive_service()
+    if service is None:
+        raise RuntimeError("Google Drive credentials are not configured")
+    buffer = BytesIO()
+    downloader = MediaIoBaseDownload(buffer, service.files().get_media(fileId=file_id))
+    done = False
+    while not done:
+        _, done = downloader.next_chunk()
+    return buffer.getvalue()
+
+
+# ------------------------------ #
+# Storage Backends               #
+# ------------------------------ #
+class StorageBackend:
+    """ Where report images end up. `upload` returns the public URL of the stored file. """
+
+    name = "base"
+
+    def available(self):
+        return True
+
+    def upload(self, data, filename, mimetype):
+        raise NotImplementedError
+
+
+class DriveStorage(StorageBackend):
+    """ Google Drive folder `UPLOAD_FOLDER_ID`, served through drive.google.com/uc links """
+
+    name = "drive"
+
+    def __init__(self, folder_id=UPLOAD_FOLDER_ID):
+        self.folder_id = folder_id
+
+    def available(self):
+        return get_credentials() is not None
+
+    def upload(self, data, filename, mimetype):
+        from googleapiclient.http import MediaIoBaseUpload
+
+        service = get_drive_service()
+        if service is None:
+            raise RuntimeError("Google Drive credentials are not configured")
+        file_metadata = {'name': filename, 'parents': [self.folder_id]}
+        media = MediaIoBaseUpload(BytesIO(data), mimetype=mimetype, resumable=True)
+        uploaded_file = service.files().create(body=file_metadata, media_body=media, fields='id').execute()
+        return f"https://drive.google.com/uc?id={uploaded_file.get('id')}"
+
+
+class LocalStorage(StorageBackend):
+    """ Files in a local directory; a stand-in for Drive in development and tests """
+
+    name = "local"
+
+    def __init__(self, directory, base_url="/uploads"):
+        self.directory = directory
+        self.base_url = base_url.rstrip("/")
+        os.makedirs(directory, exist_ok=True)
+
+    def upload(self, data, filename, mimetype):
+        stored_name = f"{uuid.uuid4().hex}_{os.path.basename(filename or 'image')}"
+        with open(os.path.join(self.directory, stored_name), "wb") as f:
+            f.write(data)
+        return f"{self.base_url}/{stored_name}"
+
+
+# ------------------------------ #
+# Content-Addressed Storage      #
+# ------------------------------ #
+# IMAGE_STORAGE=cas stores every image once, named by the SHA-256 of its
+# bytes, in a blob store: an S3-compatible bucket when IMAGE_S3_BUCKET is
+# set, otherwise the directory IMAGE_STORAGE_DIR. The same photo uploaded
+# again (a retried submission) maps to the same name and is not written
+# twice. The app serves the files itself at /images/<sha256>; a name always
+# refers to the same bytes, so responses are cacheable forever.
+IMAGE_BASE_URL = os.getenv("IMAGE_BASE_URL", "/images").rstrip("/")
+IMAGE_KEY_RE = re.compile(r"^[0-9a-f]{64}$")
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# Formats images are stored in; anything else is served as a download.
+# The type a client declares is never trusted: an HTML file uploaded as
+# text/html would otherwise be served as a page from the API's origin.
+_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF8", "image/gif"),
+)
+IMAGE_MIMETYPES = frozenset([mimetype for _, mimetype in _SIGNATURES] + ["image/webp"])
+SNIFF_BYTES = 16
+
+
+def sniff_mimetype(head):
+    """ Content type from the first SNIFF_BYTES bytes of a file; application/octet-stream unless an image """
+    for signature, mimetype in _SIGNATURES:
+        if head.startswith(signature):
+            return mimetype
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+
+class LocalBlobStore:
+    """ Blobs as files under `directory`, fanned out by the first two hex digits """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def put(self, key, data, mimetype):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written aside and renamed, so a reader never sees half a file
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def stat(self, key):
+        """ (size, content type), or None when the blob does not exist """
+        try:
+            with open(self.path(key), "rb") as f:
+                return os.fstat(f.fileno()).st_size, sniff_mimetype(f.read(SNIFF_BYTES))
+        except FileNotFoundError:
+            return None
+
+    def open(self, key):
+        return open(self.path(key), "rb")
+
+
+class S3ObjectReader(io.RawIOBase):
+    """
+    Seekable read-only file over an S3 object. Reads are ranged GETs of at
+    least `read_ahead` bytes, so serving a Range request only fetches about
+    the requested part.
+    """
+
+    def __init__(self, client, bucket, key, size, read_ahead=1024 * 1024):
+        self.client, self.bucket, self.key, self.size = client, bucket, key, size
+        self.read_ahead = read_ahead
+        self.position = 0
+        self._buffer, self._buffer_start = b"", 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.position, io.SEEK_END: self.size}[whence]
+        self.position = max(0, base + offset)
+        return self.position
+
+    def readinto(self, target):
+        if self.position >= self.size:
+            return 0
+        offset = self.position - self._buffer_start
+        if not 0 <= offset < len(self._buffer):
+            end = min(self.size, self.position + max(len(target), self.read_ahead)) - 1
+            response = self.client.get_object(Bucket=self.bucket, Key=self.key, Range=f"bytes={self.position}-{end}")
+            self._buffer, self._buffer_start, offset = response["Body"].read(), self.position, 0
+        chunk = self._buffer[offset:offset + len(target)]
+        target[:len(chunk)] = chunk
+        self.position += len(chunk)
+        return len(chunk)
+
+
+class S3BlobStore:
+    """
+    Blobs in an S3-compatible bucket. boto3 is only imported when this
+    store is used; IMAGE_S3_ENDPOINT points it at MinIO, R2 and the like.
+    """
+
+    def __init__(self, bucket, prefix="images/", endpoint_url=None, region=None):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.endpoint_url = endpoint_url
+        self.region = region
+        self._client = None
+        self._client_pid = None
+        self._lock = threading.Lock()
+
+    def client(self):
+        # boto3 clients are thread-safe but must not cross a fork
+        with self._lock:
+            if self._client_pid != os.getpid():
+                import boto3
+                self._client = boto3.client("s3", endpoint_url=self.endpoint_url, region_name=self.region)
+                self._client_pid = os.getpid()
+            return self._client
+
+    def _head(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            return self.client().head_object(Bucket=self.bucket, Key=self.prefix + key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    def exists(self, key):
+        return self._head(key) is not None
+
+    def put(self, key, data, mimetype):
+        self.client().put_object(Bucket=self.bucket, Key=self.prefix + key, Body=data, ContentType=mimetype,
+                                 CacheControl=f"public, max-age={IMMUTABLE_MAX_AGE}, immutable")
+
+    def stat(self, key):
+        head = self._head(key)
+        if head is None:
+            return None
+        # Set from sniff_mimetype on upload, but the bucket may hold objects written by other means
+        mimetype = head.get("ContentType")
+        return head["ContentLength"], mimetype if mimetype in IMAGE_MIMETYPES else "application/octet-stream"
+
+    def open(self, key):
+        size, _ = self.stat(key)
+        return io.BufferedReader(S3ObjectReader(self.client(), self.bucket, self.prefix + key, size))
+
+
+class ContentAddressedStorage(StorageBackend):
+    """ Images named by their SHA-256 in a blob store, served at IMAGE_BASE_URL/<sha256> """
+
+    name = "cas"
+
+    def __init__(self, blobs, base_url=IMAGE_BASE_URL):
+        self.blobs = blobs
+        self.base_url = base_url
+
+    def upload(self, data, filename, mimetype):
+        key = hashlib.sha256(data).hexdigest()
+        # Racing uploads of the same bytes write the same content; harmless
+        if not self.blobs.exists(key):
+            self.blobs.put(key, data, sniff_mimetype(data[:SNIFF_BYTES]))
+        return f"{self.base_url}/{key}"
+
+
+_blob_store = None
+
+
+def get_blob_store():
+    """ The blob store behind /images: IMAGE_S3_BUCKET when set, else IMAGE_STORAGE_DIR """
+    global _blob_store
+    if _blob_store is None:
+        bucket = os.getenv("IMAGE_S3_BUCKET")
+        if bucket:
+            _blob_store = S3BlobStore(bucket, prefix=os.getenv("IMAGE_S3_PREFIX", "images/"),
+                                      endpoint_url=os.getenv("IMAGE_S3_ENDPOINT") or None,
+                                      region=os.getenv("IMAGE_S3_REGION") or None)
+        else:
+            _blob_store = LocalBlobStore(os.getenv("IMAGE_STORAGE_DIR", "uploads"))
+    return _blob_store
+
+
+_storage = None
+
+
+def get_storage():
+    """ Backend selected by IMAGE_STORAGE (drive, the default, local or cas) """
+    global _storage
+    if _storage is None:
+        backend = os.getenv("IMAGE_STORAGE", "drive")
+        if backend == "local":
+            _storage = LocalStorage(os.getenv("IMAGE_STORAGE_DIR", "uploads"))
+        elif backend == "cas":
+            _storage = ContentAddressedStorage(get_blob_store())
+        else:
+            _storage = DriveStorage()
+    return _storage
+
+
+def set_storage(backend):
+    """ Swap the storage backend, e.g. for a fake in tests """
+    global _storage
+    _storage = backend
@@ -0,0 +1,105 @@
+import os
+
+from psycopg2.extras import execute_values
+
+from .summary import record_reports
+
+# ------------------------------ #
+# Report Submissions             #
+# ------------------------------ #
+# Shared by /submit-form and /submit-forms/batch. Client field names are the
+# camelCase ones the frontend posts; values map onto report_rows columns.
+# The names are resolved to teacher/hostel ids (dimensions.resolve_report_names)
+# before the reports are inserted.
+
+REPORT_FIELDS = {
+    "teacherName": "teacher_name",
+    "subordinateTeacherName": "subordinate_teacher_name",
+    "hostelName": "hostel_name",
+    "generalComments": "general_comments",
+    "maintenanceRequired": "maintenance_required",
+    "complaints": "complaints",
+}
+REQUIRED_FIELDS = ("teacherName", "subordinateTeacherName", "hostelName")
+
+BATCH_SUBMIT_MAX = int(os.getenv("BATCH_SUBMIT_MAX", 100))
+IDEMPOTENCY_KEY_MAX = 255
+
+
+def validate_report(data):
+    """ Return (column values, None) or (None, error message) for one submitted report """
+    if not hasattr(data, "get"):
+        return None, "Entry must be an object"
+    values = {}
+    for field, column in REPORT_FIELDS.items():
+        value = data.get(field)
+        if value is not None and not isinstance(value, str):
+            return None, f"{field} must be a string"
+        values[column] = value
+    if not all(data.get(field) for field in REQUIRED_FIELDS):
+        return None, "Missing form fields"
+
+    key = data.get("idempotencyKey")
+    if key is not None and (not isinstance(key, str) or not 0 < len(key) <= IDEMPOTENCY_KEY_MAX):
+        return None, f"idempotencyKey must be a string of 1-{IDEMPOTENCY_KEY_MAX} characters"
+    values["idempotency_key"] = key
+    return values, None
+
+
+INSERT_COLUMNS = (
+    "id", "teacher_id", "subordinate_teacher_id", "hostel_id", "general_comments",
+    "maintenance_required", "complaints", "image_status",
+)
+
+
+def insert_reports(cur, reports):
+    """
+    Insert many validated reports in one statement. Each item is a dict of
+    column values (see validate_report) plus `image_status` and the ids
+    from resolve_report_names.
+
+    Ids are drawn from the sequence up front so every input maps to its row
+    without relying on RETURNING order. Idempotency keys are claimed in
+    report_idempotency_keys first; reports whose key is already taken are
+    not inserted. Returns one (id, created) pair per input, where id is the
+    existing report's id for skipped duplicates.
+    """
+    if not reports:
+        return []
+    cur.execute(
+        "SELECT nextval(pg_get_serial_sequence('reports', 'id')) FROM generate_series(1, %s)",
+        (len(reports),),
+    )
+    ids = [row[0] for row in cur.fetchall()]
+
+    keyed = [(r["idempotency_key"], i) for i, r in zip(ids, reports) if r.get("idempotency_key") is not None]
+    existing = {}
+    if keyed:
+        claimed = {row[0] for row in execute_values(cur, """
+            INSERT INTO report_idempotency_keys (idempotency_key, report_id) VALUES %s
+            ON CONFLICT (idempotency_key) DO NOTHING
+            RETURNING report_id
+        """, keyed, fetch=True)}
+        skipped_keys = [key for key, report_id in keyed if report_id not in claimed]
+        if skipped_keys:
+            cur.execute("SELECT idempotency_key, report_id FROM report_idempotency_keys WHERE idempotency_key = ANY(%s)",
+                        (skipped_keys,))
+            existing = dict(cur.fetchall())
+
+    rows = [
+        (report_id,) + tuple(report.get(column) for column in INSERT_COLUMNS[1:])
+        for report_id, report in zip(ids, reports)
+        if report.get("idempotency_key") not in existing
+    ]
+    inserted = execute_values(cur, """
+        INSERT INTO reports (id, teacher_id, subordinate_teacher_id, hostel_id, general_comments,
+            maintenance_required, complaints, image_status)
+        VALUES %s
+        RETURNING id, created_at, hostel_id, teacher_id, maintenance_required, complaints
+    """, rows, fetch=True) if rows else []
+    record_reports(cur, [row[1:] for row in inserted])
+
+    return [
+        (existing[report["idempotency_key"]], False) if report.get("idempotency_key") in existing else (report_id, True)
+        for report_id, report in zip(ids, reports)
+    ]
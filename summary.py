@@ -0,0 +1,149 @@
+import datetime
+
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+
+from .dimensions import name_filter
+from .pagination import QueryError, parse_date_bound
+
+# ------------------------------ #
+# Report rollup                  #
+# ------------------------------ #
+# `report_summary` keeps one row per (UTC day, hostel_id, teacher_id) with
+# running counts. The routes that insert or delete reports adjust it in the same
+# transaction, so /reports/summary never has to scan `reports`.
+
+REBUILD_SUMMARY = """
+    INSERT INTO report_summary (day, hostel_id, teacher_id,
+        report_count, maintenance_count, complaints_count)
+    SELECT (created_at AT TIME ZONE 'UTC')::date, hostel_id, teacher_id,
+        COUNT(*),
+        COUNT(*) FILTER (WHERE NULLIF(btrim(maintenance_required), '') IS NOT NULL),
+        COUNT(*) FILTER (WHERE NULLIF(btrim(complaints), '') IS NOT NULL)
+    FROM reports
+    GROUP BY 1, 2, 3;
+"""
+
+SUMMARY_PERIODS = ("day", "week", "month", "year")
+
+
+def _has_text(value):
+    return bool(value and value.strip())
+
+
+def _summary_deltas(rows, sign):
+    """
+    Collapse report rows into per-bucket count deltas.
+    Each row is (created_at, hostel_id, teacher_id, maintenance_required, complaints).
+    """
+    deltas = {}
+    for created_at, hostel_id, teacher_id, maintenance_required, complaints in rows:
+        key = (created_at.astimezone(datetime.timezone.utc).date(), hostel_id, teacher_id)
+        count, maintenance, complaint = deltas.get(key, (0, 0, 0))
+        deltas[key] = (
+            count + sign,
+            maintenance + sign * _has_text(maintenance_required),
+            complaint + sign * _has_text(complaints),
+        )
+    return [key + value for key, value in deltas.items()]
+
+
+def record_reports(cur, rows):
+    """ Add newly inserted reports to the rollup """
+    values = _summary_deltas(rows, 1)
+    if not values:
+        return
+    execute_values(cur, """
+        INSERT INTO report_summary (day, hostel_id, teacher_id,
+            report_count, maintenance_count, complaints_count)
+        VALUES %s
+        ON CONFLICT (day, hostel_id, teacher_id) DO UPDATE SET
+            report_count = report_summary.report_count + EXCLUDED.report_count,
+            maintenance_count = report_summary.maintenance_count + EXCLUDED.maintenance_count,
+            complaints_count = report_summary.complaints_count + EXCLUDED.complaints_count
+    """, values)
+
+
+def forget_reports(cur, rows):
+    """ Remove deleted reports from the rollup, dropping buckets that reach zero """
+    values = _summary_deltas(rows, -1)
+    if not values:
+        return
+    execute_values(cur, """
+        UPDATE report_summary AS s SET
+            report_count = s.report_count + d.report_count,
+            maintenance_count = s.maintenance_count + d.maintenance_count,
+            complaints_count = s.complaints_count + d.complaints_count
+        FROM (VALUES %s) AS d (day, hostel_id, teacher_id,
+            report_count, maintenance_count, complaints_count)
+        WHERE s.day = d.day AND s.hostel_id = d.hostel_id AND s.teacher_id = d.teacher_id
+    """, values, template="(%s::date, %s, %s, %s, %s, %s)")
+    cur.execute("DELETE FROM report_summary WHERE report_count <= 0")
+
+
+def forget_partition(cur, partition):
+    """ Remove every report in `partition` (a detached month of reports) from the rollup """
+    cur.execute(sql.SQL("""
+        UPDATE report_summary AS s SET
+            report_count = s.report_count - d.report_count,
+            maintenance_count = s.maintenance_count - d.maintenance_count,
+            complaints_count = s.complaints_count - d.complaints_count
+        FROM (
+            SELECT (created_at AT TIME ZONE 'UTC')::date AS day, hostel_id, teacher_id,
+                COUNT(*) AS report_count,
+                COUNT(*) FILTER (WHERE NULLIF(btrim(maintenance_required), '') IS NOT NULL) AS maintenance_count,
+                COUNT(*) FILTER (WHERE NULLIF(btrim(complaints), '') IS NOT NULL) AS complaints_count
+            FROM {}
+            GROUP BY 1, 2, 3
+        ) AS d
+        WHERE s.day = d.day AND s.hostel_id = d.hostel_id AND s.teacher_id = d.teacher_id
+    """).format(sql.Identifier(partition)))
+    cur.execute("DELETE FROM report_summary WHERE report_count <= 0")
+
+
+def rebuild_summary(cur):
+    """ Recompute the rollup from scratch """
+    cur.execute("LOCK TABLE report_summary IN ACCESS EXCLUSIVE MODE")
+    cur.execute("DELETE FROM report_summary")
+    cur.execute(REBUILD_SUMMARY)
+
+
+def build_summary_query(args):
+    """ Aggregate the daily rollup into the requested period buckets """
+    period = args.get("period", "week")
+    if period not in SUMMARY_PERIODS:
+        raise QueryError("period must be one of: " + ", ".join(SUMMARY_PERIODS))
+
+    clauses, params = [], []
+    for column in ("hostel_name", "teacher_name"):
+        if args.get(column):
+            clauses.append(name_filter(column))
+            params.append(args[column])
+    start = parse_date_bound(args.get("from"), "from")
+    if start:
+        clauses.append(sql.SQL("day >= %s"))
+        params.append(start.date())
+    end = parse_date_bound(args.get("to"), "to", end=True)
+    if end:
+        clauses.append(sql.SQL("day < %s"))
+        params.append(end.date())
+
+    where = sql.SQL(" WHERE ") + sql.SQL(" AND ").join(clauses) if clauses else sql.SQL("")
+    # Aggregates by id and only joins the names onto the grouped rows
+    query = sql.SQL("""
+        SELECT h.name AS hostel_name, t.name AS teacher_name, s.period_start,
+            s.reports, s.with_maintenance, s.with_complaints
+        FROM (
+            SELECT hostel_id, teacher_id,
+                date_trunc({period}, day)::date AS period_start,
+                SUM(report_count)::int AS reports,
+                SUM(maintenance_count)::int AS with_maintenance,
+                SUM(complaints_count)::int AS with_complaints
+            FROM report_summary{where}
+            GROUP BY 1, 2, 3
+        ) s
+        JOIN hostels h ON h.id = s.hostel_id
+        JOIN teachers t ON t.id = s.teacher_id
+        ORDER BY s.period_start DESC, hostel_name, teacher_name
+    """).format(period=sql.Literal(period), where=where)
+    return query, params
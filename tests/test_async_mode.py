@@ -0,0 +1,57 @@
+"""
+Routes under SERVE_MODE=async, where psycogreen installs a psycopg2 wait
+callback. psycopg2.extras.wait_select stands in for it: with any wait
+callback set, psycopg2 refuses COPY.
+"""
+import io
+import uuid
+
+import psycopg2.extensions
+import psycopg2.extras
+import pytest
+
+from Backend import analytics
+from Backend.app import app
+from Backend.auth_utils import generate_token
+from Backend.conditional import touch_tables
+from Backend.db_connection import get_connection
+
+
+@pytest.fixture
+def wait_callback():
+    psycopg2.extensions.set_wait_callback(psycopg2.extras.wait_select)
+    try:
+        yield
+    finally:
+        psycopg2.extensions.set_wait_callback(None)
+
+
+def test_import_teachers(wait_callback):
+    prefix = f"test-import-{uuid.uuid4().hex[:12]}"
+    sheet = "name,password\n" + "".join(f"{prefix}-{i},secret{i}\n" for i in range(3))
+    try:
+        response = app.test_client().post(
+            "/import-teachers",
+            headers={"Authorization": f"Bearer {generate_token('admin', 'Paul')}"},
+            data={"file": (io.BytesIO(sheet.encode()), "teachers.csv")},
+            content_type="multipart/form-data")
+        assert response.status_code == 200, response.get_json()
+        assert response.get_json()["created"] == 3
+    finally:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute("DELETE FROM teachers WHERE name LIKE %s", (prefix + "-%",))
+            conn.commit()
+        touch_tables("teachers")
+
+
+def test_analytics_cold_snapshot(wait_callback, tmp_path, monkeypatch):
+    # No Parquet file to start from, so the snapshot is built from the database
+    monkeypatch.setattr(analytics, "snapshot", analytics.ReportSnapshot(str(tmp_path / "reports.parquet")))
+    analytics.analytics_cache.invalidate()
+    response = app.test_client().get("/analytics/teachers")
+    assert response.status_code == 200, response.get_json()
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT COUNT(*) FROM reports")
+        total = cur.fetchone()[0]
+        conn.commit()
+    assert sum(item["visits"] for item in response.get_json()["items"]) == total
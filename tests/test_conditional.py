@@ -0,0 +1,43 @@
+import uuid
+
+from Backend.app import app
+from Backend.conditional import touch_tables
+from Backend.db_connection import get_connection
+
+from .conftest import run_elsewhere
+
+
+def _teacher_names(response):
+    return {teacher["name"] for teacher in response.get_json()}
+
+
+def test_write_in_another_process_revalidates_cached_list():
+    client = app.test_client()
+    first = client.get("/teachers")
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    # Served from this worker's cache from here on
+    assert client.get("/teachers", headers={"If-None-Match": etag}).status_code == 304
+
+    name = f"test-teacher-{uuid.uuid4().hex[:12]}"
+    run_elsewhere(f"""
+from Backend.conditional import touch_tables
+from Backend.db_connection import get_connection
+with get_connection() as conn, conn.cursor() as cur:
+    cur.execute("INSERT INTO teachers (name, password) VALUES (%s, 'x')", ({name!r},))
+    conn.commit()
+touch_tables("teachers")
+""")
+    try:
+        changed = client.get("/teachers", headers={"If-None-Match": etag})
+        assert changed.status_code == 200
+        assert changed.headers["ETag"] != etag
+        assert name in _teacher_names(changed)
+
+        again = client.get("/teachers", headers={"If-None-Match": changed.headers["ETag"]})
+        assert again.status_code == 304
+    finally:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute("DELETE FROM teachers WHERE name = %s", (name,))
+            conn.commit()
+        touch_tables("teachers")